@@ -13,6 +13,17 @@ from . import util
 from .edgetest import *
 from .edgelist import EdgeList
 from .edgestate import EdgeState
+from .registry import EdgeRegistry
 from .decisionmaker import DecisionMaker
 from .statefile import StateFile
+from .rotationlimit import RotationLimiter
+from .damping import FlapDamper
+from .changepoint import ChangePointFilter
+from .scoring import AverageScorer, CompositeScorer, HeadroomScorer
+from .selection import EdgeSelector
+from .profiling import CycleTimer, profile_call
+from .overhead import ProbeOverhead
+from . import filewatch
+from . import snapshot
+from .queryapi import QueryServer
 from .edgemanage import EdgeManage
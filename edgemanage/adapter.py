@@ -4,10 +4,13 @@ Non-commandline adapter, work with Django
 import logging
 import logging.handlers
 import os
+import time
 import yaml
 import uuid
 
 from edgemanage import util
+from edgemanage.edgestate import EdgeState
+from edgemanage.snapshot import edge_summary, load_snapshot, snapshot_max_age, snapshot_path
 from datetime import datetime
 
 
@@ -38,6 +41,29 @@ class EdgemanageAdapter(object):
         return os.path.exists(os.path.join(self.config["healthdata_store"],
                                            "%s.edgestore" % edgename))
 
+    def get_edges(self, dnet):
+        """
+        Summary of every edge of a dnet, as in its snapshot. Read from
+        the snapshot when it is recent, otherwise from the edge stores.
+        """
+        with open(os.path.join(self.config["edgelist_dir"], dnet)) as edge_f:
+            edge_list = [i.strip() for i in edge_f.read().split("\n")
+                         if i.strip() and not i.startswith("#")]
+
+        edges = {}
+        snapshot = load_snapshot(snapshot_path(self.config, dnet),
+                                 snapshot_max_age(self.config))
+        if snapshot:
+            edges = dict((edge, snapshot["edges"][edge]) for edge in edge_list
+                         if edge in snapshot["edges"])
+
+        now = time.time()
+        for edge in edge_list:
+            if edge not in edges and self.edge_data_exist(edge):
+                edge_state = EdgeState(edge, self.config["healthdata_store"], nowrite=True)
+                edges[edge] = edge_summary(edge_state, "edge", edge_state.state == "in", now)
+        return edges
+
     def log_edge_conf(self, edgename, mode, comment):
         """
         edge_conf logger wrap
@@ -0,0 +1,71 @@
+"""
+Online detection of sustained increases in edge fetch times
+"""
+
+from __future__ import absolute_import
+import logging
+import time
+
+from edgemanage import const
+
+
+def page_hinkley(detector, value, delta=const.CHANGE_DELTA,
+                 threshold=const.CHANGE_THRESHOLD):
+    """
+    Feed a fetch time into a Page-Hinkley test for an upward shift in
+    the mean, in constant time and space.
+
+    Returns True when the fetch times have risen by more than `delta`
+    for long enough that the accumulated excess is over `threshold`,
+    and starts the test afresh from `value`. No fetch adds more than
+    CHANGE_MAX_STEP to the excess, so a single spike can't trigger it.
+
+    Parameters
+    ----------
+    detector : dict
+        state of the test, updated in place. Empty to start a new test.
+    value : float
+        the newest fetch time
+    """
+    # The mean is taken over at most CHANGE_MEAN_WINDOW values so that
+    # it follows slow drift instead of being anchored to old history
+    count = min(detector.get("count", 0) + 1, const.CHANGE_MEAN_WINDOW)
+    mean = detector.get("mean", value)
+    mean += (value - mean) / count
+    # Cumulative deviation above the mean, less its running minimum
+    step = min(value - mean - delta, const.CHANGE_MAX_STEP)
+    score = max(0, detector.get("score", 0) + step)
+
+    if score > threshold:
+        detector.clear()
+        detector.update({"count": 1, "mean": value, "score": 0})
+        return True
+
+    detector.update({"count": count, "mean": mean, "score": score})
+    return False
+
+
+class ChangePointFilter(object):
+
+    """
+    Judgement filter for `DecisionMaker` that marks edges whose fetch
+    times have recently shifted upwards as "degrading" instead of
+    "pass_threshold", so that they are swapped out before they start
+    failing. The shift is detected by `EdgeState.add_value`.
+    """
+
+    def __init__(self, hold=const.CHANGE_HOLD):
+        # Seconds an edge stays degrading after a shift is detected
+        self.hold = hold
+
+    def judge(self, decision, edge_state, judgement, good_enough):
+        """ Revise the judgement that `decision` made for an edge """
+        if judgement != "pass_threshold" or not edge_state.degrading_since:
+            return judgement
+
+        degrading_for = time.time() - edge_state.degrading_since
+        if degrading_for < self.hold:
+            logging.debug("Edge %s has been degrading for %d seconds",
+                          edge_state.edgename, degrading_for)
+            return "degrading"
+        return judgement
@@ -8,10 +8,57 @@ CONFIG_PATH = "/etc/edgemanage/edgemanage.yaml"
 FETCH_TIMEOUT = 10
 # Times to retry fetching an object if failed
 FETCH_RETRY = 3
+# Base delay in seconds between fetch retries. Doubled on every retry
+# and jittered.
+FETCH_RETRY_BACKOFF = 0.5
+# Bytes of the test object read at a time, between checks of the fetch
+# deadline
+FETCH_CHUNK_SIZE = 16 * 1024
+
+# Fraction of samples dropped from each end before averaging when
+# aggregating several samples per edge with a trimmed mean
+SAMPLE_TRIM = 0.2
+
+# Seconds to wait for edges to accept a TCP connection when the TCP
+# pre-check is enabled
+TCP_PRECHECK_TIMEOUT = 2
+# Maximum number of connections the TCP pre-check has open at once
+TCP_PRECHECK_BATCH = 512
+# Threads resolving the names of edges for the TCP pre-check
+TCP_PRECHECK_RESOLVERS = 32
+
+# Number of seconds reserved at the end of a run for making a decision
+# and writing files when the cycle deadline is derived from
+# run_frequency.
+CYCLE_DEADLINE_MARGIN = 5
 
 # Number of objects to store in fetch histories
 FETCH_HISTORY = 2000
 
+# Weight of the newest fetch time in the exponentially weighted fetch
+# time kept for each edge
+EWMA_ALPHA = 0.2
+# Number of recent fetch outcomes kept per edge to work out its failure
+# rate
+OUTCOME_WINDOW = 30
+# Seconds added to the score of an edge by the composite scorer for a
+# failure rate of 1
+SCORE_FAILURE_PENALTY = FETCH_TIMEOUT
+
+# Page-Hinkley change-point detection on fetch times. Increases of
+# less than CHANGE_DELTA seconds over the mean are ignored, and a shift
+# is detected once the accumulated increase is over CHANGE_THRESHOLD
+# seconds. The mean is taken over the last CHANGE_MEAN_WINDOW fetches.
+CHANGE_DELTA = 0.05
+CHANGE_THRESHOLD = 1.0
+CHANGE_MEAN_WINDOW = 60
+# Most that a single fetch can add to the accumulated increase, so that
+# a shift takes more than CHANGE_THRESHOLD / CHANGE_MAX_STEP slow fetches
+# and one outlier, even a timeout, is never enough
+CHANGE_MAX_STEP = 5 * CHANGE_DELTA
+# Seconds an edge is judged degrading after a shift is detected
+CHANGE_HOLD = 900
+
 # Number of seconds that define a window within which to search for
 # fetch entries. Used in a case where we want to check the last $N
 # seconds worth of values fetched for a paritcular edge to give us a
@@ -26,6 +73,49 @@ NAGIOS_WARNING_TIME = 300
 # Number of historical rotations to keep in the state file.
 STATE_HISTORICAL_ROTATIONS = 100
 
+# Number of recent flaps (moves out of pass_threshold or into fail) to
+# keep per edge for flap damping
+FLAP_HISTORY = 20
+
+# Period in seconds over which dnschange_maxfreq rotations are allowed
+DNSCHANGE_PERIOD = 600
+
+# Seconds between checks that the probe processes are still alive, when
+# no results are arriving from them
+PROBE_PROCESS_CHECK_INTERVAL = 0.5
+
+# Buckets of the histogram of edge test fetch times, in seconds
+PROBE_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 2, 5, FETCH_TIMEOUT)
+
+# Seconds between the wake-ups of the thread that measures how late
+# threads are scheduled while edges are tested
+LAG_INTERVAL = 0.05
+# Number of tests of a local HTTP server mixed in with the edge tests to
+# measure the time edgemanage itself adds to fetch times. Off unless
+# loopback_probes is set.
+LOOPBACK_PROBES = 0
+
+# Seconds of fetch times kept for each edge in the snapshot of a dnet
+SNAPSHOT_WINDOW = 900
+# Seconds after which readers stop trusting a snapshot and read the
+# edge stores instead
+SNAPSHOT_MAX_AGE = 300
+
+# Permissions of the Unix socket of the query API
+QUERY_SOCKET_MODE = 0o660
+
+# Seconds between checks of the watched files by edge_query --watch
+# when inotify isn't available, and between checks for a fresh snapshot
+# while it watches the edge stores
+WATCH_POLL_INTERVAL = 2
+
+# Buckets of the histogram of the time taken by each phase of a run,
+# in seconds
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120)
+
+# Directory that --profile writes to if profile_dir isn't configured
+PROFILE_DIR = "/var/tmp/edgemanage"
+
 # Upper domain to use for looking up IP addresses of edges while
 # populating zone files
 UPPER_DOMAIN = "deflect.ca"
@@ -38,6 +128,12 @@ UPPER_DOMAIN = "deflect.ca"
 VALID_MODES = ["available", "force", "blindforce", "unavailable"]
 
 # Valid states that an edge will be put into after a result of a
-# decision being passed upon tests.
-VALID_HEALTHS = ["pass_threshold", "pass_window", "pass_average", "pass",
-                 "fail"]
+# decision being passed upon tests. "degrading" edges are under the
+# threshold but their fetch times have recently shifted upwards.
+VALID_HEALTHS = ["pass_threshold", "degrading", "pass_window", "pass_average",
+                 "pass", "fail"]
+
+# Healths of edges that can be chosen to be put in rotation, from most
+# to least preferred
+SELECTION_HEALTHS = ["pass_threshold", "degrading", "pass_window",
+                     "pass_average", "pass"]
@@ -0,0 +1,80 @@
+"""
+Flap damping for edge health judgements
+"""
+
+from __future__ import absolute_import
+import logging
+import time
+
+DEFAULT_DAMPING = {
+    # An edge out of rotation must be under goodenough * enter_factor
+    # to be judged pass_threshold
+    "enter_factor": 0.8,
+    # An edge in rotation stays pass_threshold until it is slower than
+    # goodenough * exit_factor
+    "exit_factor": 1.25,
+    # Seconds an edge must stay out of rotation before it can re-enter
+    "min_dwell": 300,
+    # Penalty added for every flap, halving every halflife seconds
+    "penalty": 1.0,
+    "halflife": 900,
+    # Edges out of rotation with a penalty at or above this can't be
+    # judged pass_threshold
+    "suppress": 2.0,
+}
+
+
+class FlapDamper(object):
+
+    """
+    Judgement filter for `DecisionMaker` that stops edges hovering around
+    goodenough from flipping in and out of rotation.
+
+    Edges in rotation are held to a looser threshold than edges waiting
+    to enter it, edges must stay out of rotation for a minimum time
+    before re-entering, and edges that flap often are held back by a
+    decaying penalty. Everything it relies on is kept in `EdgeState`.
+    """
+
+    def __init__(self, damping_config=None):
+        self.settings = dict(DEFAULT_DAMPING)
+        if damping_config:
+            self.settings.update(damping_config)
+
+    def penalty(self, edge_state, now=None):
+        """ Flap penalty of an edge, decayed from its recent flap times """
+        if now is None:
+            now = time.time()
+        return sum(self.settings["penalty"] *
+                   0.5 ** ((now - flap_time) / self.settings["halflife"])
+                   for flap_time in edge_state.flap_times)
+
+    def judge(self, decision, edge_state, judgement, good_enough):
+        """ Revise the judgement that `decision` made for an edge """
+        if judgement == "fail":
+            return judgement
+
+        last_value = edge_state.last_value()
+        if edge_state.state == "in":
+            if last_value < good_enough * self.settings["exit_factor"]:
+                return "pass_threshold"
+            return judgement
+
+        if judgement != "pass_threshold":
+            return judgement
+
+        now = time.time()
+        if last_value >= good_enough * self.settings["enter_factor"]:
+            logging.debug("Edge %s is not far enough under goodenough to enter rotation",
+                          edge_state.edgename)
+        elif (edge_state.rotation_exit_time and
+              now - edge_state.rotation_exit_time < self.settings["min_dwell"]):
+            logging.debug("Edge %s left rotation %d seconds ago, too recently to re-enter",
+                          edge_state.edgename, now - edge_state.rotation_exit_time)
+        elif self.penalty(edge_state, now) >= self.settings["suppress"]:
+            logging.debug("Edge %s has a flap penalty of %f, too high to enter rotation",
+                          edge_state.edgename, self.penalty(edge_state, now))
+        else:
+            return judgement
+
+        return decision.fallback_judgement(edge_state, good_enough)
@@ -5,6 +5,7 @@ Module for making judgement on whether a givin edge passed threshold
 from __future__ import absolute_import
 from . import const
 from edgemanage.monitor import Monitor
+from edgemanage.registry import EdgeRegistry
 
 import logging
 import time
@@ -19,12 +20,59 @@ class DecisionMaker(object):
     provide judgement after some `add_edge_state()` call
     """
 
-    def __init__(self):
+    def __init__(self, registry=None):
         self.edge_states = {}
         # A results dict with edge as key, string as value, one of
         # VALID_HEALTHS
         self.current_judgement = {}
+        # The judgements are indexed in a registry that may be shared
+        # with the rest of edgemanage
+        if registry is None:
+            registry = EdgeRegistry()
+        self.registry = registry
         self.edges_disabled = False
+        # Objects with a judge() method that may revise each judgement
+        # made by check_threshold, applied in order
+        self.filters = []
+
+    def add_filter(self, judgement_filter):
+        """
+        Add a filter that can change the judgements made by
+        `check_threshold`, such as `FlapDamper`
+        """
+        self.filters.append(judgement_filter)
+
+    def apply_filters(self, results_dict, good_enough):
+        """
+        Let every filter revise the current judgements, keeping
+        results_dict in step
+        """
+        for judgement_filter in self.filters:
+            for edgename, edge_state in six.iteritems(self.edge_states):
+                judgement = self.current_judgement[edgename]
+                new_judgement = judgement_filter.judge(self, edge_state, judgement, good_enough)
+                if new_judgement != judgement:
+                    logging.info("%s changed judgement of %s from %s to %s",
+                                 type(judgement_filter).__name__, edgename,
+                                 judgement, new_judgement)
+                    results_dict[judgement] -= 1
+                    results_dict[new_judgement] += 1
+                    self.set_judgement(edgename, new_judgement)
+        return results_dict
+
+    def fallback_judgement(self, edge_state, good_enough):
+        """
+        The judgement `check_threshold` would make for an edge if its
+        last fetch wasn't under the good_enough threshold
+        """
+        if edge_state.last_value() == const.FETCH_TIMEOUT:
+            return "fail"
+        time_slice = self.edge_state_slice(edge_state)
+        if time_slice and sum(time_slice.values()) / len(time_slice) < good_enough:
+            return "pass_window"
+        elif edge_state.current_average() < good_enough:
+            return "pass_average"
+        return "pass"
 
     def add_edge_state(self, edge_state):
         """
@@ -34,6 +82,12 @@ class DecisionMaker(object):
 
         self.edge_states[edge_state.edgename] = edge_state
         self.current_judgement[edge_state.edgename] = None
+        self.registry.add(edge_state.edgename, judgement=None)
+
+    def set_judgement(self, edgename, judgement):
+        """ Set the `current_judgement` of an edge and index it """
+        self.current_judgement[edgename] = judgement
+        self.registry.update(edgename, "judgement", judgement)
 
     def get_judgement(self, edgename):
         """ Returns `current_judgement` of a edge """
@@ -90,10 +144,11 @@ class DecisionMaker(object):
         if self.edges_disabled:
             for edgename in self.edge_states:
                 results_dict["fail"] += 1
-                self.current_judgement[edgename] = "fail"
+                self.set_judgement(edgename, "fail")
             logging.info("FAIL: %d edges have been disabled", results_dict["fail"])
             return results_dict
 
+        monitor = Monitor()
         for edgename, edge_state in six.iteritems(self.edge_states):
             time_slice = self.edge_state_slice(edge_state)
             if time_slice:
@@ -101,54 +156,54 @@ class DecisionMaker(object):
                 logging.debug("Analysing %s. Last val: %f, time slice: %f, average: %f",
                               edgename, edge_state.last_value(), time_slice_avg,
                               edge_state.current_average())
-                Monitor().set(edgename, "response_time", edge_state.last_value())
-                Monitor().set(edgename, "average_time", edge_state.current_average())
-                Monitor().set(edgename, "timeslice", time_slice_avg)
+                monitor.set(edgename, "response_time", edge_state.last_value())
+                monitor.set(edgename, "average_time", edge_state.current_average())
+                monitor.set(edgename, "timeslice", time_slice_avg)
             else:
                 time_slice_avg = None
                 logging.debug("Analysing %s. Last val: %f, time slice: Not enough data, "
                               "average: %f",
                               edgename, edge_state.last_value(), edge_state.current_average())
-                Monitor().set(edgename, "response_time", edge_state.last_value())
-                Monitor().set(edgename, "average_time", edge_state.current_average())
-                Monitor().set(edgename, "timeslice", -1)
+                monitor.set(edgename, "response_time", edge_state.last_value())
+                monitor.set(edgename, "average_time", edge_state.current_average())
+                monitor.set(edgename, "timeslice", -1)
 
             if edge_state.last_value() < good_enough:
-                self.current_judgement[edgename] = "pass_threshold"
+                self.set_judgement(edgename, "pass_threshold")
                 results_dict["pass_threshold"] += 1
                 logging.info("PASS: Last fetch for %s is under the good_enough threshold "
                              "(%f < %f)", edgename, edge_state.last_value(), good_enough)
-                Monitor().set(edgename, "reachable_status", 1)
+                monitor.set(edgename, "reachable_status", 1)
             elif edge_state.last_value() == const.FETCH_TIMEOUT:
                 # FETCH_TIMEOUT must be checked before the average measurements. An edge
                 # whose most recent fetch has failed should be marked as fail even if
                 # the average value is still passing.
-                self.current_judgement[edgename] = "fail"
+                self.set_judgement(edgename, "fail")
                 results_dict["fail"] += 1
                 logging.info(("FAIL: Fetch time for %s is equal to the FETCH_TIMEOUT of %d. "
                               "Automatic fail"),
                              edgename, const.FETCH_TIMEOUT)
-                Monitor().set(edgename, "reachable_status", 0)
+                monitor.set(edgename, "reachable_status", 0)
             elif time_slice and time_slice_avg < good_enough:
-                self.current_judgement[edgename] = "pass_window"
+                self.set_judgement(edgename, "pass_window")
                 results_dict["pass_window"] += 1
                 logging.info("UNSURE: Last fetch for %s is NOT under the good_enough threshold "
                              "but the average of the last %d items is (%f < %f)",
                              edgename, len(time_slice), time_slice_avg, good_enough)
-                Monitor().set(edgename, "reachable_status", 1)
+                monitor.set(edgename, "reachable_status", 1)
             elif edge_state.current_average() < good_enough:
-                self.current_judgement[edgename] = "pass_average"
+                self.set_judgement(edgename, "pass_average")
                 results_dict["pass_average"] += 1
                 logging.info("UNSURE: Last fetch for %s is NOT under the good_enough threshold "
                              "but under the average (%f < %f)",
                              edgename, edge_state.current_average(), good_enough)
-                Monitor().set(edgename, "reachable_status", 1)
+                monitor.set(edgename, "reachable_status", 1)
             else:
-                self.current_judgement[edgename] = "pass"
+                self.set_judgement(edgename, "pass")
                 results_dict["pass"] += 1
                 logging.info("PASS: Last fetch for %s is not under the good_enough threshold "
                              "but is passing (%f < %f)", edgename,
                              edge_state.last_value(), const.FETCH_TIMEOUT)
-                Monitor().set(edgename, "reachable_status", 1)
+                monitor.set(edgename, "reachable_status", 1)
 
-        return results_dict
+        return self.apply_filters(results_dict, good_enough)
@@ -5,7 +5,6 @@ A class that represents a list of edges
 from __future__ import absolute_import
 import logging
 import time
-from collections import Counter
 import random
 import socket
 import os
@@ -13,6 +12,8 @@ import os
 from jinja2 import Environment, PackageLoader, FileSystemLoader
 import six
 
+from edgemanage.registry import EdgeRegistry
+
 try:
     env = Environment(loader=PackageLoader('edgemanage', 'templates'))
 except ImportError:
@@ -28,26 +29,32 @@ except ImportError:
 class EdgeList(object):
     """ A class that represents a list of edges """
 
-    def __init__(self):
+    def __init__(self, registry=None):
         # A dictionary indicating whether an edge is live or not, and
         # what state it's in
         self.edges = {}
+        # The same edges indexed by liveness and state, in a registry
+        # that may be shared with the rest of edgemanage
+        if registry is None:
+            registry = EdgeRegistry()
+        self.registry = registry
 
     def add_edge(self, edgename, state=None, live=False):
         self.edges[edgename] = {
             "live": live,
             "state": state
         }
+        self.registry.add(edgename, live=live, list_state=state)
 
     def __len__(self):
-        return len(list(self.edges.keys()))
+        return len(self.edges)
 
     def get_state_stats(self):
-        counter = Counter([edge["state"] for edge in self.edges.values()])
-        return dict(counter)
+        return dict((state, len(edges)) for state, edges
+                    in six.iteritems(self.registry.index["list_state"]) if edges)
 
     def get_live_count(self):
-        return len(self.get_live_edges())
+        return self.registry.count("live", True)
 
     def get_live_edges(self):
         return self.get_edges_by_liveness(True)
@@ -62,20 +69,16 @@ class EdgeList(object):
             return None
 
     def get_edges_by_liveness(self, islive):
-        edge_list = []
-        for edge, state_dict in six.iteritems(self.edges):
-
-            if state_dict["live"] == islive:
-                edge_list.append(edge)
-        return sorted(edge_list)
+        return sorted(self.registry.find(live=islive))
 
     def set_edge_live(self, edgename):
         self.edges[edgename]["live"] = True
+        self.registry.update(edgename, "live", True)
 
     def get_edges(self, state=None):
         ''' return a list of edges, with the option to filter by state '''
         if state:
-            return [edge for edge in self.edges if self.edges[edge]['state'] == state]
+            return list(self.registry.find(list_state=state))
         else:
             return list(self.edges.keys())
 
@@ -6,29 +6,57 @@ Main entry point of edgemanage, imported by edge_manage binary
 """
 
 from __future__ import absolute_import
-from edgemanage.edgetest import EdgeTest, VerifyFailed, FetchFailed
-from edgemanage import EdgeState, DecisionMaker, EdgeList, const
+from edgemanage.edgetest import EdgeTest, VerifyFailed, FetchFailed, tcp_precheck
+from edgemanage.edgetest import aggregate_samples, FetchResult
+from edgemanage import EdgeState, DecisionMaker, EdgeList, const, util
 from edgemanage.monitor import Monitor
+from edgemanage.overhead import LoopbackServer, ProbeOverhead
+from edgemanage.profiling import CycleTimer
+from edgemanage.damping import FlapDamper
+from edgemanage.changepoint import ChangePointFilter
+from edgemanage.probepool import ShardedProbeExecutor, shared_executor
+from edgemanage.rotationlimit import RotationLimiter
+from edgemanage.scoring import make_scorer, HeadroomScorer
+from edgemanage.selection import EdgeSelector
+from edgemanage.snapshot import SNAPSHOT_VERSION, edge_summary
+from edgemanage.registry import EdgeRegistry
 
 from concurrent.futures import ThreadPoolExecutor, as_completed, CancelledError
-import itertools
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import glob
 import traceback
 import hashlib
 import logging
 import os
+import time
 import six
 
 
 def future_fetch(edgetest, testobject_host, testobject_path,
-                 testobject_proto, testobject_port, testobject_verify):
-    """Helper function to give us a return value that plays nice with as_completed"""
+                 testobject_proto, testobject_port, testobject_verify,
+                 samples=1, sample_spacing=0, sample_aggregate="median", submitted=None):
+    """Helper function to give us a return value that plays nice with as_completed
 
+    submitted: time.monotonic() value when the test was queued, to
+    work out how long it waited for a worker
+    """
+
+    queue_delay = None
+    if submitted is not None:
+        queue_delay = time.monotonic() - submitted
     fetch_status = None
+    sample_times = None
     try:
-        fetch_result = edgetest.fetch(testobject_host, testobject_path,
-                                      testobject_proto, testobject_port,
-                                      testobject_verify)
+        if samples > 1:
+            sample_times = edgetest.fetch_samples(samples, sample_spacing,
+                                                  testobject_host, testobject_path,
+                                                  testobject_proto, testobject_port,
+                                                  testobject_verify)
+            fetch_result = aggregate_samples(sample_times, sample_aggregate)
+        else:
+            fetch_result = edgetest.fetch(testobject_host, testobject_path,
+                                          testobject_proto, testobject_port,
+                                          testobject_verify)
     except VerifyFailed:
         # Ensure that we don't use hosts where verification has failed
         fetch_result = const.FETCH_TIMEOUT
@@ -40,29 +68,77 @@ def future_fetch(edgetest, testobject_host, testobject_path,
         fetch_status = "fetch_failed"
     except Exception:
         logging.error("Uncaught exception in fetch! %s", traceback.format_exc())
-    return {edgetest.edgename: (fetch_result, fetch_status)}
+        fetch_result = const.FETCH_TIMEOUT
+        fetch_status = "error"
+    return {edgetest.edgename: FetchResult(fetch_result, fetch_status, sample_times,
+                                           queue_delay)}
 
 
 class EdgeManage(object):
 
     def _init_objects(self):
+        # Index of the edges by role, mode, health and state, shared with
+        # the edge list and decision makers. Canaries are known before
+        # their edge states are loaded.
+        self.registry = EdgeRegistry()
+        for canary_ip in self.canary_data.values():
+            self.registry.add(canary_ip, role="canary")
+
         # List of edges that will be made live
-        self.edgelist_obj = EdgeList()
+        self.edgelist_obj = EdgeList(self.registry)
         # Object we will use to make a decision about edge liveness based
         # on the stat stores
-        self.decision = DecisionMaker()
+        self.decision = self.make_decision_maker()
         self.canary_decision = None
 
         if self.canary_data:
             # Because we treat the behaviour of canaries differently
             # let's ringfence them here.
-            self.canary_decision = DecisionMaker()
+            self.canary_decision = self.make_decision_maker(canary=True)
+        # Number of canaries whose test failed this run, for the canary killer
+        self.canary_failures = 0
+
+        # Ranks edges within a health tier
+        self.scorer = make_scorer(self.config.get("scorer", "average"))
 
         self.edge_states = {}
+        # Set when the decision was committed before all edge tests completed
+        self.fast_path_taken = False
+        # Delays added to the edge tests by our own load, set while testing
+        self.overhead = None
+        # The threshold edges were last judged against
+        self.good_enough = None
 
         self.testobject_hash = self.get_testobject_hash()
         self.current_mtimes = self.zone_mtime_setup()
 
+    def make_decision_maker(self, canary=False):
+        """
+        Called by `_init_objects` (private call)
+
+        Create the decision maker selected by `decision_engine` in the
+        config: "python" (the default) or "vector", which needs numpy.
+        Flap damping is applied to edges but not to canaries, followed by
+        change-point detection when `change_detection` is set.
+        """
+        decision_engine = self.config.get("decision_engine", "python")
+        if decision_engine == "vector":
+            # Only imported when used, as it loads numpy
+            from edgemanage.vectordecision import VectorDecisionMaker
+            decision = VectorDecisionMaker(self.registry)
+        elif decision_engine == "python":
+            decision = DecisionMaker(self.registry)
+        else:
+            raise ValueError("Unknown decision_engine %s" % decision_engine)
+
+        if not canary and self.config.get("damping"):
+            decision.add_filter(FlapDamper(self.config["damping"]))
+        change_detection = self.config.get("change_detection")
+        if change_detection:
+            decision.add_filter(ChangePointFilter(change_detection.get("hold",
+                                                                       const.CHANGE_HOLD)))
+        return decision
+
     def get_testobject_hash(self):
         """
         Called by `_init_objects` (private call)
@@ -76,7 +152,7 @@ class EdgeManage(object):
 
         return testobject_hash
 
-    def __init__(self, dnet, config, state, canary_data={}, dry_run=False):
+    def __init__(self, dnet, config, state, canary_data={}, dry_run=False, timer=None):
         '''
         Upper-level edgemanage object that is used to create
         lower-level edgemanage objects and accomplish the overall task
@@ -87,11 +163,14 @@ class EdgeManage(object):
             config: configuration dictionary
             state: state object
             canary_data: per-site canary site->canary_ip dict
+            timer: CycleTimer timing the phases of this run
 
         '''
 
         self.dnet = dnet
+        self.timer = timer or CycleTimer()
         self.dry_run = dry_run
+        self.cycle_start = time.monotonic()
         self.config = config
         self.state_obj = state
 
@@ -128,6 +207,10 @@ class EdgeManage(object):
 
             return False
         self.edge_states[edge] = edge_state
+        if self.registry.is_canary(edge):
+            self.registry.add_edge_state(edge_state, role="canary")
+        else:
+            self.registry.add_edge_state(edge_state)
         return True
 
     def check_canary_kill_treshhold(self, canary_futures):
@@ -137,11 +220,12 @@ class EdgeManage(object):
         All canary tests which have not run already are canceled and their
         result time will be set to the `FETCH_TIMEOUT` value. All finished
         canary tests will be failed in `DecisionMaker` when `edges_disabled` is True.
-        """
-        canary_stats = self.canary_decision.check_threshold(self.config["goodenough"])
 
+        Failures are counted by `handle_fetch_result` as results arrive,
+        the canaries are only judged once all tests are done.
+        """
         # Cancel all queued canary tests when too many canaries have failed.
-        if canary_stats["fail"] >= self.config["canary_killer"]:
+        if self.canary_failures >= self.config["canary_killer"]:
             self.canary_decision.edges_disabled = True
 
             cancelled = [future.cancel() for future in canary_futures]
@@ -149,17 +233,274 @@ class EdgeManage(object):
                          cancelled.count(True), len(cancelled))
 
             # Set every untested canary as TIMEOUT when we disable them.
-            for untested_edge in [edge for edge in self.canary_data.values() if
+            for untested_edge in [edge for edge in self.registry.canaries() if
+                                  edge in self.edge_states and
                                   edge not in self.canary_decision.edge_states]:
                 self.edge_states[untested_edge].add_value(const.FETCH_TIMEOUT)
                 self.canary_decision.add_edge_state(self.edge_states[untested_edge])
 
-    def do_edge_tests(self):
+    def get_required_edge_count(self):
+        """ Number of edges that must be live for this dnet """
+        if self.dnet in self.config["dnet_edge_count"]:
+            return self.config["dnet_edge_count"][self.dnet]
+        return self.config["edge_count"]
+
+    def get_capacity_target(self):
+        """
+        Capacity that the live edges of this dnet must add up to, or
+        None to only require the edge count
+        """
+        if self.dnet in self.config.get("dnet_capacity", {}):
+            return self.config["dnet_capacity"][self.dnet]
+        return self.config.get("capacity_target")
+
+    def get_capacity(self, edges):
+        """ Sum of the capacity weights of the given edges """
+        return sum(self.edge_states[edge].capacity for edge in edges
+                   if edge in self.edge_states)
+
+    def has_enough_edges(self, edges):
+        """
+        True if no more edges need to be added to `edges`: there are at
+        least the required edge count and, if there is a capacity target,
+        their capacity meets it
+        """
+        if len(edges) < self.get_required_edge_count():
+            return False
+        capacity_target = self.get_capacity_target()
+        return capacity_target is None or self.get_capacity(edges) >= capacity_target
+
+    def live_set_ready(self, edges):
+        """
+        True if `edges` can be put in rotation: exactly the required edge
+        count or, if there is a capacity target, enough edges to meet it
+        """
+        if self.get_capacity_target() is None:
+            return len(edges) == self.get_required_edge_count()
+        return self.has_enough_edges(edges)
+
+    def live_set_usable(self, edges):
+        """
+        True if zone files can be written for `edges`. Without a capacity
+        target the live set must be ready. A capacity target is only best
+        effort, as rotating in whatever capacity is healthy is better than
+        leaving failed edges in rotation, so any edges will do.
+        """
+        if self.get_capacity_target() is None:
+            return self.live_set_ready(edges)
+        return bool(edges)
+
+    def get_executor(self, workers):
+        """
+        The executor to run edge tests in. Tests are sharded across
+        `probe_processes` processes when configured, which are kept for
+        the following runs, otherwise they run in a thread pool in this
+        process.
+        """
+        probe_processes = self.config.get("probe_processes", 0)
+        if probe_processes > 1:
+            return shared_executor(probe_processes, workers)
+        return ThreadPoolExecutor(max_workers=workers)
+
+    def get_cycle_deadline(self):
+        """
+        The time.monotonic() value by which all edge tests must have
+        completed, or None if runs are unbounded.
+
+        Taken from `cycle_deadline` in the config, or from `run_frequency`
+        less CYCLE_DEADLINE_MARGIN so that a run never overlaps the next one.
+        """
+        cycle_deadline = self.config.get("cycle_deadline")
+        if not cycle_deadline and self.config.get("run_frequency"):
+            cycle_deadline = max(self.config["run_frequency"] - const.CYCLE_DEADLINE_MARGIN,
+                                 const.CYCLE_DEADLINE_MARGIN)
+        if not cycle_deadline:
+            return None
+        return self.cycle_start + cycle_deadline
+
+    def get_time_left(self, deadline):
+        """ Seconds until `deadline`, or None for no deadline """
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0)
+
+    def expire_edge_tests(self, future_edges, processed_futures, canary_futures,
+                          verification_failues):
+        """
+        Deal with every edge test that was not processed by the time the
+        cycle deadline was reached.
+
+        Finished tests are processed as normal. Tests still queued or
+        running are cancelled and their result is set to FETCH_TIMEOUT.
+        """
+        outstanding = [future for future in future_edges
+                       if future not in processed_futures and not future.cancelled()]
+        logging.error("Reached the cycle deadline with %d edge tests unprocessed",
+                      len([future for future in outstanding if not future.done()]))
+
+        for future in outstanding:
+            if future.cancelled():
+                # Cancelled by the canary kill switch while processing
+                continue
+            elif future.done():
+                result = self.get_fetch_result(future, future_edges[future])
+            else:
+                future.cancel()
+                result = {future_edges[future]: FetchResult(const.FETCH_TIMEOUT, "deadline", None)}
+            self.handle_fetch_result(result, canary_futures, verification_failues)
+
+    def get_fetch_result(self, future, edgename):
+        """
+        The result of a finished edge test, or a failed fetch if the
+        test was lost along with the probe process running it
+        """
+        try:
+            return future.result()
+        except RuntimeError as e:
+            logging.error("Edge test of %s failed: %s", edgename, str(e))
+            return {edgename: FetchResult(const.FETCH_TIMEOUT, "lost", None)}
+
+    def collect_loopback_results(self, loopback_futures, cycle_deadline):
+        """
+        Add the fetch times of loopback tests to the overhead of the run,
+        waiting for them until the cycle deadline. Collected tests are
+        removed from loopback_futures.
+        """
+        while loopback_futures:
+            future = loopback_futures.pop(0)
+            if future.cancelled():
+                continue
+            try:
+                result = future.result(timeout=self.get_time_left(cycle_deadline))
+            except FutureTimeoutError:
+                future.cancel()
+                continue
+            except (CancelledError, RuntimeError) as e:
+                logging.warning("Loopback test failed: %s", str(e))
+                continue
+
+            loopback_result = list(result.values())[0]
+            if loopback_result.value == const.FETCH_TIMEOUT:
+                logging.warning("Loopback test failed: %s", loopback_result.status)
+            else:
+                self.overhead.add_loopback(loopback_result.value)
+
+    def get_good_enough(self):
+        """
+        The threshold edges are judged against this run.
+
+        This is `goodenough` from the config unless `adaptive_goodenough`
+        is set, in which case it's the given percentile of the latest
+        fetch times of all edges, clamped between floor and ceiling.
+        Edges not tested yet this run, as on the fast path, count with
+        their fetch time from the previous run so that the threshold
+        isn't taken over the priority edges alone.
+        """
+        good_enough = self.config["goodenough"]
+        adaptive = self.config.get("adaptive_goodenough")
+        if adaptive:
+            fetch_times = [edge_state.last_value() for edgename, edge_state
+                           in six.iteritems(self.edge_states)
+                           if not self.registry.is_canary(edgename) and
+                           edge_state.mode != "unavailable" and edge_state.fetch_times and
+                           edge_state.last_value() != const.FETCH_TIMEOUT]
+            if fetch_times:
+                good_enough = util.percentile(fetch_times, adaptive.get("percentile", 25))
+            good_enough = min(max(good_enough, adaptive.get("floor", 0)),
+                              adaptive.get("ceiling", const.FETCH_TIMEOUT))
+            logging.info("Adaptive goodenough threshold is %f from %d fetch times",
+                         good_enough, len(fetch_times))
+
+        Monitor().set_global("goodenough_effective", good_enough)
+        self.good_enough = good_enough
+        return good_enough
+
+    def get_priority_edges(self):
+        """
+        Edges whose results decide whether anything needs to change this
+        run: the previously live edges, forced edges and canaries. These
+        are tested before the rest of the edges.
+        """
+        priority_edges = set(self.state_obj.last_live)
+        priority_edges.update(self.registry.canaries())
+        priority_edges.update(self.registry.find(mode="force"))
+        priority_edges.update(self.registry.find(mode="blindforce"))
+        return priority_edges
+
+    def check_fast_path(self):
+        """
+        Returns True if the results collected so far are enough to keep
+        the previously live edges in rotation without looking at any of
+        the other edges.
+        """
+        if not self.state_obj.last_live:
+            return False
+
+        self.decision.check_threshold(self.get_good_enough())
+        return self.live_set_ready(self.check_last_live())
+
+    def handle_fetch_result(self, result, canary_futures, verification_failues):
+        """
+        Store the result of a single `future_fetch` call and feed the
+        edge to the appropriate decision maker
+        """
+        edge, value = list(result.items())[0]
+        fetch_result, fetch_status, sample_times, queue_delay = value
+
+        if fetch_status == "verify_failed":
+            verification_failues.append(edge)
+
+        # The edge will not be in the edge_states list if it's statefile is not parsable.
+        # We should skip it and provide a warning so as to avoid stalling edgemanage.
+        if edge not in self.edge_states:
+            logging.error("Could not find edge data for %s. Is the edge state "
+                          "file corrupt?", edge)
+            return
+
+        if self.overhead:
+            self.overhead.add_queue_delay(queue_delay)
+
+        if not self.config.get("keep_samples"):
+            sample_times = None
+        self.edge_states[edge].add_value(fetch_result, samples=sample_times)
+        Monitor().observe_probe(edge, fetch_result)
+        logging.info("Fetch time for %s: %f avg: %f",
+                     edge, fetch_result,
+                     self.edge_states[edge].current_average())
+
+        # Skip edges that we have forced out of commission
+        if self.edge_states[edge].mode == "unavailable":
+            logging.debug("Skipping edge %s as its status has been set to unavailable",
+                          edge)
+        else:
+            # otherwise add it to the appropriate decision maker
+            if self.registry.is_canary(edge):
+                self.canary_decision.add_edge_state(self.edge_states[edge])
+                if fetch_result == const.FETCH_TIMEOUT:
+                    self.canary_failures += 1
+            elif edge in self.edge_states:
+                self.decision.add_edge_state(self.edge_states[edge])
+
+        # Hard-kill the remaining canary tests if too many are failing. This
+        # also disables any canaries which have already been successfully tested.
+        if self.canary_data:
+            if self.config["canary_killer"] and not self.canary_decision.edges_disabled:
+                self.check_canary_kill_treshhold(canary_futures)
+
+    def do_edge_tests(self, on_fast_path=None):
         """
         Called by binary `edge_manage`
 
         Use ThreadPoolExecutor to create worker (count in config `workers`, default 10)
         to perform edge testing via `EdgeTest` object
+
+        Args:
+            on_fast_path: optional callable. When given, the edges from
+                `get_priority_edges` are tested first and if their results
+                show that the previously live edges can be kept, the
+                callable is run straight away while the remaining tests
+                complete.
+
         """
         test_dict = self.config["testobject"]
         test_host = test_dict["host"]
@@ -171,71 +512,149 @@ class EdgeManage(object):
             # Allow FETCH_TIMEOUT to be overridden in TESTING mode.
             const.FETCH_TIMEOUT = self.config.get("timeout") or const.FETCH_TIMEOUT
 
+        priority_edges = set()
+        if on_fast_path:
+            priority_edges = self.get_priority_edges()
+
+        # Only edges that accept a TCP connection go on to the full fetch
+        unreachable_edges = set()
+        if self.config.get("tcp_precheck"):
+            with self.timer.phase("tcp_precheck"):
+                reachable_edges = tcp_precheck(self.edge_states, test_port,
+                                               self.config.get("tcp_precheck_timeout"))
+            unreachable_edges = set(self.edge_states) - reachable_edges
+
+        cycle_deadline = self.get_cycle_deadline()
+        probe_budget = self.config.get("probe_budget")
+        retries = self.config.get("retry")
+        samples = self.config.get("samples", 1)
+        sample_spacing = self.config.get("sample_spacing", 0)
+        sample_aggregate = self.config.get("sample_aggregate", "median")
+
+        priority_futures = []
         edgescore_futures = []
         canary_futures = []
+        loopback_futures = []
+        priority_loopback_futures = []
+        future_edges = {}
+        processed_futures = set()
         verification_failues = []
-        with ThreadPoolExecutor(max_workers=self.config["workers"]) as executor:
-            for edgename in self.edge_states:
+
+        # Our own overhead is only measured when asked for, by loopback
+        # tests or an overhead_limit to act on
+        loopback_probes = self.config.get("loopback_probes", const.LOOPBACK_PROBES)
+        if loopback_probes or self.config.get("overhead_limit"):
+            self.overhead = ProbeOverhead()
+        # Tests of the loopback server are spread evenly through the edge tests
+        loopback_server = None
+        loopback_positions = set()
+        if loopback_probes:
+            with open(self.config["testobject"]["local"], 'rb') as test_local_f:
+                loopback_server = LoopbackServer(test_local_f.read(), test_path)
+            loopback_positions = set(position * len(self.edge_states) // loopback_probes
+                                     for position in range(loopback_probes))
+
+        # Each worker takes all of the samples of one edge in turn, so scale
+        # the pool to keep the same wall-clock time per run
+        executor = self.get_executor(self.config["workers"] * samples)
+        deadline_reached = False
+        try:
+            # Submit the priority edges first so that they are the first
+            # to be picked up by the workers
+            for position, edgename in enumerate(
+                    sorted(self.edge_states, key=lambda edge: edge not in priority_edges)):
+                if position in loopback_positions:
+                    loopback_test = EdgeTest("127.0.0.1", self.testobject_hash,
+                                             deadline=cycle_deadline, retries=1)
+                    loopback_future = executor.submit(
+                        future_fetch, loopback_test, "127.0.0.1", test_path, "http",
+                        loopback_server.port, False)
+                    if edgename in priority_edges:
+                        priority_loopback_futures.append(loopback_future)
+                    else:
+                        loopback_futures.append(loopback_future)
+
+                if edgename in unreachable_edges:
+                    continue
+
                 # Send raw IP as the host header when in the testing environment
                 if self.config.get("testing"):
                     test_host = edgename
 
-                edge_t = EdgeTest(edgename, self.testobject_hash)
+                edge_t = EdgeTest(edgename, self.testobject_hash, deadline=cycle_deadline,
+                                  budget=probe_budget, retries=retries)
                 edgetest_future = executor.submit(future_fetch,
                                                   edge_t, test_host,
                                                   test_path,
                                                   test_proto,
                                                   test_port,
-                                                  test_verify)
+                                                  test_verify,
+                                                  samples,
+                                                  sample_spacing,
+                                                  sample_aggregate,
+                                                  time.monotonic())
+                future_edges[edgetest_future] = edgename
 
                 # Check if the current edge is a canary edge
-                if edgename not in list(self.canary_data.values()):
-                    edgescore_futures.append(edgetest_future)
-                else:
+                if self.registry.is_canary(edgename):
                     canary_futures.append(edgetest_future)
 
-            # Iterate over the results of both Futures lists
-            for f in as_completed(itertools.chain(edgescore_futures, canary_futures)):
-                try:
-                    result = f.result()
-                except CancelledError:
-                    # Do not try and process canceled edge tests
-                    continue
-
-                edge, value = list(result.items())[0]
-                fetch_result, fetch_status = value
-
-                if fetch_status == "verify_failed":
-                    verification_failues.append(edge)
-
-                # The edge will not be in the edge_states list if it's statefile is not parsable.
-                # We should skip it and provide a warning so as to avoid stalling edgemanage.
-                if edge not in self.edge_states:
-                    logging.error("Could not find edge data for %s. Is the edge state "
-                                  "file corrupt?", edge)
-                    continue
+                if edgename in priority_edges:
+                    priority_futures.append(edgetest_future)
+                else:
+                    edgescore_futures.append(edgetest_future)
 
-                self.edge_states[edge].add_value(fetch_result)
-                logging.info("Fetch time for %s: %f avg: %f",
-                             edge, fetch_result,
-                             self.edge_states[edge].current_average())
+            # Edges that refused the TCP pre-check fail just as if the
+            # fetch had timed out
+            for edgename in unreachable_edges:
+                result = {edgename: FetchResult(const.FETCH_TIMEOUT, "connect_failed", None)}
+                self.handle_fetch_result(result, canary_futures, verification_failues)
 
-                # Skip edges that we have forced out of commission
-                if self.edge_states[edge].mode == "unavailable":
-                    logging.debug("Skipping edge %s as its status has been set to unavailable",
-                                  edge)
-                else:
-                    # otherwise add it to the appropriate decision maker
-                    if edge in list(self.canary_data.values()):
-                        self.canary_decision.add_edge_state(self.edge_states[edge])
-                    elif edge in self.edge_states:
-                        self.decision.add_edge_state(self.edge_states[edge])
-
-                # Hard-kill the remaining canary tests if too many are failing. This
-                # also disables any canaries which have already been successfully tested.
-                if self.canary_data:
-                    if self.config["canary_killer"] and not self.canary_decision.edges_disabled:
-                        self.check_canary_kill_treshhold(canary_futures)
+            try:
+                # Iterate over the results of the priority edges, then the rest
+                for futures in [priority_futures, edgescore_futures]:
+                    for f in as_completed(futures, timeout=self.get_time_left(cycle_deadline)):
+                        processed_futures.add(f)
+                        try:
+                            result = self.get_fetch_result(f, future_edges[f])
+                        except CancelledError:
+                            # Do not try and process canceled edge tests
+                            continue
+
+                        self.handle_fetch_result(result, canary_futures, verification_failues)
+
+                    if futures is priority_futures and on_fast_path:
+                        # The loopback tests among the priority edges tell
+                        # whether the fast path commit is made while overloaded
+                        self.collect_loopback_results(priority_loopback_futures,
+                                                      cycle_deadline)
+                        if self.check_fast_path():
+                            logging.info("Previously live edges are still healthy, "
+                                         "committing before the remaining %d edge tests "
+                                         "complete", len(edgescore_futures))
+                            self.fast_path_taken = True
+                            on_fast_path()
+            except FutureTimeoutError:
+                deadline_reached = True
+                self.expire_edge_tests(future_edges, processed_futures, canary_futures,
+                                       verification_failues)
+                for future in priority_loopback_futures + loopback_futures:
+                    future.cancel()
+        finally:
+            # Tests still running past the cycle deadline are abandoned
+            # rather than waited for. They give up by their own fetch
+            # deadline and their results are ignored. The probe
+            # processes are kept for the next run.
+            if not isinstance(executor, ShardedProbeExecutor):
+                executor.shutdown(wait=not deadline_reached)
+
+        self.collect_loopback_results(priority_loopback_futures + loopback_futures,
+                                      cycle_deadline)
+        if loopback_server:
+            loopback_server.shutdown()
+        if self.overhead:
+            self.overhead.stop()
+            self.overhead.export()
 
         return verification_failues
 
@@ -257,7 +676,7 @@ class EdgeManage(object):
         for oldlive_edge in self.state_obj.last_live:
 
             try:
-                if oldlive_edge in self.canary_data:
+                if self.registry.is_canary(oldlive_edge):
                     oldlive_health = self.canary_decision.get_judgement(oldlive_edge)
                 else:
                     oldlive_health = self.decision.get_judgement(oldlive_edge)
@@ -280,27 +699,41 @@ class EdgeManage(object):
 
         return list(set(still_healthy))
 
-    def get_fastest_edges_by_state(self, edge_list, state, desired_count):
+    def rotation_allowed(self):
         """
-        Get the top `desired_count` fastest edges with the specified state
+        Returns False if the live edges have already been rotated
+        `dnschange_maxfreq` times in the last DNSCHANGE_PERIOD seconds
         """
-        edges_in_state = [edge for edge in edge_list
-                          if self.decision.get_judgement(edge) == state]
+        max_rotations = self.config.get("dnschange_maxfreq")
+        if not max_rotations:
+            return True
 
-        # Sort the list of edges with specified state
-        edge_list = sorted(edges_in_state,
-                           key=lambda edge: self.decision.edge_average(edge))
+        limiter = RotationLimiter(self.state_obj.rotation_list, max_rotations)
+        Monitor().set_global("rotation_budget", limiter.available())
+        return limiter.allow()
 
-        logging.debug("Sorted %s edges: %s", state, edge_list)
+    def is_overloaded(self):
+        """
+        Returns True if `overhead_limit` is set and our own load added
+        more than that many seconds to the edge tests of this run, so
+        slow fetch times can't be blamed on the edges
+        """
+        overhead_limit = self.config.get("overhead_limit")
+        overloaded = bool(overhead_limit and self.overhead and
+                          self.overhead.self_overhead() > overhead_limit)
+        Monitor().set_global("overloaded", int(overloaded))
+        return overloaded
 
-        choosen_edges = []
-        for edge in edge_list:
-            if len(choosen_edges) == desired_count:
-                logging.debug("Edgemanage got enough (%d) edges in state %s",
-                              desired_count, state)
-                break
-            choosen_edges.append(edge)
-        return choosen_edges
+    def get_deferred_edges(self, still_healthy):
+        """
+        Previously live edges that are no longer healthy enough to keep
+        but haven't hard-failed either. Replacing these is optional and
+        can wait when the rotation budget is used up.
+        """
+        return [edge for edge in self.state_obj.last_live
+                if edge not in still_healthy and
+                edge in self.decision.current_judgement and
+                self.decision.edge_is_passing(edge)]
 
     def make_edges_live(self, force_update):
         '''
@@ -312,10 +745,10 @@ class EdgeManage(object):
         '''
         # Returns true if any changes were made.
 
-        good_enough = self.config["goodenough"]
-        required_edge_count = self.config["edge_count"]
-        if self.dnet in self.config["dnet_edge_count"]:
-            required_edge_count = self.config["dnet_edge_count"][self.dnet]
+        good_enough = self.get_good_enough()
+        required_edge_count = self.get_required_edge_count()
+
+        self.timer.start("judge")
 
         # Has the edgelist changed since last iteration?
         edgelist_changed = None
@@ -324,38 +757,66 @@ class EdgeManage(object):
         any_changes = False
 
         threshold_stats = self.decision.check_threshold(good_enough)
+        # Ranks edges for this run's selections. With a capacity target,
+        # edges with the most capacity and latency headroom come first.
+        scorer = self.scorer
+        if self.get_capacity_target() is not None:
+            scorer = HeadroomScorer(scorer, good_enough)
+        self.selector = EdgeSelector(self.decision, scorer)
 
         if self.canary_decision:
             canary_stats = self.canary_decision.check_threshold(good_enough)
             logging.debug("Stats of canary threshold check are %s", str(canary_stats))
 
+        self.timer.switch("select")
+
         # Get the list of edges that were 'in' (live) the last time and are
         # still healthy (under the good_enough threshold)
         still_healthy_from_last_run = self.check_last_live()
 
-        for edgename, edge_state in six.iteritems(self.edge_states):
-            if edgename not in list(self.canary_data.values()) and edge_state.mode == "force":
-                if self.decision.edge_is_passing(edgename):
-                    logging.debug(
-                        "Making host %s live because it is in mode force and it is in state pass",
-                        edgename)
-
-                    # Don't set edgelist_changed to True if we're
-                    # already healthy and live
-                    if edgename not in still_healthy_from_last_run:
-                        self.edgelist_obj.add_edge(edgename, state="pass", live=True)
-                        edgelist_changed = True
-
-            elif edgename not in list(self.canary_data.values()) and edge_state.mode == "blindforce":  # noqa: E501
-                logging.debug("Making host %s live because it is in mode blindforce.",
-                              edgename)
-                self.edgelist_obj.add_edge(edgename, state="pass", live=True)
-
-                # Don't update the edgelist if we're still in the last
-                # live list. We don't care if we're healthy.
-                if edgename not in self.state_obj.last_live:
+        # When we've rotated too often lately, or our own load may have
+        # made edges look slow, only replace edges that are hard-failing and
+        # keep the rest in
+        rotation_allowed = self.rotation_allowed()
+        overloaded = self.is_overloaded()
+        deferred_edges = []
+        if not rotation_allowed or overloaded:
+            deferred_edges = self.get_deferred_edges(still_healthy_from_last_run)
+            if deferred_edges and overloaded:
+                logging.warning("Edge tests were delayed by up to %.3fs by our own load, "
+                                "over the overhead_limit of %s, keeping previously live "
+                                "edges %s in rotation", self.overhead.self_overhead(),
+                                self.config["overhead_limit"], deferred_edges)
+            elif deferred_edges:
+                logging.warning("Rotation limit of %d per %d seconds reached, keeping "
+                                "previously live edges %s in rotation",
+                                self.config["dnschange_maxfreq"], const.DNSCHANGE_PERIOD,
+                                deferred_edges)
+            still_healthy_from_last_run = still_healthy_from_last_run + deferred_edges
+        Monitor().set_global("rotations_deferred", len(deferred_edges))
+
+        for edgename in self.registry.find(role="edge", mode="force"):
+            if self.decision.edge_is_passing(edgename):
+                logging.debug(
+                    "Making host %s live because it is in mode force and it is in state pass",
+                    edgename)
+
+                # Don't set edgelist_changed to True if we're
+                # already healthy and live
+                if edgename not in still_healthy_from_last_run:
+                    self.edgelist_obj.add_edge(edgename, state="pass", live=True)
                     edgelist_changed = True
 
+        for edgename in self.registry.find(role="edge", mode="blindforce"):
+            logging.debug("Making host %s live because it is in mode blindforce.",
+                          edgename)
+            self.edgelist_obj.add_edge(edgename, state="pass", live=True)
+
+            # Don't update the edgelist if we're still in the last
+            # live list. We don't care if we're healthy.
+            if edgename not in self.state_obj.last_live:
+                edgelist_changed = True
+
         logging.debug("Stats of threshold check are %s", str(threshold_stats))
 
         # If everything is still healthy from the last run then use those.
@@ -368,10 +829,11 @@ class EdgeManage(object):
                 edgelist_changed = False
 
         for still_healthy in still_healthy_from_last_run:
-            if len(self.edgelist_obj) < required_edge_count:
+            if not self.has_enough_edges(self.edgelist_obj.get_live_edges()):
                 self.edgelist_obj.add_edge(still_healthy, state="pass", live=True)
 
-        if len(still_healthy_from_last_run) == required_edge_count:
+        if (self.live_set_ready(still_healthy_from_last_run) and
+                all(self.edgelist_obj.is_live(edge) for edge in still_healthy_from_last_run)):
             logging.info(
                 "Old edge list is still healthy - not making any changes"
             )
@@ -390,22 +852,25 @@ class EdgeManage(object):
                           self.edgelist_obj.get_live_edges())
 
             # Attempt to meet demand starting with the most responsive edge states
-            for desired_state in ["pass_threshold", "pass_window", "pass_average", "pass"]:
-                needed_edges = required_edge_count - self.edgelist_obj.get_live_count()
-                filled_by_current_state = self.get_fastest_edges_by_state(remaining_edges,
-                                                                          desired_state,
-                                                                          needed_edges)
-                for edge in filled_by_current_state:
-                    self.edgelist_obj.add_edge(edge, state=desired_state, live=True)
-
-                if self.edgelist_obj.get_live_count() == required_edge_count:
-                    logging.info("Filled requirement for %d edges with edges in state %s",
-                                 required_edge_count, desired_state)
+            for edge, health in self.selector.ranked(remaining_edges):
+                if self.has_enough_edges(self.edgelist_obj.get_live_edges()):
                     break
+                self.edgelist_obj.add_edge(edge, state=health, live=True)
+
+            if self.live_set_ready(self.edgelist_obj.get_live_edges()):
+                logging.info("Filled requirement for %d edges with edges in states %s",
+                             self.edgelist_obj.get_live_count(),
+                             self.edgelist_obj.get_state_stats())
+            elif self.live_set_usable(self.edgelist_obj.get_live_edges()):
+                # Short of the capacity target, but these are the best
+                # edges there are
+                logging.warning("Added edges from all acceptable states without meeting "
+                                "the capacity target, using %d edges in states %s",
+                                self.edgelist_obj.get_live_count(),
+                                self.edgelist_obj.get_state_stats())
+                edgelist_changed = (set(self.edgelist_obj.get_live_edges()) !=
+                                    set(self.state_obj.last_live))
             else:
-                # Entering an "else" in the context of a "for" loop means
-                # "we didn't break". It's horrible but it's exactly what
-                # we need here.
                 logging.error("Tried to add edges from all acceptable states but failed")
 
                 # As a last option we add use the last live set of edges, even if
@@ -416,10 +881,23 @@ class EdgeManage(object):
                     self.edgelist_obj.add_edge(edgename, state="pass", live=True)
                 edgelist_changed = False
 
-        if self.edgelist_obj.get_live_count() == required_edge_count:
-            logging.info("Successfully established %d edges: %s",
-                         self.edgelist_obj.get_live_count(),
-                         self.edgelist_obj.get_live_edges())
+        self.timer.switch("zones")
+
+        live_capacity = self.get_capacity(self.edgelist_obj.get_live_edges())
+        Monitor().set_global("live_capacity", live_capacity)
+        capacity_target = self.get_capacity_target()
+        if capacity_target is not None:
+            Monitor().set_global("capacity_shortfall", max(capacity_target - live_capacity, 0))
+        if self.live_set_usable(self.edgelist_obj.get_live_edges()):
+            if self.live_set_ready(self.edgelist_obj.get_live_edges()):
+                logging.info("Successfully established %d edges with a capacity of %s: %s",
+                             self.edgelist_obj.get_live_count(), live_capacity,
+                             self.edgelist_obj.get_live_edges())
+            else:
+                logging.error("Capacity target of %s not met! Using the %d edges available "
+                              "with a capacity of %s: %s", capacity_target,
+                              self.edgelist_obj.get_live_count(), live_capacity,
+                              self.edgelist_obj.get_live_edges())
 
             for live_edge in self.edgelist_obj.get_live_edges():
                 Monitor().set(live_edge, "in_rotation", 1)
@@ -515,25 +993,18 @@ class EdgeManage(object):
                                   complete_zone_path, zone_name, complete_zone_str)
 
         else:
-            logging.error("Couldn't establish full edge list! Only have %d edges (%s), need %d",
+            logging.error("Couldn't establish full edge list! Only have %d edges (%s) "
+                          "with a capacity of %s, need %d edges with a capacity of %s",
                           self.edgelist_obj.get_live_count(),
-                          self.edgelist_obj.get_live_edges(),
-                          required_edge_count)
+                          self.edgelist_obj.get_live_edges(), live_capacity,
+                          required_edge_count, self.get_capacity_target())
+
+        self.timer.switch("store")
 
         # We've got our edges, one way or another - let's set their states
         # Note in the statefile that this edge has been put into rotation
         for edge in self.edge_states:
-            try:
-                if edge in list(self.canary_data.values()):
-                    is_canary = True
-                    current_health = self.canary_decision.get_judgement(edge)
-                else:
-                    is_canary = False
-                    current_health = self.decision.get_judgement(edge)
-
-                self.edge_states[edge].set_health(current_health)
-            except KeyError:
-                logging.debug("Could not get health judgement for edge %s", edge)
+            is_canary = self.store_edge_health(edge)
 
             if is_canary is False:
                 if self.edgelist_obj.is_live(edge):
@@ -544,6 +1015,7 @@ class EdgeManage(object):
                 else:
                     logging.debug("Setting edge %s to state out", edge)
                     self.edge_states[edge].set_state("out")
+                    Monitor().set(edge, "in_rotation", 0)
             else:
                 # Canaries are silently set to "out", because the state "in" implies a
                 # dnet-wise insertion, which doesn't make sense for canaries.
@@ -551,5 +1023,74 @@ class EdgeManage(object):
                 self.edge_states[edge].set_state("out")
 
         self.state_obj.zone_mtimes = self.current_mtimes
+        self.timer.stop()
 
         return any_changes or edgelist_changed
+
+    def store_edge_health(self, edge):
+        """
+        Save the current judgement of an edge to its edge state.
+
+        Returns True if the edge is a canary.
+        """
+        is_canary = self.registry.is_canary(edge)
+        try:
+            if is_canary:
+                current_health = self.canary_decision.get_judgement(edge)
+            else:
+                current_health = self.decision.get_judgement(edge)
+
+            self.edge_states[edge].set_health(current_health)
+        except KeyError:
+            logging.debug("Could not get health judgement for edge %s", edge)
+
+        return is_canary
+
+    def snapshot(self):
+        """
+        Called by binary `edge_manage` at the end of a run
+
+        The snapshot of the dnet to write with `snapshot.write_snapshot`:
+        a summary of every edge and canary and the outcome of the run
+        """
+        now = time.time()
+        window = self.config.get("snapshot_window", const.SNAPSHOT_WINDOW)
+        edges = {}
+        for edgename, edge_state in six.iteritems(self.edge_states):
+            edges[edgename] = edge_summary(edge_state, self.registry.get(edgename, "role"),
+                                           bool(self.edgelist_obj.is_live(edgename)), now,
+                                           window)
+
+        live_edges = self.edgelist_obj.get_live_edges()
+        return {
+            "version": SNAPSHOT_VERSION,
+            "dnet": self.dnet,
+            "generated": now,
+            "run_time": self.timer.total(),
+            "window": window,
+            "good_enough": self.good_enough,
+            "fast_path_taken": self.fast_path_taken,
+            "self_overhead": self.overhead.self_overhead() if self.overhead else None,
+            "live_edges": live_edges,
+            "live_capacity": self.get_capacity(live_edges),
+            "last_rotation": self.state_obj.last_rotation(),
+            "rotation_list": self.state_obj.rotation_list,
+            "verification_failures": getattr(self.state_obj, "verification_failures", []),
+            "edges": edges,
+        }
+
+    def update_edge_health(self):
+        """
+        Called by binary `edge_manage` after a fast-path commit
+
+        Judge every edge again once all of the edge tests have completed
+        so that the edges which were still being tested at commit time
+        get their health stored too.
+        """
+        good_enough = self.get_good_enough()
+        self.decision.check_threshold(good_enough)
+        if self.canary_decision:
+            self.canary_decision.check_threshold(good_enough)
+
+        for edge in self.edge_states:
+            self.store_edge_health(edge)
@@ -12,8 +12,10 @@ import logging
 import datetime
 import copy
 
-from edgemanage.const import FETCH_HISTORY, VALID_MODES, VALID_HEALTHS
+from edgemanage.const import FETCH_HISTORY, FLAP_HISTORY, VALID_MODES, VALID_HEALTHS
+from edgemanage.const import FETCH_TIMEOUT, EWMA_ALPHA, OUTCOME_WINDOW
 from edgemanage.util import open_atomic
+from edgemanage.changepoint import page_hinkley
 import six
 
 ASSUMED_VALS = {
@@ -22,13 +24,33 @@ ASSUMED_VALS = {
     # A dict keyed by timestamps with values of floats containing
     # fetch times - limited to FETCH_HISTORY items
     "fetch_times": {},
+    # A dict keyed by the same timestamps as fetch_times, holding the
+    # individual samples behind each fetch time when configured to keep
+    # them
+    "raw_samples": {},
     # A dict keyed by timestamps which keeps an average of fetch times
     # for FETCH_HISTORY days
     "historical_average": {},
+    # Exponentially weighted average of successful fetch times
+    "ewma_fetch_time": None,
+    # 1 for each recent fetch that failed, 0 for each that succeeded -
+    # limited to OUTCOME_WINDOW items
+    "outcomes": [],
+    # State of the change-point test run over successful fetch times
+    "change_detector": {},
+    # When the change-point test last detected a rise in fetch times
+    "degrading_since": None,
     "state": "out",
     "mode": "available",
     "health": "pass",
     "state_entry_time": None,
+    # Relative capacity of the edge, set by edge_conf
+    "capacity": 1.0,
+    # When the edge was last taken out of rotation
+    "rotation_exit_time": None,
+    # Timestamps of the most recent times the edge left pass_threshold
+    # or started failing - limited to FLAP_HISTORY items
+    "flap_times": [],
     # A comment created by edge_conf when changing state
     "comment": "",
 }
@@ -49,6 +71,9 @@ class EdgeState(object):
 
         self.edgename = edgename
         self.nowrite = nowrite
+        # Callbacks taking (edgename, field, value), called when the
+        # mode, health or state changes
+        self.listeners = []
         self.statfile = os.path.join(store_dir, "%s.edgestore" % edgename)
         if os.path.isfile(self.statfile) and os.path.getsize(self.statfile) != 0:
             with open(self.statfile) as statfile_f:
@@ -96,6 +121,14 @@ class EdgeState(object):
             json.dump(output, statfile_f, sort_keys=True, indent=4)
         os.chmod(self.statfile, 0o644)
 
+    def add_listener(self, listener):
+        ''' Call listener(edgename, field, value) whenever mode, health or state changes '''
+        self.listeners.append(listener)
+
+    def _notify(self, field, value):
+        for listener in self.listeners:
+            listener(self.edgename, field, value)
+
     def set_comment(self, comment):
         ''' Set comments for edge (display in edge list) '''
         self.comment = comment
@@ -114,8 +147,11 @@ class EdgeState(object):
         else:
             if self.health != health:
                 logging.debug("Setting health for edge %s to %s", self.edgename, health)
+                if self.health == "pass_threshold" or health == "fail":
+                    self.flap_times = (self.flap_times + [time.time()])[-FLAP_HISTORY:]
                 self.health = health
                 self._dump()
+                self._notify("health", health)
 
     def set_state(self, state):
         ''' Set the state of the edge - in or out '''
@@ -123,8 +159,11 @@ class EdgeState(object):
             raise ValueError("State must be either in or out, not %s", state)
         else:
             if self.state != state:
+                if self.state == "in":
+                    self.rotation_exit_time = time.time()
                 self.state = state
                 self._dump()
+                self._notify("state", state)
 
     def set_mode(self, mode):
         ''' Set the mode of the edge '''
@@ -136,11 +175,26 @@ class EdgeState(object):
                 self.state_entry_time = time.time()
                 self.mode = mode
                 self._dump()
+                self._notify("mode", mode)
+
+    def set_capacity(self, capacity):
+        ''' Set the relative capacity of the edge '''
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive, not %s" % capacity)
+        if self.capacity != capacity:
+            self.capacity = capacity
+            self._dump()
 
     def current_average(self):
         ''' Return an average of the current live set of values '''
         return sum(self.fetch_times.values())/len(self.fetch_times)
 
+    def failure_rate(self):
+        ''' Return the share of recent fetches that failed '''
+        if not self.outcomes:
+            return 0
+        return float(sum(self.outcomes))/len(self.outcomes)
+
     def __len__(self):
         ''' Return the number of values for fetch times we have '''
         return len(self.fetch_times)
@@ -168,10 +222,13 @@ class EdgeState(object):
         self.rotation_history.append(time.time())
         self._dump()
 
-    def add_value(self, new_value, timestamp=None):
+    def add_value(self, new_value, timestamp=None, samples=None):
         '''Add a new value to the fetch times store and check if we
         need to make a historical average
 
+        samples: optional list of the individual fetch times that
+        new_value was aggregated from
+
         '''
 
         if timestamp:
@@ -183,6 +240,19 @@ class EdgeState(object):
         # here. It's stupid. Need to fix this in future versions with
         # migration path for old state files.
         self.fetch_times[str(the_time)] = new_value
+        if samples:
+            self.raw_samples[str(the_time)] = samples
+
+        failed = new_value == FETCH_TIMEOUT
+        self.outcomes = (self.outcomes + [int(failed)])[-OUTCOME_WINDOW:]
+        if not failed:
+            if self.ewma_fetch_time is None:
+                self.ewma_fetch_time = new_value
+            else:
+                self.ewma_fetch_time += EWMA_ALPHA * (new_value - self.ewma_fetch_time)
+            if page_hinkley(self.change_detector, new_value):
+                logging.info("Fetch times of edge %s have shifted upwards", self.edgename)
+                self.degrading_since = the_time
 
         # prune our values if there's too many of them
         if len(self.fetch_times) > FETCH_HISTORY:
@@ -191,6 +261,7 @@ class EdgeState(object):
                           "fetch cache being over %d items",
                           min_value, self.fetch_times[min_value], FETCH_HISTORY)
             del(self.fetch_times[min_value])
+            self.raw_samples.pop(min_value, None)
 
         the_time_datetime = datetime.datetime.utcfromtimestamp(the_time)
         if the_time_datetime.minute == 0:
@@ -5,9 +5,15 @@ Object to perform edge fetch test
 # stdlib
 from __future__ import absolute_import
 import six.moves.urllib.parse
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import errno
 import hashlib
 import logging
+import random
+import selectors
 import socket
+import time
 
 # local
 from edgemanage import const
@@ -16,7 +22,6 @@ from edgemanage import const
 import requests
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
-from six.moves import range
 
 # Make requests stop logging so much. I love you but you need to shut
 # up.
@@ -27,6 +32,14 @@ urllib3.disable_warnings(InsecureRequestWarning)
 
 USER_AGENT = "Edgemanage v2 (https://github.com/equalitie/edgemanage)"
 
+# The outcome of testing a single edge: the fetch time used for
+# decisions, a status string for failed fetches, the individual sample
+# times when more than one sample was taken and the seconds the test
+# waited for a worker, if known
+FetchResult = collections.namedtuple("FetchResult",
+                                     ["value", "status", "samples", "queue_delay"])
+FetchResult.__new__.__defaults__ = (None,)
+
 
 class FetchFailed(Exception):
     def __init__(self, edgetest, fetch_host, fetch_object, reason):
@@ -53,64 +66,246 @@ class VerifyFailed(Exception):
         self.fetch_object = fetch_object
 
 
+def aggregate_samples(samples, method="median"):
+    """
+    Combine several fetch times for one edge into a single value, using
+    either the median or a mean with SAMPLE_TRIM of the samples dropped
+    from each end.
+    """
+    ordered = sorted(samples)
+    if method == "median":
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2.0
+    elif method == "trimmed_mean":
+        trim = int(len(ordered) * const.SAMPLE_TRIM)
+        if trim:
+            ordered = ordered[trim:-trim]
+        return sum(ordered) / len(ordered)
+    else:
+        raise ValueError("Unknown sample aggregation method %s" % method)
+
+
+def resolve(edgename):
+    """ The IPv4 address of an edge, without a lookup if it is one already """
+    try:
+        socket.inet_aton(edgename)
+    except socket.error:
+        return socket.gethostbyname(edgename)
+    return edgename
+
+
+def resolve_edges(edgenames):
+    """
+    Dict of the edges that could be resolved to their IPv4 addresses.
+    Names are looked up in TCP_PRECHECK_RESOLVERS threads, so that slow
+    lookups don't hold up one another.
+    """
+    def try_resolve(edgename):
+        try:
+            return resolve(edgename)
+        except socket.error as e:
+            logging.error("Failed to resolve %s for the TCP pre-check: %s", edgename, str(e))
+            return None
+
+    with ThreadPoolExecutor(max_workers=const.TCP_PRECHECK_RESOLVERS) as executor:
+        addresses = zip(edgenames, executor.map(try_resolve, edgenames))
+        return collections.OrderedDict((edgename, edge_ip) for edgename, edge_ip in addresses
+                                       if edge_ip)
+
+
+def tcp_precheck(edgenames, port, timeout=None):
+    """
+    Open non-blocking TCP connections to the given edges and return the
+    set of edges that accepted the connection within `timeout` seconds
+    of it being opened. At most TCP_PRECHECK_BATCH connections are open
+    at once to stay within file descriptor limits, and another is
+    opened as soon as one completes.
+    """
+    if timeout is None:
+        timeout = const.TCP_PRECHECK_TIMEOUT
+
+    edgenames = list(edgenames)
+    port = int(port)
+    pending = collections.deque(resolve_edges(edgenames).items())
+    selector = selectors.DefaultSelector()
+    # Deadlines of the open connections, in the order they were opened
+    deadlines = collections.OrderedDict()
+    reachable = set()
+    try:
+        while pending or deadlines:
+            while pending and len(deadlines) < const.TCP_PRECHECK_BATCH:
+                edgename, edge_ip = pending.popleft()
+                edge_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                edge_socket.setblocking(False)
+                connect_status = edge_socket.connect_ex((edge_ip, port))
+                if connect_status not in [0, errno.EINPROGRESS, errno.EWOULDBLOCK]:
+                    logging.debug("TCP pre-check connection to %s failed: %s", edgename,
+                                  errno.errorcode.get(connect_status, connect_status))
+                    edge_socket.close()
+                    continue
+                selector.register(edge_socket, selectors.EVENT_WRITE, edgename)
+                deadlines[edge_socket] = time.monotonic() + timeout
+            if not deadlines:
+                continue
+
+            first_deadline = next(iter(deadlines.values()))
+            for key, _ in selector.select(max(0, first_deadline - time.monotonic())):
+                edge_socket = key.fileobj
+                if edge_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    reachable.add(key.data)
+                else:
+                    logging.debug("TCP pre-check connection to %s failed", key.data)
+                selector.unregister(edge_socket)
+                del deadlines[edge_socket]
+                edge_socket.close()
+
+            now = time.monotonic()
+            for edge_socket, deadline in list(deadlines.items()):
+                if deadline > now:
+                    break
+                logging.debug("TCP pre-check connection to %s timed out",
+                              selector.get_key(edge_socket).data)
+                selector.unregister(edge_socket)
+                del deadlines[edge_socket]
+                edge_socket.close()
+    finally:
+        for edge_socket in deadlines:
+            edge_socket.close()
+        selector.close()
+
+    logging.info("TCP pre-check: %d of %d edges accepted a connection on port %d",
+                 len(reachable), len(edgenames), port)
+    return reachable
+
+
 class EdgeTest(object):
 
-    def __init__(self, edgename, local_sum):
+    def __init__(self, edgename, local_sum, deadline=None, budget=None, retries=None):
         """
          edgename: FQDN string of the edge to be tested
          local_sum: the pre-computed known checksum of the object to be fetched
+         deadline: optional time.monotonic() value that no fetch may run past
+         budget: seconds a fetch may take including retries, defaults to FETCH_TIMEOUT
+         retries: number of attempts on connection errors, defaults to FETCH_RETRY
         """
 
         self.edgename = edgename
         self.local_sum = local_sum
+        self.deadline = deadline
+        self.budget = budget
+        self.retries = retries
+
+    def get_fetch_deadline(self):
+        """
+         The time.monotonic() value at which a fetch starting now must
+         give up, honouring both the per-fetch budget and the overall
+         deadline
+        """
+        budget = self.budget or const.FETCH_TIMEOUT
+        fetch_deadline = time.monotonic() + budget
+        if self.deadline:
+            fetch_deadline = min(fetch_deadline, self.deadline)
+        return fetch_deadline
 
-    def make_request(self, fetch_host, fetch_object, proto, port, verify):
+    def backoff(self, attempt, fetch_deadline):
         """
-         make HTTP request via `requests`
+         Sleep before retrying, with exponential backoff and full jitter,
+         without sleeping past fetch_deadline
         """
-        edge_ip = socket.gethostbyname(self.edgename)
+        delay = random.uniform(0, const.FETCH_RETRY_BACKOFF * 2 ** attempt)
+        time.sleep(max(0, min(delay, fetch_deadline - time.monotonic())))
+
+    def make_request(self, fetch_host, fetch_object, proto, port, verify, timeout=None):
+        """
+         make HTTP request via `requests`, leaving the body to be read
+         with `read_body`
+        """
+        if timeout is None:
+            timeout = const.FETCH_TIMEOUT
+
+        edge_ip = resolve(self.edgename)
         logging.info("Resolving %s to %s", self.edgename, edge_ip)
 
         with OverrideDNS(fetch_host, edge_ip):
             request_url = six.moves.urllib.parse.urljoin(
                 proto + "://" + fetch_host + ":" + str(port), fetch_object)
-            return requests.get(request_url, verify=verify, timeout=const.FETCH_TIMEOUT,
-                                headers={"User-Agent": USER_AGENT})
+            return requests.get(request_url, verify=verify, timeout=timeout,
+                                headers={"User-Agent": USER_AGENT}, stream=True)
+
+    def read_body(self, response, fetch_deadline):
+        """
+         The body of a streamed response, or None if it can't be read
+         by fetch_deadline. The timeout of `requests` only bounds each
+         read, so an edge sending a byte at a time could otherwise hold
+         a worker for as long as it likes.
+        """
+        read1 = getattr(response.raw, "read1", None)
+        if read1:
+            chunks = iter(lambda: read1(const.FETCH_CHUNK_SIZE, decode_content=True), b"")
+        else:
+            # urllib3 before 2.1 only returns once a whole chunk is read
+            chunks = response.iter_content(const.FETCH_CHUNK_SIZE)
+
+        body = []
+        try:
+            for chunk in chunks:
+                if time.monotonic() > fetch_deadline:
+                    return None
+                body.append(chunk)
+        except urllib3.exceptions.ReadTimeoutError:
+            return None
+        finally:
+            response.close()
+        if time.monotonic() > fetch_deadline:
+            return None
+        return b"".join(body)
 
     def fetch(self, fetch_host, fetch_object, proto="https", port=80, verify=False):
         """
          fetch_host: The Host header to use when fetching
          fetch_object: The path to the object to be fetched
         """
-        try:
-            response = self.make_request(fetch_host, fetch_object, proto, port, verify)
-        except requests.exceptions.Timeout:
-            # Just assume it took the maximum amount of time
-            return const.FETCH_TIMEOUT
-        except requests.exceptions.ConnectionError as e:
-            logging.error("Connection error when fetching from %s: %s", self.edgename, str(e))
-            for i in range(const.FETCH_RETRY-1):
+        fetch_deadline = self.get_fetch_deadline()
+        retries = self.retries or const.FETCH_RETRY
+        response = None
+        for attempt in range(retries):
+            time_left = fetch_deadline - time.monotonic()
+            if time_left <= 0:
+                break
+            if attempt:
                 logging.warning("Retrying connection to %s", self.edgename)
-                try:
-                    response = self.make_request(fetch_host, fetch_object, proto, port, verify)
-                    # Request was successful, stop retrying and
-                    # continue
-                    break
-                except requests.exceptions.ConnectionError:
-                    continue
-            else:
-                logging.error("Failed to connect to %s after retrying %d times",
-                              self.edgename, const.FETCH_RETRY)
-                # The loop finished without a break - we got more
-                # connection errors. Let's bail and return the maximum
-                # amount of time. for/else is weird.
+            try:
+                response = self.make_request(fetch_host, fetch_object, proto, port, verify,
+                                             timeout=min(time_left, const.FETCH_TIMEOUT))
+                # Request was successful, stop retrying and continue
+                break
+            except requests.exceptions.Timeout:
+                # Just assume it took the maximum amount of time
                 return const.FETCH_TIMEOUT
+            except requests.exceptions.ConnectionError as e:
+                logging.error("Connection error when fetching from %s: %s",
+                              self.edgename, str(e))
+                if attempt + 1 < retries:
+                    self.backoff(attempt, fetch_deadline)
+
+        if response is None:
+            logging.error("Failed to connect to %s after %d attempts", self.edgename, attempt + 1)
+            # We got more connection errors than allowed, or ran out of
+            # time. Let's bail and return the maximum amount of time.
+            return const.FETCH_TIMEOUT
+
+        body = self.read_body(response, fetch_deadline)
+        if body is None:
+            logging.error("Timed out reading the object from %s", self.edgename)
+            return const.FETCH_TIMEOUT
 
         if not response.ok:
             logging.error("Object fetch failed on %s:%s", self.edgename, port)
-            raise FetchFailed(self, fetch_host, fetch_object, response.text)
+            raise FetchFailed(self, fetch_host, fetch_object, body.decode("utf-8", "replace"))
 
-        remote_hash = hashlib.md5(response.content).hexdigest()
+        remote_hash = hashlib.md5(body).hexdigest()
 
         if remote_hash != self.local_sum:
             logging.error("Failed to verify hash on %s!!", self.edgename)
@@ -118,6 +313,33 @@ class EdgeTest(object):
 
         return response.elapsed.total_seconds()
 
+    def fetch_samples(self, count, spacing, fetch_host, fetch_object, proto="https",
+                      port=80, verify=False):
+        """
+         Fetch the object up to `count` times, starting each fetch
+         `spacing` seconds after the previous one started, and return
+         the list of fetch times. Stops early once most of the samples
+         have timed out or the deadline has passed.
+        """
+        samples = []
+        start = time.monotonic()
+        for sample in range(count):
+            if sample:
+                wait = start + sample * spacing - time.monotonic()
+                if self.deadline and time.monotonic() + max(wait, 0) >= self.deadline:
+                    break
+                if wait > 0:
+                    time.sleep(wait)
+
+            samples.append(self.fetch(fetch_host, fetch_object, proto, port, verify))
+
+            if samples.count(const.FETCH_TIMEOUT) > count // 2:
+                # The median would be a timeout whatever the remaining samples are
+                break
+
+        logging.debug("Fetch samples for %s: %s", self.edgename, samples)
+        return samples
+
 
 class OverrideDNS(object):
     """
@@ -0,0 +1,129 @@
+"""
+Notification of changes to the files of a directory, with inotify
+where the C library has it and by polling modification times otherwise
+"""
+
+from __future__ import absolute_import
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+from edgemanage import const
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+# wd, mask, cookie and len of a struct inotify_event, followed by len
+# bytes of NUL padded name
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher(object):
+
+    """
+    Watches a directory with inotify for files that are written, or
+    moved into it as `util.open_atomic` does
+    """
+
+    def __init__(self, directory, suffix=""):
+        self.suffix = suffix
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                  IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "Can't watch %s" % directory)
+
+    def wait(self, timeout=None):
+        """
+        Names of the files changed since the last call, waiting up to
+        timeout seconds for the first change. None if changes were lost
+        and every file should be treated as changed.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                events = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return changed
+                raise
+            offset = 0
+            while offset < len(events):
+                _, mask, _, name_len = EVENT_HEADER.unpack_from(events, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(events[offset:offset + name_len].rstrip(b"\0"))
+                offset += name_len
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if name.endswith(self.suffix):
+                    changed.add(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+
+    """ Watches a directory by comparing modification times every interval seconds """
+
+    def __init__(self, directory, suffix="", interval=const.WATCH_POLL_INTERVAL):
+        self.directory = directory
+        self.suffix = suffix
+        self.interval = interval
+        self.mtimes = self.scan()
+
+    def scan(self):
+        mtimes = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(self.suffix):
+                try:
+                    mtimes[filename] = os.stat(os.path.join(self.directory, filename)).st_mtime
+                except OSError:
+                    # Removed since it was listed
+                    continue
+        return mtimes
+
+    def wait(self, timeout=None):
+        """ Names of the files changed since the last call, as InotifyWatcher.wait """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            mtimes = self.scan()
+            changed = set(filename for filename, mtime in mtimes.items()
+                          if self.mtimes.get(filename) != mtime)
+            self.mtimes = mtimes
+            if changed or (deadline is not None and time.time() >= deadline):
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                time.sleep(max(0, min(self.interval, deadline - time.time())))
+
+    def close(self):
+        pass
+
+
+def watch_directory(directory, suffix="", interval=const.WATCH_POLL_INTERVAL):
+    """ An InotifyWatcher of directory, or a PollingWatcher if inotify isn't available """
+    try:
+        return InotifyWatcher(directory, suffix)
+    except (OSError, AttributeError) as e:
+        # AttributeError: a C library without inotify
+        logging.info("Not using inotify (%s), checking %s every %ss", str(e), directory,
+                     interval)
+        return PollingWatcher(directory, suffix, interval)
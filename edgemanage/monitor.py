@@ -1,6 +1,27 @@
 import socket
-import hashlib
-from prometheus_client import CollectorRegistry, Gauge, write_to_textfile
+
+from prometheus_client import CollectorRegistry, Gauge, Histogram, REGISTRY
+from prometheus_client import start_http_server, write_to_textfile
+
+from edgemanage import const
+
+# Labels of the per-edge metric families
+EDGE_LABELS = ["edge", "dnet", "role"]
+
+
+def check_listen(listen):
+    """
+    Raise OSError if metrics can't be served on `listen` ("address:port"),
+    for example because another edge_manage is already serving there
+    """
+    address, _, port = listen.rpartition(":")
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        # As the HTTP server does, so that connections in TIME_WAIT don't count
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        probe.bind((address or "0.0.0.0", int(port)))
+    finally:
+        probe.close()
 
 
 class SingletonMetaclass(type):
@@ -17,61 +38,160 @@ class SingletonMetaclass(type):
         return cls._instances[cls]
 
 
+class RegistriesCollector(object):
+    """ Collects the metrics of several registries as one """
+
+    def __init__(self, registries):
+        self.registries = registries
+
+    def collect(self):
+        for registry in self.registries:
+            for metric in registry.collect():
+                yield metric
+
+
 class Monitor(metaclass=SingletonMetaclass):
     """
     Prometheus metrics monitor
+
+    Every per-edge value is a metric family such as
+    edgemanage_edge_response_time, labelled with the edge, its dnet and
+    its role (edge or canary). The labelled children of each edge are
+    created once by `set_edges` and kept, so setting a value is a
+    couple of dict lookups.
     """
 
-    # gauges array with key like: edge1_dev_deflect_network_response_time
-    gauges = {}
-    suffixs = [
-        'response_time',
-        'average_time',
-        'timeslice',
-        'reachable_status',
-        'in_rotation',
-    ]
-
-    def __init__(self, edges=None, registry=None):
+    # suffix -> help text of the per-edge gauges
+    suffixs = {
+        'response_time': 'Latest fetch time of the edge in seconds',
+        'average_time': 'Average fetch time of the edge in seconds',
+        'timeslice': 'Average fetch time of the edge over the decision window, '
+                     '-1 without enough data',
+        'reachable_status': '0 if the edge is failing, 1 otherwise',
+        'in_rotation': '1 if the edge is in rotation',
+    }
+
+    # name -> help text of the gauges that aren't tied to an edge
+    global_gauges = {
+        'goodenough_effective': 'Fetch time in seconds under which edges passed this run',
+        'rotation_budget': 'Rotations still allowed in the current dnschange_maxfreq period',
+        'overloaded': '1 if our own overhead was over overhead_limit this run',
+        'rotations_deferred': 'Previously live edges kept in rotation this run because '
+                              'rotation was deferred',
+        'live_capacity': 'Capacity of the live edges',
+        'capacity_shortfall': 'Capacity the live edges fall short of the capacity target by',
+        'probe_queue_delay_median_seconds': 'Median time edge tests waited for a worker '
+                                            'in seconds',
+        'probe_queue_delay_max_seconds': 'Longest time an edge test waited for a worker '
+                                         'in seconds',
+        'scheduling_lag_max_seconds': 'Longest a thread woke up late during the edge tests '
+                                      'in seconds',
+        'loopback_probe_max_seconds': 'Longest fetch time of a loopback test in seconds',
+        'self_overhead_seconds': 'Seconds the fetch times of the run may have been '
+                                 'inflated by our own load',
+    }
+
+    def __init__(self, edges=None, registry=None, dnet=""):
         if registry is None:
-            self.registry = CollectorRegistry()
+            registry = CollectorRegistry()
+        self.registry = registry
+        self.dnet = dnet
+
+        self.families = {}
+        for suffix, documentation in self.suffixs.items():
+            self.families[suffix] = Gauge(f"edgemanage_edge_{suffix}", documentation,
+                                          EDGE_LABELS, registry=self.registry)
+        self.probe_latency = Histogram("edgemanage_probe_latency_seconds",
+                                       "Fetch times of edge tests in seconds",
+                                       ["dnet", "role"], registry=self.registry,
+                                       buckets=const.PROBE_LATENCY_BUCKETS)
+        self.phase_seconds = Histogram("edgemanage_phase_seconds",
+                                       ("Time spent in each phase of a run in seconds, "
+                                        "leaving out the phases nested in it"),
+                                       ["dnet", "phase"], registry=self.registry,
+                                       buckets=const.PHASE_BUCKETS)
+        # Gauges not tied to an edge, created on first use
+        self.gauges = {}
+        # edgename -> (role, {suffix: labelled gauge})
+        self.handles = {}
 
-        # for linter
         if edges is not None:
-            self.create_gauges(edges)
+            self.set_edges(dnet, edges)
+
+    def set_edges(self, dnet, edges, canaries=()):
+        """
+        Set the edges and canaries metrics are kept for. Children are
+        only created for new edges and removed for edges that are gone,
+        so this can be called on every run.
+        """
+        self.dnet = dnet
+        roles = dict((edge, "edge") for edge in edges)
+        roles.update((canary, "canary") for canary in canaries)
+
+        for edge in list(self.handles):
+            if roles.get(edge) != self.handles[edge][0]:
+                self.remove_edge(edge)
+        for edge, role in roles.items():
+            if edge not in self.handles:
+                self.bind(edge, role)
 
     def create_gauges(self, edges):
-        for edge in edges:
-            for suffix in self.suffixs:
-                key = f"{self._format(edge)}_{suffix}"
-                self.gauges[key] = Gauge(key, '', registry=self.registry)
+        """ Create the children of the given edges """
+        self.set_edges(self.dnet, list(self.handles) + list(edges))
+
+    def bind(self, edge, role="edge"):
+        """ Create the labelled children of an edge and return them by suffix """
+        children = {}
+        for suffix, family in self.families.items():
+            children[suffix] = family.labels(edge=edge, dnet=self.dnet, role=role)
+        self.handles[edge] = (role, children)
+        return children
+
+    def remove_edge(self, edge):
+        role, _ = self.handles.pop(edge)
+        for family in self.families.values():
+            family.remove(edge, self.dnet, role)
+
+    def edge_handles(self, edge):
+        """ The labelled gauges of an edge by suffix, or None if it isn't known """
+        if edge in self.handles:
+            return self.handles[edge][1]
+        return None
 
     def set(self, edge, suffix, value):
-        key = f"{self._format(edge)}_{suffix}"
-        if key in self.gauges:
-            self.gauges[key].set(value)
-
-    def _format(self, edge):
-        if self._is_ip(edge):
-            # hash the IP to turn it as a valid metric name
-            # this is usually for test
-            # force a prefix so it always will not start with number
-            return 'md5' + self._md5_short(edge)
-        # Replace . in edge URL so it can be used as a metric name
-        return edge.replace('.', '_')
-
-    def _is_ip(self, target):
-        try:
-            socket.inet_aton(target)
-            return True
-        except socket.error:
-            pass
-        return False
-
-    def _md5_short(self, data):
-        md5 = hashlib.md5()
-        md5.update(data.encode('utf-8'))
-        return md5.hexdigest()[:6]
+        if edge in self.handles:
+            self.handles[edge][1][suffix].set(value)
+
+    def observe_probe(self, edge, value):
+        """ Record the fetch time of an edge test """
+        if edge in self.handles:
+            self.probe_latency.labels(dnet=self.dnet, role=self.handles[edge][0]).observe(value)
+
+    def observe_phase(self, phase, seconds):
+        """ Record the time taken by a phase of a run """
+        self.phase_seconds.labels(dnet=self.dnet, phase=phase).observe(seconds)
+
+    def set_global(self, name, value):
+        """
+        Set a gauge that isn't tied to an edge, created on first use.
+        `name` must be one of `global_gauges`.
+        """
+        if name not in self.gauges:
+            gauge = Gauge(f"edgemanage_{name}", self.global_gauges[name], ["dnet"],
+                          registry=self.registry)
+            self.gauges[name] = gauge
+        self.gauges[name].labels(dnet=self.dnet).set(value)
+
+    def start_http_server(self, listen):
+        """
+        Serve the metrics of this monitor together with the process
+        metrics of the default registry on `listen` ("address:port"),
+        from a background thread
+        """
+        address, _, port = listen.rpartition(":")
+        serving_registry = CollectorRegistry(auto_describe=False)
+        serving_registry.register(RegistriesCollector([self.registry, REGISTRY]))
+        start_http_server(int(port), addr=address or "0.0.0.0", registry=serving_registry)
 
     def write_metrics(self, filepath):
         try:
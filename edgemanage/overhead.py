@@ -0,0 +1,126 @@
+"""
+Measurement of the delays edgemanage adds to its own edge tests
+"""
+
+from __future__ import absolute_import
+from six.moves import BaseHTTPServer, socketserver
+import logging
+import threading
+import time
+
+from edgemanage import const, util
+from edgemanage.monitor import Monitor
+
+
+class LagMonitor(threading.Thread):
+
+    """
+    Thread that sleeps for LAG_INTERVAL seconds at a time and records
+    how much later than asked for it wakes up. The worker threads share
+    the GIL with it, so the lag is an estimate of how long a test thread
+    can wait to read a response that has already arrived.
+    """
+
+    def __init__(self, interval=const.LAG_INTERVAL):
+        super(LagMonitor, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.max_lag = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            self.stopped.wait(self.interval)
+            self.max_lag = max(self.max_lag, time.monotonic() - started - self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class LoopbackServer(object):
+
+    """
+    HTTP server on 127.0.0.1 that serves the test object straight away.
+    It is tested like an edge, so any time its tests take is spent in
+    this host rather than on the network.
+    """
+
+    def __init__(self, body, uri):
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200 if self.path == uri else 404)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        # Poll often, as shutting down waits for the next poll
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={"poll_interval": const.LAG_INTERVAL})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ProbeOverhead(object):
+
+    """
+    The delays edgemanage added to the edge tests of a run: how long
+    tests waited for a worker, how late a sleeping thread woke and how
+    long tests of the loopback server took
+    """
+
+    def __init__(self):
+        self.queue_delays = []
+        self.loopback_times = []
+        self.lag_monitor = LagMonitor()
+        self.lag_monitor.start()
+
+    def add_queue_delay(self, queue_delay):
+        if queue_delay is not None:
+            self.queue_delays.append(queue_delay)
+
+    def add_loopback(self, fetch_time):
+        self.loopback_times.append(fetch_time)
+
+    def stop(self):
+        self.lag_monitor.stop()
+
+    def self_overhead(self):
+        """
+        Seconds that the fetch times of this run may have been inflated
+        by our own load: the largest of the scheduling lag and the
+        loopback test times
+        """
+        return max([self.lag_monitor.max_lag] + self.loopback_times)
+
+    def export(self):
+        """ Set the overhead metrics of the run and log them """
+        monitor = Monitor()
+        queue_delay_median = 0
+        queue_delay_max = 0
+        if self.queue_delays:
+            queue_delay_median = util.percentile(self.queue_delays, 50)
+            queue_delay_max = max(self.queue_delays)
+        monitor.set_global("probe_queue_delay_median_seconds", queue_delay_median)
+        monitor.set_global("probe_queue_delay_max_seconds", queue_delay_max)
+        monitor.set_global("scheduling_lag_max_seconds", self.lag_monitor.max_lag)
+        monitor.set_global("loopback_probe_max_seconds", max(self.loopback_times or [0]))
+        monitor.set_global("self_overhead_seconds", self.self_overhead())
+
+        logging.info("Edge tests waited %.3fs for a worker (median, max %.3fs), threads "
+                     "woke up to %.3fs late and loopback tests took up to %.3fs",
+                     queue_delay_median, queue_delay_max, self.lag_monitor.max_lag,
+                     max(self.loopback_times or [0]))
@@ -0,0 +1,223 @@
+"""
+Executor that shards edge tests across several worker processes, each
+running its own thread pool, so that TLS handshakes and hashing are
+spread over all cores instead of contending for a single GIL.
+"""
+
+from __future__ import absolute_import
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
+import itertools
+import logging
+import multiprocessing
+import threading
+
+from six.moves import queue
+
+from edgemanage import const
+from edgemanage.edgetest import FetchResult
+
+# The pool kept by shared_executor
+_shared_pool = None
+
+
+def _send_result(result_queue, task_id, future):
+    """ Send the outcome of a test back to the coordinator as a compact tuple """
+    if future.cancelled():
+        result_queue.put((task_id, None))
+        return
+
+    try:
+        result = future.result()
+    except Exception:
+        logging.exception("Edge test %d failed in probe process", task_id)
+        result_queue.put((task_id, None))
+        return
+
+    edgename, fetch_result = list(result.items())[0]
+    result_queue.put((task_id, (edgename,) + tuple(fetch_result)))
+
+
+def _shard_main(task_queue, result_queue, workers):
+    """
+    Main loop of a probe process. Runs tests from task_queue in a thread
+    pool until told to stop, sending each result as soon as it is ready.
+    """
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+
+            task_id, func, args = task
+            if func is None:
+                # Cancellation request for a test we were given earlier
+                if task_id in pending:
+                    pending.pop(task_id).cancel()
+                continue
+
+            future = executor.submit(func, *args)
+            pending[task_id] = future
+            future.add_done_callback(functools.partial(_send_result, result_queue, task_id))
+
+
+class ShardFuture(Future):
+    """ A Future that also cancels its test in the probe process """
+
+    def __init__(self, executor, task_id):
+        super(ShardFuture, self).__init__()
+        self.executor = executor
+        self.task_id = task_id
+
+    def cancel(self):
+        cancelled = super(ShardFuture, self).cancel()
+        if cancelled:
+            self.executor.cancel_task(self.task_id)
+        return cancelled
+
+
+class ShardedProbeExecutor(object):
+
+    def __init__(self, processes, workers):
+        """
+        A drop-in replacement for ThreadPoolExecutor when submitting
+        `future_fetch` calls. Tests are distributed round-robin over
+        `processes` worker processes which share `workers` threads
+        between them. Results return over a single queue and are
+        delivered to the Futures returned by `submit`.
+
+        The processes are started from a fork server rather than forked
+        from this process, whose other threads may hold locks such as
+        those of logging at the time of the fork. A process that dies
+        fails the tests it was given and is replaced.
+        """
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn")
+        self.processes_count = processes
+        self.workers = workers
+        self.workers_per_process = max(1, -(-workers // processes))
+        self.stopping = False
+
+        self.result_queue = self.context.Queue()
+        self.task_queues = []
+        self.processes = []
+        for _ in range(processes):
+            task_queue, process = self._start_process()
+            self.task_queues.append(task_queue)
+            self.processes.append(process)
+        logging.info("Started %d probe processes with %d workers each",
+                     processes, self.workers_per_process)
+
+        self.futures = {}
+        # Held while submitting or cancelling tests and while replacing
+        # a process, so that no test is queued for a dead process
+        self.futures_lock = threading.Lock()
+        self.task_ids = itertools.count()
+        self.reader = threading.Thread(target=self._read_results)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _start_process(self):
+        """ Start a probe process, returning its task queue and the process """
+        task_queue = self.context.Queue()
+        process = self.context.Process(target=_shard_main,
+                                       args=(task_queue, self.result_queue,
+                                             self.workers_per_process))
+        process.daemon = True
+        process.start()
+        return task_queue, process
+
+    def _shard(self, task_id):
+        return task_id % len(self.processes)
+
+    def submit(self, func, *args):
+        """ Queue func(*args) in one of the probe processes """
+        task_id = next(self.task_ids)
+        future = ShardFuture(self, task_id)
+        with self.futures_lock:
+            self.futures[task_id] = future
+            self.task_queues[self._shard(task_id)].put((task_id, func, args))
+        return future
+
+    def cancel_task(self, task_id):
+        """ Ask the probe process to drop a test if it hasn't started yet """
+        with self.futures_lock:
+            self.task_queues[self._shard(task_id)].put((task_id, None, None))
+
+    def _replace_dead_processes(self):
+        """ Fail the tests of every probe process that has died and start another """
+        for shard, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            with self.futures_lock:
+                lost = [(task_id, self.futures.pop(task_id)) for task_id in list(self.futures)
+                        if self._shard(task_id) == shard]
+                self.task_queues[shard], self.processes[shard] = self._start_process()
+            logging.error("Probe process %s exited with status %s, failing its %d edge tests",
+                          process.pid, process.exitcode, len(lost))
+            for task_id, future in lost:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(RuntimeError("Edge test %d was lost" % task_id))
+
+    def _read_results(self):
+        while True:
+            try:
+                message = self.result_queue.get(timeout=const.PROBE_PROCESS_CHECK_INTERVAL)
+            except queue.Empty:
+                # Every result sent by a process that has died has been
+                # read by now, so its remaining tests are lost
+                if not self.stopping:
+                    self._replace_dead_processes()
+                elif not any(process.is_alive() for process in self.processes):
+                    return
+                continue
+
+            task_id, record = message
+            with self.futures_lock:
+                future = self.futures.pop(task_id, None)
+            if future is None:
+                # Already failed along with a process that died
+                continue
+
+            # Cancelled futures are only marked done here so that
+            # as_completed sees them, as ThreadPoolExecutor would
+            if not future.set_running_or_notify_cancel():
+                continue
+            if record is None:
+                future.set_exception(RuntimeError("Edge test %d was lost" % task_id))
+            else:
+                future.set_result({record[0]: FetchResult(*record[1:])})
+
+    def shutdown(self, wait=True):
+        self.stopping = True
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        if wait:
+            for process in self.processes:
+                process.join()
+            self.reader.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown(wait=True)
+        return False
+
+
+def shared_executor(processes, workers):
+    """
+    A ShardedProbeExecutor kept for the life of this process, so that
+    runs in daemon mode don't start new probe processes every cycle.
+    It is replaced if the number of processes or workers changes.
+    """
+    global _shared_pool
+    if (_shared_pool is not None and
+            (_shared_pool.processes_count, _shared_pool.workers) != (processes, workers)):
+        _shared_pool.shutdown(wait=False)
+        _shared_pool = None
+    if _shared_pool is None:
+        _shared_pool = ShardedProbeExecutor(processes, workers)
+    return _shared_pool
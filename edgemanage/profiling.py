@@ -0,0 +1,103 @@
+"""
+Timing and profiling of edge_manage runs
+"""
+
+from __future__ import absolute_import
+from collections import OrderedDict
+from contextlib import contextmanager
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+
+from edgemanage.monitor import Monitor
+
+
+class CycleTimer(object):
+
+    """
+    Times the phases of a run with a monotonic clock. Phases can be
+    nested, and the time of a phase leaves out the phases inside it, so
+    that the phases add up to no more than the run. Every phase is
+    recorded in the edgemanage_phase_seconds histogram as it ends.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        # phase -> total seconds, in the order the phases first ended
+        self.durations = OrderedDict()
+        # [phase, start, seconds in nested phases] of the phases that
+        # are running, innermost last
+        self.running = []
+
+    def start(self, name):
+        """ Start timing a phase inside the current one """
+        self.running.append([name, time.monotonic(), 0])
+
+    def stop(self):
+        """ Stop timing the innermost phase """
+        name, started, nested = self.running.pop()
+        elapsed = time.monotonic() - started
+        if self.running:
+            self.running[-1][2] += elapsed
+        self.durations[name] = self.durations.get(name, 0) + elapsed - nested
+        Monitor().observe_phase(name, elapsed - nested)
+
+    def switch(self, name):
+        """ Stop the innermost phase and start the next one in its place """
+        self.stop()
+        self.start(name)
+
+    @contextmanager
+    def phase(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def total(self):
+        return time.monotonic() - self.started
+
+    def summary(self):
+        """ One line summary of the run for the log """
+        return "run took %.3fs: %s" % (self.total(), ", ".join(
+            "%s %.3fs" % (name, duration) for name, duration in self.durations.items()))
+
+
+def profile_call(profile_dir, name, trace_memory, func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) under cProfile and write the stats to
+    <profile_dir>/<name>.pstats, logging the most expensive calls.
+
+    With trace_memory, tracemalloc snapshots from before and after the
+    call are written to <name>-before.tracemalloc and
+    <name>-after.tracemalloc and the largest allocation sites logged.
+    """
+    if not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    profile_path = os.path.join(profile_dir, name)
+
+    if trace_memory:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(profile_path + ".pstats")
+        stats_output = io.StringIO()
+        pstats.Stats(profiler, stream=stats_output).sort_stats("cumulative").print_stats(15)
+        logging.info("Wrote profile to %s.pstats:\n%s", profile_path, stats_output.getvalue())
+
+        if trace_memory:
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            before.dump(profile_path + "-before.tracemalloc")
+            after.dump(profile_path + "-after.tracemalloc")
+            logging.info("Largest allocations during the run:\n%s", "\n".join(
+                str(stat) for stat in after.compare_to(before, "lineno")[:10]))
@@ -0,0 +1,215 @@
+"""
+Read-only JSON API on a Unix socket, served by the edge_manage daemon
+from the state of its last run
+
+    GET /edges              every edge and canary, filtered by the
+                            health, state, mode and role parameters as
+                            in edge_query (health=allpass for all but
+                            failed edges)
+    GET /edges/<edgename>   one edge with its fetch times, limited to
+                            the since and until parameters (unix times)
+    GET /live               the live edges and the last rotation
+
+For example:
+
+    curl --unix-socket /run/edgemanage/mynet.sock http://localhost/edges?health=fail
+"""
+
+from __future__ import absolute_import
+from six.moves import BaseHTTPServer, http_client, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from edgemanage import const
+from edgemanage.registry import EdgeRegistry
+
+# Values accepted for each filter of GET /edges
+FILTERS = {
+    "health": const.VALID_HEALTHS + ["allpass"],
+    "state": ["in", "out"],
+    "mode": const.VALID_MODES,
+    "role": ["edge", "canary"],
+}
+
+
+class QueryError(Exception):
+
+    """ A request that can't be answered, with the HTTP status to send """
+
+    def __init__(self, status, message):
+        super(QueryError, self).__init__(message)
+        self.status = status
+
+
+class FleetView(object):
+
+    """
+    Everything the API answers from, as of one run. A new view is made
+    for every run rather than updating the last one, so requests being
+    answered never see a run half applied.
+    """
+
+    def __init__(self, snapshot, edge_states):
+        self.snapshot = snapshot
+        # The edge states of a run aren't changed once it is over, so
+        # their fetch times can be used without copying them
+        self.fetch_times = dict((edgename, edge_state.fetch_times)
+                                for edgename, edge_state in edge_states.items())
+        self.registry = EdgeRegistry()
+        for edgename, edge in snapshot["edges"].items():
+            self.registry.add(edgename, role=edge["role"], mode=edge["mode"],
+                              health=edge["health"], state=edge["state"],
+                              live=edge["in_rotation"])
+
+    def edge(self, edgename, now):
+        """ Snapshot summary of an edge, without its recent fetch times """
+        edge = dict((field, value) for field, value in self.snapshot["edges"][edgename].items()
+                    if field != "recent")
+        edge["edge"] = edgename
+        if edge["state_entry_time"]:
+            edge["time_since_state_change"] = int(now - edge["state_entry_time"])
+        else:
+            edge["time_since_state_change"] = -1
+        return edge
+
+    def edges(self, query):
+        criteria = {}
+        for field, values in query.items():
+            if field not in FILTERS:
+                raise QueryError(400, "Unknown filter %s" % field)
+            if values[-1] not in FILTERS[field]:
+                raise QueryError(400, "%s must be one of %s" % (field, ", ".join(FILTERS[field])))
+            criteria[field] = values[-1]
+
+        allpass = criteria.get("health") == "allpass"
+        if allpass:
+            del criteria["health"]
+        matches = self.registry.find(**criteria)
+        if allpass:
+            matches -= self.registry.find(health="fail")
+
+        now = time.time()
+        return {
+            "dnet": self.snapshot["dnet"],
+            "generated": self.snapshot["generated"],
+            "edges": [self.edge(edgename, now) for edgename in self.snapshot["edges"]
+                      if edgename in matches],
+        }
+
+    def edge_history(self, edgename, query):
+        if edgename not in self.snapshot["edges"]:
+            raise QueryError(404, "Unknown edge %s" % edgename)
+        try:
+            since = float(query.get("since", [0])[-1])
+            until = float(query.get("until", ["inf"])[-1])
+        except ValueError:
+            raise QueryError(400, "since and until must be unix times")
+
+        edge = self.edge(edgename, time.time())
+        edge["history"] = sorted([float(timestamp), fetch_time] for timestamp, fetch_time
+                                 in self.fetch_times.get(edgename, {}).items()
+                                 if since <= float(timestamp) <= until)
+        return edge
+
+    def live(self):
+        fields = ["dnet", "generated", "good_enough", "live_edges", "live_capacity",
+                  "last_rotation"]
+        return dict((field, self.snapshot[field]) for field in fields)
+
+    def answer(self, url):
+        """ The response to a GET of url """
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        path = parsed.path.rstrip("/")
+        if path == "/edges":
+            return self.edges(query)
+        elif path.startswith("/edges/"):
+            return self.edge_history(path[len("/edges/"):], query)
+        elif path == "/live":
+            return self.live()
+        raise QueryError(404, "Unknown path %s" % parsed.path)
+
+
+class QueryServer(object):
+
+    """
+    Serves the API on a Unix socket from a background thread. `update`
+    is called by edge_manage with the outcome of every run.
+    """
+
+    def __init__(self, socket_path, mode=const.QUERY_SOCKET_MODE):
+        self.socket_path = socket_path
+        self.view = None
+        query_server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                view = query_server.view
+                try:
+                    if view is None:
+                        raise QueryError(503, "No run has completed yet")
+                    status, response = 200, view.answer(self.path)
+                except QueryError as e:
+                    status, response = e.status, {"error": str(e)}
+                body = json.dumps(response, separators=(",", ":")).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        # A socket left behind by an earlier daemon
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.server = Server(socket_path, Handler)
+        # The daemon runs with a umask of 0
+        os.chmod(socket_path, mode)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def update(self, snapshot, edge_states):
+        """ Answer from the snapshot and edge states of a new run """
+        self.view = FleetView(snapshot, edge_states)
+        logging.debug("Query API updated with %d edges", len(snapshot["edges"]))
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.unlink(self.socket_path)
+
+
+class UnixHTTPConnection(http_client.HTTPConnection):
+
+    """ HTTPConnection to a Unix socket instead of a host and port """
+
+    def __init__(self, socket_path, timeout=10):
+        http_client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def query(socket_path, url):
+    """ GET url from the API at socket_path, returning the status and decoded JSON """
+    connection = UnixHTTPConnection(socket_path)
+    try:
+        connection.request("GET", url)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        connection.close()
@@ -0,0 +1,86 @@
+"""
+In-memory index of edges by role, mode, health, state, judgement and
+liveness
+"""
+
+from __future__ import absolute_import
+from collections import defaultdict
+
+# Fields that edges are indexed by. judgement is set by DecisionMaker,
+# live and list_state by EdgeList.
+REGISTRY_FIELDS = ["role", "mode", "health", "state", "judgement", "live", "list_state"]
+
+
+class EdgeRegistry(object):
+
+    """
+    Keeps a set of edge names for every value of every field in
+    REGISTRY_FIELDS, so that finding or counting the edges with a given
+    role, mode, health, state, judgement or liveness doesn't mean
+    scanning every edge.
+
+    Edge states added with `add_edge_state` keep the registry up to date
+    themselves when their mode, health or state is set. `EdgeManage`
+    shares its registry with its `EdgeList` and `DecisionMaker`s, which
+    keep the liveness and judgements of the edges in it.
+    """
+
+    def __init__(self):
+        # edgename -> {field: value}
+        self.edges = {}
+        # field -> value -> set of edgenames
+        self.index = dict((field, defaultdict(set)) for field in REGISTRY_FIELDS)
+
+    def __contains__(self, edgename):
+        return edgename in self.edges
+
+    def __len__(self):
+        return len(self.edges)
+
+    def add(self, edgename, **fields):
+        """ Add an edge, or update the given fields of one already added """
+        if edgename not in self.edges:
+            self.edges[edgename] = dict((field, None) for field in REGISTRY_FIELDS)
+        for field, value in fields.items():
+            self.update(edgename, field, value)
+
+    def add_edge_state(self, edge_state, role="edge"):
+        """ Add an `EdgeState` and follow changes to its mode, health and state """
+        self.add(edge_state.edgename, role=role, mode=edge_state.mode,
+                 health=edge_state.health, state=edge_state.state)
+        edge_state.add_listener(self.update)
+
+    def update(self, edgename, field, value):
+        """ Move an edge to a new value of one of its fields """
+        current = self.edges[edgename][field]
+        if current == value and edgename in self.index[field][value]:
+            return
+        self.index[field][current].discard(edgename)
+        self.index[field][value].add(edgename)
+        self.edges[edgename][field] = value
+
+    def remove(self, edgename):
+        """ Forget an edge """
+        for field, value in self.edges.pop(edgename).items():
+            self.index[field][value].discard(edgename)
+
+    def get(self, edgename, field):
+        """ The value of one field of an edge """
+        return self.edges[edgename][field]
+
+    def find(self, **fields):
+        """ Set of the edges matching all of the given field values """
+        if not fields:
+            return set(self.edges)
+        matches = [self.index[field].get(value, set()) for field, value in fields.items()]
+        return set.intersection(*matches)
+
+    def count(self, field, value):
+        """ Number of edges with the given value of a field """
+        return len(self.index[field].get(value, ()))
+
+    def is_canary(self, edgename):
+        return edgename in self.index["role"].get("canary", ())
+
+    def canaries(self):
+        return self.find(role="canary")
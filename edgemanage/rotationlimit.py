@@ -0,0 +1,46 @@
+"""
+Token bucket limiting how often the live edge set may be rotated
+"""
+
+from __future__ import absolute_import
+import time
+
+from edgemanage import const
+
+
+class RotationLimiter(object):
+
+    def __init__(self, rotation_list, max_rotations, period=const.DNSCHANGE_PERIOD):
+        '''A token bucket holding up to `max_rotations` rotations, refilled
+        at a rate of `max_rotations` per `period` seconds.
+
+        The bucket is rebuilt from the rotation timestamps kept in
+        `StateFile.rotation_list`, so no extra state needs saving.
+        '''
+        self.capacity = float(max_rotations)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = None
+
+        for rotation_time in sorted(rotation_list):
+            self._refill(rotation_time)
+            # Rotations forced through an empty bucket don't leave debt
+            self.tokens = max(self.tokens - 1, 0)
+
+    def _refill(self, now):
+        if self.updated is None:
+            self.updated = now
+        elif now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def available(self, now=None):
+        ''' Number of rotations that could be made right now '''
+        if now is None:
+            now = time.time()
+        self._refill(now)
+        return self.tokens
+
+    def allow(self, now=None):
+        ''' Returns True if a rotation can be made right now '''
+        return self.available(now) >= 1
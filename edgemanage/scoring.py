@@ -0,0 +1,71 @@
+"""
+Scorers used to rank edges within a health tier when choosing which
+edges to make live. Lower scores are better.
+"""
+
+from __future__ import absolute_import
+
+from edgemanage import const
+
+
+class AverageScorer(object):
+
+    """ Rank edges by the average of their whole fetch history """
+
+    def score(self, edge_state):
+        return edge_state.current_average()
+
+
+class CompositeScorer(object):
+
+    """
+    Rank edges by how they are performing now: the exponentially
+    weighted average of their successful fetch times plus a penalty for
+    the share of their recent fetches that failed. Both are kept up to
+    date by `EdgeState.add_value`.
+    """
+
+    def __init__(self, failure_penalty=const.SCORE_FAILURE_PENALTY):
+        self.failure_penalty = failure_penalty
+
+    def score(self, edge_state):
+        latency = edge_state.ewma_fetch_time
+        if latency is None:
+            # No successful fetch since the edge store started keeping
+            # one, fall back to the full average
+            latency = edge_state.current_average()
+        return latency + self.failure_penalty * edge_state.failure_rate()
+
+
+class HeadroomScorer(object):
+
+    """
+    Rank edges by their capacity weighted by how far the score given by
+    `scorer` is under `good_enough`, so that a few large edges with room
+    to spare are picked over many small ones close to the threshold.
+    Edges with the same weighted headroom, such as those over the
+    threshold, are ranked by `scorer`.
+    """
+
+    def __init__(self, scorer, good_enough):
+        self.scorer = scorer
+        self.good_enough = good_enough
+
+    def score(self, edge_state):
+        score = self.scorer.score(edge_state)
+        headroom = max(self.good_enough - score, 0)
+        return (-edge_state.capacity * headroom, score)
+
+
+SCORERS = {
+    "average": AverageScorer,
+    "composite": CompositeScorer,
+}
+
+
+def make_scorer(name):
+    """ Create the scorer registered under `name` """
+    try:
+        return SCORERS[name]()
+    except KeyError:
+        raise ValueError("Unknown scorer %s" % name)
@@ -0,0 +1,73 @@
+"""
+Selection of the edges to put in rotation from the judgements of a
+`DecisionMaker`
+"""
+
+from __future__ import absolute_import
+import heapq
+import itertools
+import logging
+
+from edgemanage import const
+
+
+class EdgeSelector(object):
+
+    """
+    Picks the best edges from a list of candidates, taking every edge
+    judged in the first of `healths` before any in the second and so on,
+    and the edges with the lowest score within each health.
+
+    Candidates are bucketed by health in a single pass and the best of
+    each bucket taken from a heap. Scores are cached, so a selector
+    should be created for every run and can then be used for several
+    selections in it.
+    """
+
+    def __init__(self, decision, scorer, healths=const.SELECTION_HEALTHS):
+        self.decision = decision
+        self.scorer = scorer
+        self.healths = healths
+        self.scores = {}
+
+    def score(self, edgename):
+        """ Score of an edge, worked out once per selector """
+        if edgename not in self.scores:
+            self.scores[edgename] = self.scorer.score(self.decision.edge_states[edgename])
+        return self.scores[edgename]
+
+    def bucket(self, candidates):
+        """ Group candidate edges by their health, dropping unselectable ones """
+        buckets = dict((health, []) for health in self.healths)
+        for edgename in candidates:
+            health = self.decision.get_judgement(edgename)
+            if health in buckets:
+                buckets[health].append(edgename)
+        return buckets
+
+    def ranked(self, candidates):
+        """
+        Generate (edgename, health) tuples for the selectable candidates,
+        best first, for when the number of edges needed isn't known up
+        front. Ties keep the order of `candidates`.
+        """
+        buckets = self.bucket(candidates)
+        for health in self.healths:
+            # The position breaks ties between equal scores, as the
+            # stable sort of sorted() would
+            heap = [(self.score(edgename), position, edgename)
+                    for position, edgename in enumerate(buckets[health])]
+            heapq.heapify(heap)
+            while heap:
+                yield heapq.heappop(heap)[2], health
+
+    def select(self, candidates, count):
+        """
+        Return a list of up to `count` (edgename, health) tuples, best
+        first. Ties keep the order of `candidates`.
+        """
+        if count <= 0:
+            return []
+        chosen = list(itertools.islice(self.ranked(candidates), count))
+        logging.debug("Selected edges: %s", chosen)
+        return chosen
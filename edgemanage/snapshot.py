@@ -0,0 +1,148 @@
+"""
+Compact snapshot of a dnet written by edge_manage every run
+
+Tools that only need the current view of a dnet (edge_query, the nagios
+checks, EdgemanageAdapter) read this one file instead of every edge
+store and the state file, and fall back to those when the snapshot is
+missing or stale.
+
+The nagios checks import this module without the rest of the package,
+so it must only import the standard library and const and util.
+"""
+
+from __future__ import absolute_import
+import json
+import logging
+import os
+import time
+
+from edgemanage import const, util
+
+# Bumped whenever a field is removed or changes meaning. Snapshots of
+# another version are ignored by readers.
+SNAPSHOT_VERSION = 1
+# Fields of an edge that edge_conf can change between runs
+CONF_FIELDS = ["mode", "comment", "capacity"]
+
+
+def snapshot_path(config, dnet):
+    """
+    Path of the snapshot of a dnet: `snapshot` from the config, or
+    <dnet>.snapshot next to the state file
+    """
+    if config.get("snapshot"):
+        return config["snapshot"].format(dnet=dnet)
+    statefile_dir = os.path.dirname(config["statefile"].format(dnet=dnet))
+    return os.path.join(statefile_dir, "%s.snapshot" % dnet)
+
+
+def snapshot_max_age(config):
+    """ Seconds after which a snapshot is too old to be used """
+    return config.get("snapshot_max_age", const.SNAPSHOT_MAX_AGE)
+
+
+def _round(value):
+    if value is None:
+        return None
+    return round(value, 6)
+
+
+def edge_summary(edge_state, role, in_rotation, now, window=const.SNAPSHOT_WINDOW):
+    """
+    Everything a reader needs to know about an edge. Fetch times from
+    the last `window` seconds are kept as [timestamp, fetch time] pairs
+    so that readers can take percentiles over any part of the window.
+    """
+    summary = {
+        "role": role,
+        "mode": edge_state.mode,
+        "state": edge_state.state,
+        "health": edge_state.health,
+        "comment": edge_state.comment,
+        "capacity": edge_state.capacity,
+        "state_entry_time": edge_state.state_entry_time,
+        "in_rotation": in_rotation,
+        "last_fetch": None,
+        "last_value": None,
+        "average": None,
+        "window_average": None,
+        "p50": None,
+        "p90": None,
+        "p99": None,
+        "recent": [],
+    }
+    if not edge_state.fetch_times:
+        return summary
+
+    lower_bound = now - max(window, const.DECISION_SLICE_WINDOW)
+    recent = sorted((float(ts), fetch_time)
+                    for ts, fetch_time in edge_state.fetch_times.items()
+                    if float(ts) >= lower_bound)
+    last_fetch = max(edge_state.fetch_times, key=float)
+    summary["last_fetch"] = float(last_fetch)
+    summary["last_value"] = edge_state.fetch_times[last_fetch]
+    summary["average"] = _round(edge_state.current_average())
+
+    # Averaged over the same window as DecisionMaker.check_threshold
+    slice_values = [fetch_time for ts, fetch_time in recent
+                    if ts >= now - const.DECISION_SLICE_WINDOW]
+    if slice_values:
+        summary["window_average"] = _round(sum(slice_values) / len(slice_values))
+
+    summary["recent"] = [[_round(ts), fetch_time] for ts, fetch_time in recent
+                         if ts >= now - window]
+    window_values = [fetch_time for _, fetch_time in summary["recent"]]
+    if window_values:
+        for percent in [50, 90, 99]:
+            summary["p%d" % percent] = _round(util.percentile(window_values, percent))
+    return summary
+
+
+def write_snapshot(path, snapshot):
+    """ Replace the snapshot at path atomically """
+    with util.open_atomic(path, mode="w") as snapshot_f:
+        json.dump(snapshot, snapshot_f, separators=(",", ":"))
+    os.chmod(path, 0o644)
+
+
+def load_snapshot(path, max_age=const.SNAPSHOT_MAX_AGE):
+    """
+    The snapshot at path, or None if it is missing, unreadable, of
+    another version or older than max_age seconds
+    """
+    try:
+        with open(path) as snapshot_f:
+            snapshot = json.load(snapshot_f)
+    except (IOError, OSError, ValueError) as e:
+        logging.debug("Not using snapshot %s: %s", path, str(e))
+        return None
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        logging.debug("Not using snapshot %s of version %s", path, snapshot.get("version"))
+        return None
+    age = time.time() - snapshot.get("generated", 0)
+    if age > max_age:
+        logging.debug("Not using snapshot %s, it is %d seconds old", path, age)
+        return None
+    return snapshot
+
+
+def update_edge(path, edgename, **fields):
+    """
+    Change CONF_FIELDS of an edge in an existing snapshot, so that
+    changes made by edge_conf show up before the next run
+    """
+    try:
+        with open(path) as snapshot_f:
+            snapshot = json.load(snapshot_f)
+    except (IOError, OSError, ValueError):
+        return False
+    if edgename not in snapshot.get("edges", {}):
+        return False
+
+    for field, value in fields.items():
+        if field not in CONF_FIELDS:
+            raise ValueError("%s can't be changed in a snapshot" % field)
+        snapshot["edges"][edgename][field] = value
+    write_snapshot(path, snapshot)
+    return True
@@ -4,6 +4,7 @@ Global utility functions
 
 from __future__ import absolute_import
 import os
+import math
 import tempfile as tmp
 import fcntl
 from contextlib import contextmanager
@@ -20,6 +21,27 @@ def acquire_lock(lockfile):
     return True
 
 
+def percentile(values, percent):
+    """ Return the given percentile of a list of values, interpolating
+    linearly between the two closest ranks.
+
+    Parameters
+    ----------
+    values : list
+        the values to take the percentile of, must not be empty
+    percent : float
+        percentile between 0 and 100
+    """
+    ordered = sorted(values)
+    if not ordered:
+        raise ValueError("Can't take the percentile of no values")
+
+    rank = (len(ordered) - 1) * percent / 100.0
+    lower = int(math.floor(rank))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
 @contextmanager
 def tempfile(suffix='', dir=None):
     """ Context for temporary file.
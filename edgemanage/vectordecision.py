@@ -0,0 +1,132 @@
+"""
+Decision maker that judges the whole fleet at once with NumPy arrays
+"""
+
+from __future__ import absolute_import
+import logging
+import time
+
+from edgemanage import const
+from edgemanage.decisionmaker import DecisionMaker
+from edgemanage.monitor import Monitor
+
+# Imported by the first VectorDecisionMaker, so that only runs using the
+# vector engine pay for loading numpy
+numpy = None
+
+
+class VectorDecisionMaker(DecisionMaker):
+
+    """
+    A drop-in replacement for `DecisionMaker` that produces the same
+    judgements in a handful of array operations instead of a Python
+    loop over every edge.
+
+    The recent history of every edge (the fetches that can fall inside
+    DECISION_SLICE_WINDOW) is held as an edges x samples array of fetch
+    times with a matching array of timestamps. The last value and the
+    full average of each edge are worked out once, when the edge is
+    added.
+    """
+
+    def __init__(self, registry=None):
+        global numpy
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("The vector decision engine requires numpy")
+        super(VectorDecisionMaker, self).__init__(registry)
+        # edgename -> (recent timestamps, recent values, last value, average)
+        self.edge_rows = {}
+        self.edge_order = []
+        self.arrays = None
+
+    def add_edge_state(self, edge_state):
+        super(VectorDecisionMaker, self).add_edge_state(edge_state)
+
+        # Keep every value recent enough to be inside the slice window
+        # whenever check_threshold is called from now on
+        lower_bound = time.time() - const.DECISION_SLICE_WINDOW
+        recent_stamps = []
+        recent_values = []
+        for ts, fetch_time in edge_state.fetch_times.items():
+            if float(ts) >= lower_bound:
+                recent_stamps.append(float(ts))
+                recent_values.append(fetch_time)
+
+        self.edge_rows[edge_state.edgename] = (recent_stamps, recent_values,
+                                               edge_state.last_value(),
+                                               edge_state.current_average())
+        self.arrays = None
+
+    def _build_arrays(self):
+        """ Stack the per-edge rows into fleet-wide arrays """
+        self.edge_order = list(self.edge_rows)
+        width = max([len(self.edge_rows[edge][0]) for edge in self.edge_order] + [1])
+
+        stamps = numpy.full((len(self.edge_order), width), numpy.nan)
+        values = numpy.zeros((len(self.edge_order), width))
+        for row, edgename in enumerate(self.edge_order):
+            recent_stamps, recent_values = self.edge_rows[edgename][:2]
+            stamps[row, :len(recent_stamps)] = recent_stamps
+            values[row, :len(recent_values)] = recent_values
+
+        last_values = numpy.array([self.edge_rows[edge][2] for edge in self.edge_order])
+        averages = numpy.array([self.edge_rows[edge][3] for edge in self.edge_order])
+        self.arrays = (stamps, values, last_values, averages)
+
+    def check_threshold(self, good_enough):
+        """
+        Check fetch response times for being under the given
+        threshold, applying the same rules in the same order as
+        `DecisionMaker.check_threshold`
+        """
+        if self.edges_disabled or not self.edge_states:
+            return super(VectorDecisionMaker, self).check_threshold(good_enough)
+
+        if self.arrays is None:
+            self._build_arrays()
+        stamps, values, last_values, averages = self.arrays
+
+        upper_bound = time.time()
+        lower_bound = upper_bound - const.DECISION_SLICE_WINDOW
+        # NaN timestamps pad the rows and never compare as in the window
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            in_window = (stamps >= lower_bound) & (stamps <= upper_bound)
+            window_counts = in_window.sum(axis=1)
+            window_averages = numpy.where(in_window, values, 0).sum(axis=1) / window_counts
+        has_window = window_counts > 0
+
+        health_index = numpy.select(
+            [last_values < good_enough,
+             last_values == const.FETCH_TIMEOUT,
+             has_window & (window_averages < good_enough),
+             averages < good_enough],
+            [const.VALID_HEALTHS.index("pass_threshold"),
+             const.VALID_HEALTHS.index("fail"),
+             const.VALID_HEALTHS.index("pass_window"),
+             const.VALID_HEALTHS.index("pass_average")],
+            default=const.VALID_HEALTHS.index("pass"))
+
+        health_counts = numpy.bincount(health_index, minlength=len(const.VALID_HEALTHS))
+        results_dict = dict(zip(const.VALID_HEALTHS, health_counts.tolist()))
+        judgements = [const.VALID_HEALTHS[index] for index in health_index.tolist()]
+        for edgename, judgement in zip(self.edge_order, judgements):
+            self.set_judgement(edgename, judgement)
+
+        timeslices = numpy.where(has_window, window_averages, -1).tolist()
+        fail_index = const.VALID_HEALTHS.index("fail")
+        monitor = Monitor()
+        for edgename, last_value, average, timeslice, index in zip(
+                self.edge_order, last_values.tolist(), averages.tolist(),
+                timeslices, health_index.tolist()):
+            handles = monitor.edge_handles(edgename)
+            if handles is None:
+                continue
+            handles["response_time"].set(last_value)
+            handles["average_time"].set(average)
+            handles["timeslice"].set(timeslice)
+            handles["reachable_status"].set(0 if index == fail_index else 1)
+
+        logging.info("Judged %d edges: %s", len(self.edge_order), results_dict)
+        return self.apply_filters(results_dict, good_enough)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Nagios check for the latency, rotation frequency and verification
+failures of an Edgemanage dnet at once, reading its snapshot a single
+time. Falls back to the edge stores and the state file when the
+snapshot is missing or stale.
+
+The first line of output sums up the three checks with all of their
+performance data, and one line per check follows. The exit status is
+the worst of the three.
+"""
+
+import sys
+import json
+import argparse
+import os.path
+
+import yaml
+
+# Keeps the edgemanage imports to the standard library
+import edgemanage_modules
+from edgemanage.const import CONFIG_PATH, DECISION_SLICE_WINDOW
+from edgemanage.snapshot import load_snapshot, snapshot_max_age, snapshot_path
+
+from check_edgemanage_latency import CheckLatency, DEFAULT_WARN, DEFAULT_CRIT
+from check_edgemanage_rotation import CheckRotation
+from check_edgemanage_integrity import CheckVerification
+
+DEFAULT_PERCENTILE = 90
+
+OUTPUT_LABEL = "EDGEMANAGE"
+STATUS_MAP = {0: "OK",
+              1: "WARN",
+              2: "CRIT",
+              3: "UKNOWN"}
+# Statuses from worst to best
+STATUS_ORDER = [2, 1, 3, 0]
+
+
+def combine(results):
+    """ Multi-line NRPE output and exit status of a list of (name, (status, message)) """
+    worst_status = min((status for _, (status, _) in results), key=STATUS_ORDER.index)
+    summaries = []
+    details = []
+    perf_data = []
+    for name, (status, message) in results:
+        summaries.append("%s %s" % (name, STATUS_MAP[status]))
+        detail, _, perf = message.partition(" | ")
+        details.append(detail)
+        if perf:
+            perf_data.append(perf)
+
+    first_line = "%s %s %s" % (OUTPUT_LABEL, STATUS_MAP[worst_status], ", ".join(summaries))
+    if perf_data:
+        first_line += " | " + " ".join(perf_data)
+    return worst_status, "\n".join([first_line] + details)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Nagios check for Edgemanage latency, rotation '
+                                     'frequency and verification failures.')
+    parser.add_argument("--config", "-c", dest="config_path", action="store",
+                        help="Path to configuration file (defaults to %s)" % CONFIG_PATH,
+                        default=CONFIG_PATH)
+    parser.add_argument("--dnet", "-A", dest="dnet", action="store",
+                        help="Specify DNET (mandatory)", required=True)
+    parser.add_argument("--latency-warn", action="store", dest="latency_warn",
+                        help="Latency to trigger WARN level at",
+                        default=DEFAULT_WARN, type=float)
+    parser.add_argument("--latency-critical", action="store", dest="latency_crit",
+                        help="Latency to trigger CRIT level at",
+                        default=DEFAULT_CRIT, type=float)
+    parser.add_argument("--percentile", "-p", action="store", dest="percentile",
+                        help="Percentile of the fetch times of each edge to check "
+                        "(defaults to %d)" % DEFAULT_PERCENTILE,
+                        default=DEFAULT_PERCENTILE, type=float)
+    parser.add_argument("--window", action="store", dest="window",
+                        help="Seconds of fetch times to take the percentile over (defaults "
+                        "to %d)" % DECISION_SLICE_WINDOW, default=DECISION_SLICE_WINDOW,
+                        type=int)
+    parser.add_argument("--all", "-a", action="store_true", dest="all",
+                        help="Check latency across all hosts, not just the current \"in\" hosts",
+                        default=False)
+    parser.add_argument("--rotation-warn", action="store", dest="rotation_warn",
+                        help="Rotations to trigger WARN level at",
+                        default=4, type=int)
+    parser.add_argument("--rotation-critical", action="store", dest="rotation_crit",
+                        help="Rotations to trigger CRIT level at",
+                        default=8, type=int)
+    parser.add_argument("--integrity-critical", action="store", dest="integrity_crit",
+                        help="Number of failed verifications to set CRIT upon",
+                        default=1, type=int)
+    args = parser.parse_args()
+
+    with open(args.config_path) as config_f:
+        config = yaml.safe_load(config_f.read())
+
+    with open(os.path.join(config["edgelist_dir"], args.dnet)) as edge_f:
+        edge_list = [ i.strip() for i in edge_f.read().split("\n") if i.strip() and not i.startswith("#") ]
+
+    state_info = load_snapshot(snapshot_path(config, args.dnet), snapshot_max_age(config))
+    snapshot = state_info
+    if state_info is None:
+        # Read the state file once for both the rotation and integrity checks
+        with open(config["statefile"].format(dnet=args.dnet)) as state_f:
+            state_info = json.loads(state_f.read())
+
+    latency = CheckLatency(config["healthdata_store"], edge_list, args.all, snapshot=snapshot,
+                           percentile=args.percentile, window=args.window)
+    rotation = CheckRotation(None, snapshot=state_info)
+    integrity = CheckVerification(None, snapshot=state_info)
+
+    status, message = combine([
+        ("latency", latency.check_rotation(args.latency_warn, args.latency_crit)),
+        ("rotation", rotation.check_rotation(args.rotation_warn, args.rotation_crit)),
+        ("integrity", integrity.check_rotation(None, args.integrity_crit)),
+    ])
+    print(message)
+    sys.exit(status)
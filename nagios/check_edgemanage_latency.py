@@ -8,7 +8,11 @@ import os.path
 
 import yaml
 
-from edgemanage.const import CONFIG_PATH
+# Keeps the edgemanage imports to the standard library
+import edgemanage_modules
+from edgemanage.const import CONFIG_PATH, DECISION_SLICE_WINDOW
+from edgemanage.snapshot import load_snapshot, snapshot_max_age, snapshot_path
+from edgemanage.util import percentile
 
 DEFAULT_CRIT = 2.0
 DEFAULT_WARN = 4.0
@@ -21,9 +25,33 @@ STATUS_MAP = {0: "OK",
 
 class CheckLatency(object):
 
-    def __init__(self, edgehealth_dir, edge_list, check_all=False, verbose=False):
+    def __init__(self, edgehealth_dir, edge_list, check_all=False, verbose=False, snapshot=None,
+                 percentile=None, window=DECISION_SLICE_WINDOW):
+        # Without a percentile, the latest fetch time of each edge is checked
         self.latency_map = {}
         self.now = time.time()
+        self.percentile = percentile
+        self.window = window
+
+        if snapshot and percentile is not None and window > snapshot["window"]:
+            # The snapshot doesn't keep fetch times that far back
+            snapshot = None
+
+        if snapshot:
+            # The snapshot has the recent fetch times of every edge already
+            for edge_name in edge_list:
+                edge = snapshot["edges"].get(edge_name)
+                if edge is None or edge["last_value"] is None:
+                    continue
+                if not check_all and edge["state"] != "in":
+                    continue
+                if percentile is None:
+                    self.latency_map[edge_name] = edge["last_value"]
+                else:
+                    self.add_percentile(edge_name, [fetch_value for fetch_ts, fetch_value
+                                                    in edge["recent"]
+                                                    if fetch_ts >= self.now - window])
+            return
 
         for edge_name in edge_list:
             with open(os.path.join(edgehealth_dir, "%s.edgestore" % edge_name)) as health_f:
@@ -36,33 +64,45 @@ class CheckLatency(object):
                     # if we're not explicitly checking all, then only check hosts that are in.
                     continue
 
-                latest_fetch_time = sorted(health_json["fetch_times"].keys())[-1]
-                self.latency_map[edge_name] = health_json["fetch_times"][latest_fetch_time]
+                if percentile is None:
+                    latest_fetch_time = max(health_json["fetch_times"], key=float)
+                    self.latency_map[edge_name] = health_json["fetch_times"][latest_fetch_time]
+                else:
+                    self.add_percentile(edge_name, [fetch_value for fetch_ts, fetch_value
+                                                    in health_json["fetch_times"].items()
+                                                    if float(fetch_ts) >= self.now - window])
+
+    def add_percentile(self, edge_name, fetch_values):
+        # Edges without fetches in the window aren't judged
+        if fetch_values:
+            self.latency_map[edge_name] = percentile(fetch_values, self.percentile)
 
     def check_rotation(self, warn, crit):
         worst_latency = None
         nagios_status = 0
-        edge_name = None
+        worst_edge = None
         for edge_name, fetch_value in self.latency_map.items():
-            if not worst_latency or fetch_value > worst_latency:
+            if worst_latency is None or fetch_value > worst_latency:
                 worst_latency = fetch_value
-                edge_name = edge_name
-        if not worst_latency:
-            nagios_message = "No fetch data!"
-            nagios_status = 3
-        elif worst_latency >= crit:
+                worst_edge = edge_name
+
+        if worst_edge is None:
+            return (3, "%s %s no edgemanage data for time window" % (OUTPUT_LABEL,
+                                                                    STATUS_MAP[3]))
+        if worst_latency >= crit:
             nagios_status = 2
         elif worst_latency >= warn:
             nagios_status = 1
-        nagios_message = "Slowest active edge responded in %f" % worst_latency
+        if self.percentile is None:
+            nagios_message = "Slowest active edge responded in %f" % worst_latency
+        else:
+            nagios_message = "Slowest active edge had a p%g of %f over %d seconds" % (
+                self.percentile, worst_latency, self.window)
 
-        if edge_name:
-            return (nagios_status, "%s %s %s | slowestactive=%f edge=%s" % (OUTPUT_LABEL,
+        return (nagios_status, "%s %s %s | slowestactive=%f edge=%s" % (OUTPUT_LABEL,
                                                                    STATUS_MAP[nagios_status],
                                                                    nagios_message, worst_latency,
-                                                                   edge_name))
-        else:
-            return (3, "no edgemanage data for time window")
+                                                                   worst_edge))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Nagios check for Edgemanage fetch latency.')
@@ -78,6 +118,13 @@ if __name__ == "__main__":
     parser.add_argument("--all", "-a", action="store_true", dest="all",
                         help="Check latency across all hosts, not just the current \"in\" hosts",
                         default=False)
+    parser.add_argument("--percentile", "-p", action="store", dest="percentile",
+                        help="Check this percentile of the fetch times of each edge over "
+                        "--window instead of the latest one", default=None, type=float)
+    parser.add_argument("--window", action="store", dest="window",
+                        help="Seconds of fetch times to take --percentile over (defaults "
+                        "to %d)" % DECISION_SLICE_WINDOW, default=DECISION_SLICE_WINDOW,
+                        type=int)
     parser.add_argument("--verbose", "-v", dest="verbose", action="store_true",
                         help="Verbose output", default=False)
     parser.add_argument("--dnet", "-A", dest="dnet", action="store",
@@ -93,7 +140,9 @@ if __name__ == "__main__":
     with open(os.path.join(config["edgelist_dir"], args.dnet)) as edge_f:
         edge_list = [ i.strip() for i in edge_f.read().split("\n") if i.strip() and not i.startswith("#") ]
 
-    c = CheckLatency(config["healthdata_store"], edge_list, args.all, verbose=args.verbose)
+    snapshot = load_snapshot(snapshot_path(config, args.dnet), snapshot_max_age(config))
+    c = CheckLatency(config["healthdata_store"], edge_list, args.all, verbose=args.verbose,
+                     snapshot=snapshot, percentile=args.percentile, window=args.window)
     status, message = c.check_rotation(args.warn, args.crit)
     print(message)
     sys.exit(status)
@@ -4,6 +4,10 @@ import time
 import json
 import argparse
 
+# Keeps the edgemanage imports to the standard library
+import edgemanage_modules
+from edgemanage.snapshot import load_snapshot
+
 # Period in minutes
 ROTATION_PERIOD=10
 
@@ -15,9 +19,14 @@ STATUS_MAP = {0: "OK",
 
 class CheckRotation(object):
 
-    def __init__(self, state_file):
-        with open(state_file) as state_f:
-            self.state_info = json.loads(state_f.read())
+    def __init__(self, state_file, snapshot_file=None, snapshot=None):
+        # The snapshot holds the same rotation data as the state file
+        self.state_info = snapshot
+        if self.state_info is None and snapshot_file:
+            self.state_info = load_snapshot(snapshot_file)
+        if self.state_info is None:
+            with open(state_file) as state_f:
+                self.state_info = json.loads(state_f.read())
 
     def check_rotation(self, warn, crit):
         time_now = time.time()
@@ -54,9 +63,12 @@ if __name__ == "__main__":
     parser.add_argument("--critical", "-c", action="store", dest="crit",
                         help="Latency to trigger CRIT level at",
                         default=8, type=int)
+    parser.add_argument("--snapshot", "-s", action="store", dest="snapshot",
+                        help="Path to the edgemanage snapshot of the dnet, read instead "
+                        "of the state file when it is recent", default=None)
     args = parser.parse_args()
 
-    c = CheckRotation(args.statefile[0])
+    c = CheckRotation(args.statefile[0], args.snapshot)
     status, message = c.check_rotation(args.warn, args.crit)
     print(message)
     sys.exit(status)
@@ -22,6 +22,10 @@ setup(
         "six",
         "prometheus_client"
     ],
+    extras_require={
+        # Needed for decision_engine: vector
+        "vector": ["numpy"],
+    },
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Intended Audience :: Developers",
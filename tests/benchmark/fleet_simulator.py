@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""
+Asyncio HTTP server that simulates a fleet of thousands of edges on
+loopback for benchmarking edge_manage
+
+A single listener on 0.0.0.0 accepts connections for every address in
+127.0.0.0/8, and the address a connection was made to picks the edge
+that answers it. Every edge belongs to a behaviour class from the fleet
+file, which sets its latency distribution, jitter and how often it
+refuses connections, sends its body slowly or serves the wrong object.
+"""
+from __future__ import absolute_import
+import argparse
+import asyncio
+import logging
+import random
+import resource
+import socket
+import struct
+
+import yaml
+
+handler = logging.StreamHandler()
+handler.setFormatter(
+    logging.Formatter(fmt="%(asctime)s [%(levelname)s]: %(message)s")
+)
+logger = logging.getLogger('fleet_simulator')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# First address of the edges and the canaries of a simulated fleet
+EDGE_NETWORK = "127.1.0.0"
+CANARY_NETWORK = "127.2.0.0"
+
+# Default behaviour of a class, overridden by the fleet file
+DEFAULT_BEHAVIOUR = {
+    # Share of the edges and canaries in the class
+    "share": 1.0,
+    # constant (median), uniform (low, high) or lognormal (median, sigma)
+    "latency": {"distribution": "constant", "median": 0.0},
+    # Uniform noise of up to +/- jitter seconds added to every response
+    "jitter": 0.0,
+    # Probability that a connection is reset as soon as it is accepted
+    "refuse": 0.0,
+    # Seconds to spread sending the body over, in slow_body_chunks pieces
+    "slow_body": 0.0,
+    "slow_body_chunks": 10,
+    # Probability that the body doesn't match the test object
+    "wrong_hash": 0.0,
+}
+
+
+def fleet_addresses(network, count):
+    """
+    `count` loopback addresses from `network` upwards, skipping the
+    addresses ending in .0 and .255
+    """
+    base = struct.unpack("!I", socket.inet_aton(network))[0]
+    addresses = []
+    offset = 0
+    while len(addresses) < count:
+        offset += 1
+        if (base + offset) & 0xff in (0, 255):
+            continue
+        addresses.append(socket.inet_ntoa(struct.pack("!I", base + offset)))
+    return addresses
+
+
+def load_fleet(fleet_path):
+    """ Load a fleet file, filling in the defaults of each class """
+    with open(fleet_path) as fleet_file:
+        fleet = yaml.safe_load(fleet_file.read())
+
+    classes = {}
+    for name, behaviour in fleet["classes"].items():
+        classes[name] = dict(DEFAULT_BEHAVIOUR)
+        classes[name].update(behaviour)
+    fleet["classes"] = classes
+    fleet.setdefault("seed", 0)
+    fleet.setdefault("canaries", 0)
+    fleet.setdefault("options", {})
+    return fleet
+
+
+def assign_classes(fleet):
+    """
+    Map the address of every edge and canary to its behaviour class.
+    Classes are dealt out by share and shuffled with the fleet's seed,
+    so a fleet file always produces the same fleet.
+    """
+    rand = random.Random(fleet["seed"])
+    names = list(fleet["classes"])
+    total_share = float(sum(fleet["classes"][name]["share"] for name in names))
+
+    assignment = {}
+    for network, count in [(EDGE_NETWORK, fleet["edges"]),
+                           (CANARY_NETWORK, fleet["canaries"])]:
+        dealt = []
+        for name in names:
+            dealt.extend([name] * int(round(count * fleet["classes"][name]["share"] /
+                                            total_share)))
+        # Rounding can leave the deal a little short or long
+        dealt = (dealt + [names[-1]] * count)[:count]
+        rand.shuffle(dealt)
+        assignment.update(zip(fleet_addresses(network, count), dealt))
+    return assignment
+
+
+class SimulatedEdge(object):
+
+    """ The behaviour of one edge, drawing from its own random stream """
+
+    def __init__(self, address, class_name, behaviour, seed):
+        self.address = address
+        self.class_name = class_name
+        self.behaviour = behaviour
+        self.rand = random.Random("%s-%s" % (seed, address))
+
+    def delay(self):
+        latency = self.behaviour["latency"]
+        distribution = latency.get("distribution", "constant")
+        if distribution == "constant":
+            delay = latency["median"]
+        elif distribution == "uniform":
+            delay = self.rand.uniform(latency["low"], latency["high"])
+        elif distribution == "lognormal":
+            delay = latency["median"] * self.rand.lognormvariate(0, latency["sigma"])
+        else:
+            raise ValueError("Unknown latency distribution %s" % distribution)
+
+        jitter = self.behaviour["jitter"]
+        return max(0, delay + self.rand.uniform(-jitter, jitter))
+
+    def refuses(self):
+        return self.rand.random() < self.behaviour["refuse"]
+
+    def wrong_hash(self):
+        return self.rand.random() < self.behaviour["wrong_hash"]
+
+
+class FleetSimulator(object):
+
+    def __init__(self, fleet, test_object):
+        self.edges = {}
+        for address, class_name in assign_classes(fleet).items():
+            self.edges[address] = SimulatedEdge(address, class_name,
+                                                fleet["classes"][class_name], fleet["seed"])
+        self.body = test_object
+        # Same length as the test object, so only the hash gives it away
+        self.wrong_body = bytes([test_object[0] ^ 0xff]) + test_object[1:]
+        self.served = 0
+        self.refused = 0
+
+    async def handle(self, reader, writer):
+        address = writer.get_extra_info("sockname")[0]
+        edge = self.edges.get(address)
+        try:
+            if edge is not None and edge.refuses():
+                # Close with a RST, as a host that isn't listening would
+                self.refused += 1
+                writer.get_extra_info("socket").setsockopt(
+                    socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                return
+
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1]
+            if edge is None or path != b"/test_object":
+                await self.respond(writer, b"404 Not Found", b"Unknown edge or object\n")
+                return
+
+            await asyncio.sleep(edge.delay())
+            body = self.wrong_body if edge.wrong_hash() else self.body
+            await self.respond(writer, b"200 OK", body, edge.behaviour["slow_body"],
+                               edge.behaviour["slow_body_chunks"])
+            self.served += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, body, slow_body=0, chunks=1):
+        writer.write(b"HTTP/1.1 " + status + b"\r\n"
+                     b"Content-Type: application/octet-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n"
+                     b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n")
+        if not slow_body:
+            writer.write(body)
+            await writer.drain()
+            return
+
+        chunk_size = max(1, -(-len(body) // chunks))
+        for start in range(0, len(body), chunk_size):
+            writer.write(body[start:start + chunk_size])
+            await writer.drain()
+            await asyncio.sleep(float(slow_body) / chunks)
+
+    def serve(self, port):
+        """ Serve the fleet on port until interrupted """
+        loop = asyncio.get_event_loop()
+        server = loop.run_until_complete(
+            asyncio.start_server(self.handle, "0.0.0.0", port,
+                                 backlog=socket.SOMAXCONN, reuse_address=True))
+        logger.info("Simulating %d edges", len(self.edges))
+        logger.info("Fleet simulator running")
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+
+
+def raise_file_limit():
+    """ Allow as many open connections as the hard limit permits """
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Simulate a fleet of edges on loopback for benchmarking EdgeManage.'
+    )
+    parser.add_argument('--fleet', required=True,
+                        help='YAML file describing the simulated fleet.')
+    parser.add_argument('--test-object', default='../test_data/edge_test_object.txt',
+                        help='Test file to serve from the edges (default: %(default)s).')
+    parser.add_argument('--port', type=int, default=5000,
+                        help='Port to listen on (default: %(default)s).')
+    args = parser.parse_args()
+
+    raise_file_limit()
+    with open(args.test_object, 'rb') as test_object_file:
+        simulator = FleetSimulator(load_fleet(args.fleet), test_object_file.read())
+    try:
+        simulator.serve(args.port)
+    except KeyboardInterrupt:
+        logger.info("Served %d responses, refused %d connections",
+                    simulator.served, simulator.refused)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks of the functions that dominate an edge_manage run as
+fleets and fetch histories grow
+
+Every benchmark is run over each fleet size and history length asked
+for and reports the best time per call out of several repeats. Results
+can be saved as a baseline and later runs compared against it, showing
+the speedup (above 1) or slowdown (below 1) of every benchmark.
+
+Run from the top level directory, for example:
+
+    python tests/benchmark/micro_benchmarks.py --save baseline.json
+    python tests/benchmark/micro_benchmarks.py --baseline baseline.json
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, TOP_DIR)
+
+import edgemanage  # noqa: E402
+from edgemanage.monitor import Monitor  # noqa: E402
+
+GOOD_ENOUGH = 0.7
+# Seconds between the seeded fetches of an edge
+FETCH_INTERVAL = 60
+DNS_CONFIG = {
+    "ns_records": ["dns1.example.com.", "dns2.example.com."],
+    "soa_mailbox": "zone.example.com.",
+    "soa_nameserver": "dns0.example.com.",
+    "rotate_zones": ["www"],
+}
+
+
+def seed_store(store_dir, edgenames, history, rand):
+    """
+    Write `history` fetch times a minute apart, ending now, to the store
+    of every edge. A few are timeouts, as in a real store.
+    """
+    now = time.time()
+    for edgename in edgenames:
+        edge_state = edgemanage.EdgeState(edgename, store_dir)
+        for index in range(history):
+            if rand.random() < 0.02:
+                value = edgemanage.const.FETCH_TIMEOUT
+            else:
+                value = rand.lognormvariate(-2, 0.5)
+            edge_state.fetch_times[str(now - (history - index) * FETCH_INTERVAL)] = value
+        edge_state._dump()
+
+
+class Fixture(object):
+
+    """ Store directory seeded with `edges` edges of `history` fetches each """
+
+    def __init__(self, edges, history):
+        # EdgeState prunes to the FETCH_HISTORY it imported, as in test_edgestate
+        edgemanage.edgestate.FETCH_HISTORY = history
+        self.store_dir = tempfile.mkdtemp()
+        self.edgenames = ["127.1.%d.%d" % divmod(number, 250) for number in range(edges)]
+        seed_store(self.store_dir, self.edgenames, history, random.Random(edges * history))
+
+    def load(self, edgename=None):
+        return edgemanage.EdgeState(edgename or self.edgenames[0], self.store_dir)
+
+    def decision_maker(self, engine=edgemanage.DecisionMaker):
+        decision = engine()
+        for edgename in self.edgenames:
+            decision.add_edge_state(self.load(edgename))
+        return decision
+
+    def bind_monitor(self):
+        """ Create the gauges of every edge, so that judging sets them as in a run """
+        Monitor().set_edges("benchmark", self.edgenames)
+
+    def close(self):
+        Monitor().set_edges("benchmark", [])
+        shutil.rmtree(self.store_dir)
+        edgemanage.edgestate.FETCH_HISTORY = edgemanage.const.FETCH_HISTORY
+
+
+def bench_add_value(fixture, edges):
+    """ EdgeState.add_value on an edge whose history is full """
+    edge_state = fixture.load()
+    timestamps = iter(range(int(time.time()) + 1, int(time.time()) + 10 ** 9))
+    return lambda: edge_state.add_value(0.1, timestamp=next(timestamps))
+
+
+def bench_init(fixture, edges):
+    """ EdgeState.__init__ parsing a full store """
+    return fixture.load
+
+
+def bench_dump(fixture, edges):
+    """ EdgeState._dump writing a full store """
+    return fixture.load()._dump
+
+
+def bench_edge_state_slice(fixture, edges):
+    """ DecisionMaker.edge_state_slice of a full store """
+    decision = edgemanage.DecisionMaker()
+    edge_state = fixture.load()
+    return lambda: decision.edge_state_slice(edge_state)
+
+
+def bench_check_threshold(fixture, edges):
+    """ DecisionMaker.check_threshold over every edge """
+    decision = fixture.decision_maker()
+    fixture.bind_monitor()
+    return lambda: decision.check_threshold(GOOD_ENOUGH)
+
+
+def bench_check_threshold_vector(fixture, edges):
+    """ VectorDecisionMaker.check_threshold over every edge """
+    from edgemanage.vectordecision import VectorDecisionMaker
+    decision = fixture.decision_maker(VectorDecisionMaker)
+    fixture.bind_monitor()
+    return lambda: decision.check_threshold(GOOD_ENOUGH)
+
+
+def bench_decide_vector(fixture, edges):
+    """
+    VectorDecisionMaker.add_edge_state of every loaded edge followed by
+    check_threshold, the whole decision of a run with the vector engine
+    """
+    from edgemanage.vectordecision import VectorDecisionMaker
+    edge_states = [fixture.load(edgename) for edgename in fixture.edgenames]
+    fixture.bind_monitor()
+
+    def decide():
+        decision = VectorDecisionMaker()
+        for edge_state in edge_states:
+            decision.add_edge_state(edge_state)
+        decision.check_threshold(GOOD_ENOUGH)
+    return decide
+
+
+def bench_generate_zone(fixture, edges):
+    """ EdgeList.generate_zone for one zone per edge, with four live edges """
+    zonefile_dir = os.path.join(fixture.store_dir, "zones")
+    os.mkdir(zonefile_dir)
+    with open(os.path.join(TOP_DIR, "tests/test_data/test.com.zone")) as template_f:
+        template = template_f.read()
+    domains = ["site%d.example.com" % number for number in range(edges)]
+    for domain in domains:
+        with open(os.path.join(zonefile_dir, "%s.zone" % domain), "w") as zone_f:
+            zone_f.write(template)
+
+    edgelist = edgemanage.EdgeList()
+    for edgename in fixture.edgenames[:4]:
+        edgelist.add_edge(edgename, live=True)
+
+    def generate_zones():
+        for domain in domains:
+            edgelist.generate_zone(domain, zonefile_dir, DNS_CONFIG, serial_number=1)
+    return generate_zones
+
+
+# name -> (setup returning the callable to time, varies with fleet size,
+#          varies with history length)
+BENCHMARKS = {
+    "add_value": (bench_add_value, False, True),
+    "init": (bench_init, False, True),
+    "dump": (bench_dump, False, True),
+    "edge_state_slice": (bench_edge_state_slice, False, True),
+    "check_threshold": (bench_check_threshold, True, True),
+    "check_threshold_vector": (bench_check_threshold_vector, True, True),
+    "decide_vector": (bench_decide_vector, True, True),
+    "generate_zone": (bench_generate_zone, True, False),
+}
+
+
+def time_call(func, repeat):
+    """ Best seconds per call of func over `repeat` timing runs """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_benchmarks(names, fleet_sizes, history_lengths, repeat):
+    """ Run the benchmarks, returning "name[edges=..,history=..]" -> seconds per call """
+    results = {}
+    for name in names:
+        setup, by_edges, by_history = BENCHMARKS[name]
+        for edges in (fleet_sizes if by_edges else fleet_sizes[:1]):
+            for history in (history_lengths if by_history else history_lengths[:1]):
+                parameters = []
+                if by_edges:
+                    parameters.append("edges=%d" % edges)
+                if by_history:
+                    parameters.append("history=%d" % history)
+                key = "%s[%s]" % (name, ",".join(parameters))
+
+                fixture = Fixture(edges if by_edges else 1, history)
+                try:
+                    results[key] = time_call(setup(fixture, edges), repeat)
+                finally:
+                    fixture.close()
+                print("%-45s %12.3f ms" % (key, results[key] * 1000))
+                sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, regression_ratio):
+    """
+    Print the speedup of every result against the baseline, returning
+    the benchmarks whose speedup is under regression_ratio
+    """
+    regressions = []
+    print("\n%-45s %12s %12s %8s" % ("benchmark", "baseline ms", "current ms", "speedup"))
+    for key, seconds in sorted(results.items()):
+        if key not in baseline:
+            continue
+        speedup = baseline[key] / seconds
+        flag = ""
+        if speedup < regression_ratio:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print("%-45s %12.3f %12.3f %7.2fx%s" % (key, baseline[key] * 1000, seconds * 1000,
+                                                speedup, flag))
+    return regressions
+
+
+def parse_sizes(sizes):
+    """ Type for argparse to read a comma separated list of sizes """
+    return [int(size) for size in sizes.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Micro-benchmarks of the EdgeState, DecisionMaker and EdgeList hot paths.'
+    )
+    parser.add_argument('--edges', type=parse_sizes, default=[100, 1000],
+                        help='Comma separated fleet sizes (default: 100,1000).')
+    parser.add_argument('--history', type=parse_sizes,
+                        default=[100, edgemanage.const.FETCH_HISTORY],
+                        help='Comma separated history lengths (default: 100,%d).' %
+                        edgemanage.const.FETCH_HISTORY)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                        help='Run only this benchmark, can be repeated.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timing runs per benchmark, the best is kept '
+                        '(default: %(default)s).')
+    parser.add_argument('--save',
+                        help='Write the results to this JSON file as a baseline.')
+    parser.add_argument('--baseline',
+                        help='Compare the results against this JSON file and exit with '
+                        'status 1 if any benchmark regressed.')
+    parser.add_argument('--regression-ratio', type=float, default=0.8,
+                        help='Speedup under which a benchmark has regressed '
+                        '(default: %(default)s).')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    results = run_benchmarks(args.only or sorted(BENCHMARKS), args.edges, args.history,
+                             args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(results, save_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            if compare(results, json.load(baseline_file), args.regression_ratio):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
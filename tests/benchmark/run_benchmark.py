@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+Benchmark edge_manage end to end against a simulated fleet
+
+Starts fleet_simulator.py with a fleet file, runs edge_manage against
+it for a number of cycles and reports for each cycle the wall time,
+peak RSS, number of files written and number of syscalls. Syscalls are
+counted with strace when it is installed, otherwise only the read and
+write syscalls reported in /proc/<pid>/io are counted.
+
+Run from the top level directory, for example:
+
+    python tests/benchmark/run_benchmark.py --fleet tests/benchmark/fleets/mixed-2000.yaml
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pexpect
+import yaml
+
+from fleet_simulator import CANARY_NETWORK, EDGE_NETWORK, fleet_addresses, load_fleet
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+TOP_DIR = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+DNET_NAME = 'bench'
+SIMULATOR_PORT = 5000
+# Seconds between samples of /proc/<pid>/io while edge_manage runs
+IO_SAMPLE_INTERVAL = 0.05
+
+
+def write_config(data_dir, fleet, options):
+    """
+    Write an edge_manage config, edge list and canary file for the fleet
+    to data_dir, based on the default config
+    """
+    with open(os.path.join(TOP_DIR, 'conf/edgemanage.yaml')) as default_conf:
+        config = yaml.safe_load(default_conf.read())
+
+    config['testobject']['proto'] = 'http'
+    config['testobject']['port'] = str(SIMULATOR_PORT)
+    config['testobject']['uri'] = '/test_object'
+    config['testobject']['local'] = os.path.join(TOP_DIR, 'tests/test_data/edge_test_object.txt')
+    config['testing'] = True
+
+    for directory in ['health', 'edges', 'canaries', 'named', 'prom']:
+        os.mkdir(os.path.join(data_dir, directory))
+    config['healthdata_store'] = os.path.join(data_dir, 'health')
+    config['edgelist_dir'] = os.path.join(data_dir, 'edges')
+    config['canary_files'] = os.path.join(data_dir, 'canaries/{dnet}')
+    config['named_dir'] = os.path.join(data_dir, 'named')
+    config['prometheus_logs'] = os.path.join(data_dir, 'prom/')
+    config['statefile'] = os.path.join(data_dir, '{dnet}.state')
+    config['live_list'] = os.path.join(data_dir, 'edges.{dnet}.live')
+    config['logpath'] = os.path.join(data_dir, 'edgemanage.log')
+    config['lockfile'] = os.path.join(data_dir, 'edgemanage.lock')
+    config['commands'] = {}
+
+    with open(os.path.join(config['edgelist_dir'], DNET_NAME), 'w') as edge_file:
+        for address in fleet_addresses(EDGE_NETWORK, fleet['edges']):
+            edge_file.write('%s\n' % address)
+    with open(os.path.join(data_dir, 'canaries', DNET_NAME), 'w') as canary_file:
+        for number, address in enumerate(fleet_addresses(CANARY_NETWORK, fleet['canaries'])):
+            canary_file.write('canary%d.com: %s\n' % (number + 1, address))
+
+    config.update(fleet['options'])
+    config.update(options)
+    config_path = os.path.join(data_dir, 'edgemanage.conf')
+    with open(config_path, 'w') as config_file:
+        config_file.write(yaml.dump(config, default_flow_style=False))
+    return config_path
+
+
+def read_io_syscalls(pid):
+    """ Read and write syscalls made by a process so far, or None once it is gone """
+    try:
+        with open('/proc/%d/io' % pid) as io_file:
+            counters = dict(line.split(': ') for line in io_file.read().splitlines())
+    except (IOError, OSError):
+        return None
+    return int(counters['syscr']) + int(counters['syscw'])
+
+
+def read_strace_total(strace_path):
+    """ Total number of syscalls from an strace -c summary """
+    with open(strace_path) as strace_file:
+        for line in strace_file:
+            fields = line.split()
+            if fields and fields[-1] == 'total':
+                # seconds, usecs/call (may be blank), calls, errors, total
+                return int(next(field for field in fields[1:] if '.' not in field))
+    return None
+
+
+def count_files_written(data_dir, since):
+    """ Files under data_dir created or modified since `since` """
+    written = 0
+    for root, _, filenames in os.walk(data_dir):
+        for filename in filenames:
+            if os.stat(os.path.join(root, filename)).st_mtime >= since:
+                written += 1
+    return written
+
+
+def run_cycle(edge_manage, config_path, data_dir, strace_path=None):
+    """ Run edge_manage once and return the measurements of the run """
+    # --force, as the cycles run back to back rather than run_frequency apart
+    command = [edge_manage, '-A', DNET_NAME, '--config', config_path, '--force']
+    strace_output = None
+    if strace_path:
+        strace_output = os.path.join(data_dir, 'strace.out')
+        command = [strace_path, '-f', '-c', '-o', strace_output] + command
+
+    # Whole seconds, as some filesystems have coarse modification times
+    started_file_time = int(time.time())
+    started = time.monotonic()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    io_syscalls = None
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        io_syscalls = read_io_syscalls(process.pid) or io_syscalls
+        time.sleep(IO_SAMPLE_INTERVAL)
+    wall_time = time.monotonic() - started
+    # Stop Popen from trying to reap the process again
+    if os.WIFEXITED(status):
+        process.returncode = os.WEXITSTATUS(status)
+    else:
+        process.returncode = -os.WTERMSIG(status)
+
+    if strace_output:
+        syscalls = read_strace_total(strace_output)
+        os.unlink(strace_output)
+    else:
+        syscalls = io_syscalls
+
+    return {
+        'exit_status': process.returncode,
+        'wall_time': wall_time,
+        'peak_rss_kb': rusage.ru_maxrss,
+        'files_written': count_files_written(data_dir, started_file_time),
+        'syscalls': syscalls,
+    }
+
+
+def summarise(cycles):
+    """ Median of every measurement over the cycles """
+    summary = {}
+    for key in ['wall_time', 'peak_rss_kb', 'files_written', 'syscalls']:
+        values = [cycle[key] for cycle in cycles if cycle[key] is not None]
+        summary[key] = statistics.median(values) if values else None
+    return summary
+
+
+def print_report(fleet_path, syscall_source, cycles, summary):
+    print("Fleet: %s" % fleet_path)
+    print("Syscalls counted with: %s" % syscall_source)
+    row_format = "%-8s %10s %14s %14s %12s"
+    print(row_format % ("cycle", "wall (s)", "peak RSS (KB)", "files written", "syscalls"))
+    for number, cycle in enumerate(cycles, 1):
+        print(row_format % (number, "%.3f" % cycle['wall_time'], cycle['peak_rss_kb'],
+                            cycle['files_written'], cycle['syscalls']))
+    print(row_format % ("median", "%.3f" % summary['wall_time'], summary['peak_rss_kb'],
+                        summary['files_written'], summary['syscalls']))
+
+
+def parse_option(option):
+    """ Type for argparse to read KEY=VALUE with a YAML value """
+    key, separator, value = option.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError("%s is not KEY=VALUE" % option)
+    return key, yaml.safe_load(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark edge_manage end to end against a simulated fleet of edges.'
+    )
+    parser.add_argument('--fleet', required=True,
+                        help='YAML file describing the simulated fleet.')
+    parser.add_argument('--cycles', type=int, default=3,
+                        help='Number of edge_manage runs to measure (default: %(default)s).')
+    parser.add_argument('--option', type=parse_option, action='append', default=[],
+                        dest='options', metavar='KEY=VALUE',
+                        help='Override an edge_manage config option, can be repeated.')
+    parser.add_argument('--edge-manage', default=shutil.which('edge_manage') or 'edge_manage',
+                        help='edge_manage executable to benchmark (default: %(default)s).')
+    parser.add_argument('--no-strace', action='store_true',
+                        help='Count syscalls from /proc/<pid>/io even if strace is installed.')
+    parser.add_argument('--output',
+                        help='Also write the measurements to this JSON file.')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the data directory of the runs.')
+    args = parser.parse_args()
+
+    fleet = load_fleet(args.fleet)
+    strace_path = None if args.no_strace else shutil.which('strace')
+    syscall_source = 'strace' if strace_path else '/proc/<pid>/io (read and write only)'
+
+    data_dir = tempfile.mkdtemp(prefix='edgemanage-benchmark-')
+    config_path = write_config(data_dir, fleet, dict(args.options))
+    simulator = pexpect.spawn(sys.executable, ['fleet_simulator.py', '--fleet',
+                                               os.path.abspath(args.fleet),
+                                               '--port', str(SIMULATOR_PORT)],
+                              cwd=BENCHMARK_DIR, timeout=60)
+    cycles = []
+    try:
+        simulator.expect("Fleet simulator running")
+        for _ in range(args.cycles):
+            cycle = run_cycle(args.edge_manage, config_path, data_dir, strace_path)
+            if cycle['exit_status'] != 0:
+                # Keep the log of the failed run
+                args.keep = True
+                sys.exit("edge_manage exited with status %d, see %s/edgemanage.log" % (
+                    cycle['exit_status'], data_dir))
+            cycles.append(cycle)
+    finally:
+        simulator.terminate(force=True)
+        if not args.keep:
+            shutil.rmtree(data_dir)
+
+    summary = summarise(cycles)
+    print_report(args.fleet, syscall_source, cycles, summary)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'fleet': args.fleet, 'syscall_source': syscall_source,
+                       'cycles': cycles, 'median': summary}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
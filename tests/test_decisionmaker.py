@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 
 from __future__ import absolute_import
+import os
+import subprocess
+import sys
+import time
 import unittest
 
 from .context import edgemanage
 
 from .test_edgestate import EdgeStateTemplate
+from edgemanage.vectordecision import VectorDecisionMaker
 
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TEST_EDGE = "testedge1"
 GOOD_ENOUGH = 1.0
 
@@ -39,6 +45,7 @@ class DecisionMakerTest(EdgeStateTemplate):
         dm.add_edge_state(es)
         self.assertEqual(dm.check_threshold(GOOD_ENOUGH), {'fail': 1,
                                                            'pass_threshold': 0,
+                                                           'degrading': 0,
                                                            'pass_window': 0,
                                                            'pass_average': 0,
                                                            'pass': 0})
@@ -49,6 +56,7 @@ class DecisionMakerTest(EdgeStateTemplate):
         dm.add_edge_state(es)
         self.assertEqual(dm.check_threshold(GOOD_ENOUGH), {'fail': 0,
                                                            'pass_threshold': 1,
+                                                           'degrading': 0,
                                                            'pass_window': 0,
                                                            'pass_average': 0,
                                                            'pass': 0})
@@ -59,6 +67,7 @@ class DecisionMakerTest(EdgeStateTemplate):
         dm.add_edge_state(es)
         self.assertEqual(dm.check_threshold(GOOD_ENOUGH), {'fail': 0,
                                                            'pass_threshold': 0,
+                                                           'degrading': 0,
                                                            'pass_window': 0,
                                                            'pass_average': 0,
                                                            'pass': 1})
@@ -69,15 +78,148 @@ class DecisionMakerTest(EdgeStateTemplate):
         dm.add_edge_state(es)
         self.assertEqual(dm.check_threshold(GOOD_ENOUGH), {'fail': 1,
                                                            'pass_threshold': 0,
+                                                           'degrading': 0,
                                                            'pass_window': 0,
                                                            'pass_average': 0,
                                                            'pass': 0})
 
+    def test_vector_engine_matches(self):
+        try:
+            vdm = VectorDecisionMaker()
+        except ImportError:
+            self.skipTest("numpy is not installed")
+
+        self._make_store()
+        dm = edgemanage.decisionmaker.DecisionMaker()
+        now = time.time()
+        histories = {
+            # last value under good_enough
+            "threshold": [GOOD_ENOUGH * 3, GOOD_ENOUGH / 2],
+            # last value timed out
+            "fail": [GOOD_ENOUGH / 2, edgemanage.const.FETCH_TIMEOUT],
+            # recent values average under good_enough
+            "window": [GOOD_ENOUGH * 1.5, GOOD_ENOUGH / 10, GOOD_ENOUGH * 1.2],
+            # only old values are fast
+            "average": [GOOD_ENOUGH / 10, GOOD_ENOUGH / 10, GOOD_ENOUGH * 1.5],
+            "pass": [GOOD_ENOUGH * 3, GOOD_ENOUGH * 2],
+        }
+        for edgename, values in histories.items():
+            es = edgemanage.edgestate.EdgeState(edgename, self.store_dir)
+            for index, value in enumerate(values):
+                if edgename == "average" and index < 2:
+                    timestamp = now - edgemanage.const.DECISION_SLICE_WINDOW * 2 + index
+                else:
+                    timestamp = now - len(values) + index
+                es.add_value(value, timestamp=timestamp)
+            dm.add_edge_state(es)
+            vdm.add_edge_state(es)
+
+        results = dm.check_threshold(GOOD_ENOUGH)
+        self.assertEqual(vdm.check_threshold(GOOD_ENOUGH), results)
+        self.assertEqual(vdm.current_judgement, dm.current_judgement)
+        self.assertEqual(results, {'fail': 1, 'pass_threshold': 1, 'degrading': 0,
+                                   'pass_window': 1, 'pass_average': 1, 'pass': 1})
+
+    def _damped_judgement(self, es, **damping):
+        dm = edgemanage.decisionmaker.DecisionMaker()
+        dm.add_filter(edgemanage.damping.FlapDamper(damping))
+        dm.add_edge_state(es)
+        dm.check_threshold(GOOD_ENOUGH)
+        return dm.get_judgement(es.edgename)
+
+    def test_damping_enter_threshold(self):
+        es = self._make_store()
+        es.add_value(GOOD_ENOUGH * 0.9)
+        self.assertEqual(self._damped_judgement(es, enter_factor=0.8), "pass_window")
+        self.assertEqual(self._damped_judgement(es, enter_factor=1.0), "pass_threshold")
+
+    def test_damping_exit_threshold(self):
+        es = self._make_store()
+        es.add_value(GOOD_ENOUGH * 1.1)
+        es.set_state("in")
+        self.assertEqual(self._damped_judgement(es, exit_factor=1.25), "pass_threshold")
+        self.assertEqual(self._damped_judgement(es, exit_factor=1.0), "pass")
+
+    def test_damping_min_dwell(self):
+        es = self._get_good_enough_edge_state()
+        es.set_state("in")
+        es.set_state("out")
+        self.assertEqual(self._damped_judgement(es, min_dwell=300), "pass_window")
+        self.assertEqual(self._damped_judgement(es, min_dwell=0), "pass_threshold")
+
+    def test_damping_penalty(self):
+        es = self._get_good_enough_edge_state()
+        es.set_health("pass_threshold")
+        es.set_health("pass")
+        es.set_health("pass_threshold")
+        es.set_health("fail")
+        self.assertEqual(len(es.flap_times), 2)
+        self.assertEqual(self._damped_judgement(es, suppress=1.5), "pass_window")
+        self.assertEqual(self._damped_judgement(es, suppress=3.0), "pass_threshold")
+
+    def test_change_point_degrading(self):
+        es = self._make_store()
+        now = time.time()
+        for index in range(20):
+            es.add_value(GOOD_ENOUGH / 10, timestamp=now - 40 + index)
+        self.assertIsNone(es.degrading_since)
+        # Still under the threshold, but consistently slower than before
+        for index in range(5):
+            es.add_value(GOOD_ENOUGH / 2, timestamp=now - 20 + index)
+        self.assertIsNotNone(es.degrading_since)
+
+        dm = edgemanage.decisionmaker.DecisionMaker()
+        dm.add_filter(edgemanage.changepoint.ChangePointFilter(hold=900))
+        dm.add_edge_state(es)
+        results = dm.check_threshold(GOOD_ENOUGH)
+        self.assertEqual(results['degrading'], 1)
+        self.assertEqual(dm.get_judgement(es.edgename), "degrading")
+
+        dm = edgemanage.decisionmaker.DecisionMaker()
+        dm.add_filter(edgemanage.changepoint.ChangePointFilter(hold=0))
+        dm.add_edge_state(es)
+        dm.check_threshold(GOOD_ENOUGH)
+        self.assertEqual(dm.get_judgement(es.edgename), "pass_threshold")
+
+    def test_change_point_ignores_noise(self):
+        es = self._make_store()
+        now = time.time()
+        values = [0.1, 0.12, 0.09, 0.11, 0.1, 0.13, 0.08, 0.4] * 10
+        for index, value in enumerate(values):
+            es.add_value(value, timestamp=now - len(values) + index)
+        self.assertIsNone(es.degrading_since)
+
+    def test_change_point_ignores_spike(self):
+        es = self._make_store()
+        now = time.time()
+        for index in range(100):
+            es.add_value(0.2, timestamp=now - 120 + index)
+        # One fetch that nearly timed out is an outlier, not a shift
+        es.add_value(edgemanage.const.FETCH_TIMEOUT - 0.1, timestamp=now - 20)
+        for index in range(10):
+            es.add_value(0.2, timestamp=now - 10 + index)
+        self.assertIsNone(es.degrading_since)
+
+        dm = edgemanage.decisionmaker.DecisionMaker()
+        dm.add_filter(edgemanage.changepoint.ChangePointFilter(hold=900))
+        dm.add_edge_state(es)
+        dm.check_threshold(GOOD_ENOUGH)
+        self.assertEqual(dm.get_judgement(es.edgename), "pass_threshold")
+
     # def test_judgement(self):
     #    dm = DecisionMaker()
     #    passing_edge_state = _get_passing_edge_state()
     #    failing_edge_state = _get_failing_edge_state()
 
 
+class VectorEngineImportTest(unittest.TestCase):
+
+    def test_numpy_not_imported(self):
+        # Only the vector engine should pay for loading numpy
+        script = "import sys, edgemanage; print('numpy' in sys.modules)"
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=TOP_DIR)
+        self.assertEqual(output.strip(), b"False")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -10,10 +10,14 @@ import logging
 import pdb
 import time
 import collections
+import json
+import socket
 
 import pexpect
 from six.moves import range
 
+from .context import edgemanage
+
 # Offset ID for the canary edges on the web server
 CANARY_ID_OFFSET = 100
 DNET_NAME = 'mynet'
@@ -121,14 +125,18 @@ class EdgeManageIntegration(unittest.TestCase):
         self.web_process = pexpect.spawn(' '.join(test_server_command), cwd="tests/")
         self.web_process.expect("Test server running", timeout=5)
 
-    def run_edge_manage(self, config_path, debug=False):
+    def run_edge_manage(self, config_path, debug=False, force=False, extra_args=None):
         """
         Run the edge_manage tool and wait for it to finish
         """
         edge_manage_command = ['edge_manage', '-A', DNET_NAME,
                                '--config', config_path]
+        if force:
+            edge_manage_command.append('--force')
         if debug:
             edge_manage_command.append('--verbose')
+        if extra_args:
+            edge_manage_command.extend(extra_args)
 
         # Run and wait for command to finish
         start_time = time.time()
@@ -186,6 +194,95 @@ class EdgeManageIntegration(unittest.TestCase):
         self.assertTrue(all([edge['health'] == "fail" for edge in health_data.values()]))
         self.assertLess(self.running_time, 10)
 
+    def test20Edges20CanariesTCPPrecheck(self):
+        """
+        Run edge_manage with the TCP pre-check enabled against fast edges and
+        canaries. All edges accept the connection and should be healthy.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(options={'tcp_precheck': True},
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        health_data = self.load_all_health_files()
+        self.assertEqual(len(health_data), 40)
+        self.assertTrue(all([edge['health'] == "pass_threshold"
+                             for edge in health_data.values()]))
+
+    def test20Edges20CanariesSamples(self):
+        """
+        Run edge_manage taking several samples of each edge and keeping them.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        custom_options = {'samples': 3, 'sample_spacing': 0.1, 'keep_samples': True}
+        config_path = self.rewrite_default_config(options=custom_options,
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        for health_file_path in glob.glob('%s/health/*.edgestore' % self.edge_data_dir):
+            with open(health_file_path, 'r') as health_file:
+                edge_data = yaml.load(health_file.read(), Loader=yaml.SafeLoader)
+            self.assertEqual(edge_data['health'], "pass_threshold")
+            self.assertEqual([len(samples) for samples in edge_data['raw_samples'].values()],
+                             [3])
+
+    def test20Edges20CanariesProbeProcesses(self):
+        """
+        Run edge_manage with edge tests sharded over several processes against
+        fast edges and canaries. All should be healthy.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(options={'probe_processes': 3},
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        health_data = self.load_all_health_files()
+        self.assertEqual(len(health_data), 40)
+        self.assertTrue(all([edge['health'] == "pass_threshold"
+                             for edge in health_data.values()]))
+
+    def test20Edges20CanariesCycleDeadline(self):
+        """
+        Run edge_manage against slow edges and canaries with a cycle deadline
+        shorter than the response time. Tests still outstanding at the deadline
+        should be cancelled and the edges failed without waiting for the
+        request timeout.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-3-seconds.yaml')
+        custom_options = {'timeout': 5, 'canary_killer': False, 'cycle_deadline': 1}
+        config_path = self.rewrite_default_config(options=custom_options,
+                                                  num_edges=20, num_canaries=20)
+
+        self.run_edge_manage(config_path)
+        state_data = self.load_state_file()
+        self.assertEqual(len(state_data['last_live']), 0)
+
+        health_data = self.load_all_health_files()
+        self.assertEqual(len(health_data), 40)
+        self.assertTrue(all([edge['health'] == "fail" for edge in health_data.values()]))
+        self.assertLess(self.running_time, 3)
+
+    def test20Edges20CanariesSlowBody(self):
+        """
+        Run edge_manage against edges that send their headers straight away
+        but trickle the body for longer than the cycle deadline. The run
+        should finish at the deadline instead of waiting for the bodies, and
+        the trickling edges be failed.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-slow-body.yaml')
+        custom_options = {'timeout': 5, 'canary_killer': False, 'cycle_deadline': 2}
+        config_path = self.rewrite_default_config(options=custom_options,
+                                                  num_edges=20, num_canaries=20)
+
+        self.run_edge_manage(config_path)
+        self.assertLess(self.running_time, 5)
+
+        state_data = self.load_state_file()
+        self.assertEqual(len(state_data['last_live']), 4)
+        health_data = self.load_all_health_files()
+        for edge in range(11, 21):
+            self.assertEqual(health_data['127.0.0.%d' % edge]['health'], "fail")
+
     def test20Edges20CanariesCanaryKiller(self):
         """
         Run edge_manage against some fast and slow edges and canaries.
@@ -238,6 +335,303 @@ class EdgeManageIntegration(unittest.TestCase):
         self.assertTrue(health_count["pass"], 8)
         self.assertTrue(health_count["fail"], 8)
 
+    def test10Edges10CanariesAdaptiveGoodEnough(self):
+        """
+        Run edge_manage against staggered edges with the goodenough threshold
+        taken from the median fetch time. Edges slower than the static
+        threshold but faster than the median should pass it.
+        """
+        self.spawn_web_server('test_server_configs/10-edge-10-canaries-staggered.yaml')
+        custom_options = {'timeout': 5,
+                          'adaptive_goodenough': {'percentile': 50, 'floor': 0.1,
+                                                  'ceiling': 10}}
+        config_path = self.rewrite_default_config(options=custom_options,
+                                                  num_edges=10, num_canaries=10)
+        self.run_edge_manage(config_path)
+
+        health_data = self.load_all_health_files()
+        self.assertEqual(health_data['127.0.0.3']['health'], "pass_threshold")
+        self.assertNotEqual(health_data['127.0.0.6']['health'], "pass_threshold")
+
+    def test10Edges10CanariesAdaptiveGoodEnoughFastPath(self):
+        """
+        Run edge_manage twice against staggered edges with both the fast
+        path and an adaptive goodenough threshold. The threshold of the
+        second run should still be taken over the whole fleet, so that the
+        previously live edges pass it and the fast path is taken.
+        """
+        self.spawn_web_server('test_server_configs/10-edge-10-canaries-staggered.yaml')
+        custom_options = {'timeout': 5, 'fast_path': True,
+                          'adaptive_goodenough': {'percentile': 75, 'floor': 0.05,
+                                                  'ceiling': 10}}
+        config_path = self.rewrite_default_config(options=custom_options,
+                                                  num_edges=10, num_canaries=10)
+        self.run_edge_manage(config_path)
+        first_live = self.load_state_file()['last_live']
+        self.assertEqual(sorted(first_live),
+                         ['127.0.0.1', '127.0.0.2', '127.0.0.3', '127.0.0.4'])
+
+        self.run_edge_manage(config_path, force=True)
+        self.assertEqual(self.load_state_file()['last_live'], first_live)
+        with open('%s/edgemanage.log' % self.edge_data_dir) as log_file:
+            self.assertIn("committing before the remaining", log_file.read())
+
+    def test20Edges20CanariesCapacityTarget(self):
+        """
+        Run edge_manage with a capacity target against fast edges and
+        canaries. The large edge should be picked first and enough edges
+        added to meet both the edge count and the capacity target.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(options={'capacity_target': 7},
+                                                  num_edges=20, num_canaries=20)
+        with open('%s/health/127.0.0.20.edgestore' % self.edge_data_dir, 'w') as edge_file:
+            json.dump({'capacity': 3}, edge_file)
+
+        self.run_edge_manage(config_path)
+        state_data = self.load_state_file()
+        self.assertEqual(len(state_data['last_live']), 5)
+        self.assertIn('127.0.0.20', state_data['last_live'])
+
+    def test20Edges20CanariesCapacityShortfall(self):
+        """
+        Run edge_manage with a capacity target the fleet can't meet. The
+        target is best effort, so every edge should be put in rotation
+        and the zone files written anyway.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        template_dir = os.path.join(self.edge_data_dir, 'templates')
+        os.makedirs(os.path.join(template_dir, DNET_NAME))
+        shutil.copy('tests/test_data/test.com.zone', os.path.join(template_dir, DNET_NAME))
+        named_dir = os.path.join(self.edge_data_dir, 'named')
+        os.mkdir(named_dir)
+        config_path = self.rewrite_default_config(options={'capacity_target': 100,
+                                                           'zonetemplate_dir': template_dir,
+                                                           'named_dir': named_dir},
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        state_data = self.load_state_file()
+        self.assertEqual(len(state_data['last_live']), 20)
+        with open(os.path.join(named_dir, 'test.com.zone')) as zone_file:
+            self.assertIn('127.0.0.20', zone_file.read())
+        with open('%s/edgemanage.log' % self.edge_data_dir) as log_file:
+            self.assertIn("Capacity target of 100 not met", log_file.read())
+
+    def test20Edges20CanariesMetricsFile(self):
+        """
+        Run edge_manage writing metrics for the textfile collector. They
+        should go to a file of the dnet, and the edgemanage.prom shared by
+        every dnet in older versions be removed.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(options={'prometheus_logs': self.edge_data_dir},
+                                                  num_edges=20, num_canaries=20)
+        legacy_path = os.path.join(self.edge_data_dir, 'edgemanage.prom')
+        with open(legacy_path, 'w') as legacy_file:
+            legacy_file.write('edgemanage_live_capacity 4.0\n')
+
+        self.run_edge_manage(config_path)
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertTrue(os.path.exists(os.path.join(self.edge_data_dir,
+                                                    'edgemanage_%s.prom' % DNET_NAME)))
+
+    def test20Edges20CanariesMetricsListenInUse(self):
+        """
+        Start edge_manage as a daemon with a metrics address that is in use.
+        It should fail straight away rather than once daemonised.
+        """
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        self.addCleanup(listener.close)
+        config_path = self.rewrite_default_config(
+            options={'metrics_listen': '127.0.0.1:%d' % listener.getsockname()[1],
+                     'run_frequency': 60},
+            num_edges=20, num_canaries=20)
+
+        em_process = pexpect.spawn(' '.join(['edge_manage', '-A', DNET_NAME, '--config',
+                                             config_path, '--daemonise', '--verbose']),
+                                   timeout=20)
+        em_process.expect(pexpect.EOF)
+        em_process.close()
+        self.assertNotEqual(em_process.exitstatus, 0)
+        self.assertIn(b"Can't serve metrics on", em_process.before)
+
+    def test20Edges20CanariesProfile(self):
+        """
+        Run edge_manage with profiling. The profile and memory snapshots
+        should be written and the phases of the run logged.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        profile_dir = os.path.join(self.edge_data_dir, 'profile')
+        config_path = self.rewrite_default_config(options={'profile_dir': profile_dir},
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path, extra_args=['--profile-memory'])
+
+        profile_files = os.listdir(profile_dir)
+        self.assertEqual(len([name for name in profile_files if name.endswith('.pstats')]), 1)
+        self.assertEqual(len([name for name in profile_files
+                              if name.endswith('.tracemalloc')]), 2)
+        with open('%s/edgemanage.log' % self.edge_data_dir) as log_file:
+            log = log_file.read()
+        self.assertIn("run took", log)
+        self.assertIn("probe", log)
+
+    def test20Edges20CanariesSnapshot(self):
+        """
+        Run edge_manage against fast edges and canaries. A snapshot of every
+        edge should be written, and edge_query should answer from it alone.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        with open('%s/%s.snapshot' % (self.edge_data_dir, DNET_NAME)) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        self.assertEqual(len(snapshot['edges']), 40)
+        self.assertEqual(snapshot['live_edges'], self.load_state_file()['last_live'])
+
+        shutil.rmtree('%s/health' % self.edge_data_dir)
+        eq_process = pexpect.spawn(' '.join(['edge_query', '-A', DNET_NAME, '--config',
+                                             config_path, '--format', 'json', '-v']), timeout=30)
+        eq_process.expect(pexpect.EOF)
+        eq_process.close()
+        self.assertEqual(eq_process.exitstatus, 0)
+        edges = [json.loads(line) for line in eq_process.before.decode().splitlines()]
+        self.assertEqual(len(edges), 20)
+        self.assertTrue(all([edge['health'] == "pass_threshold" for edge in edges]))
+
+    def test20Edges20CanariesWatch(self):
+        """
+        Run edge_manage, then watch the edges with edge_query while one is
+        set unavailable with edge_conf. The change of mode should be printed.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        eq_process = pexpect.spawn(' '.join(['edge_query', '-A', DNET_NAME, '--config',
+                                             config_path, '--quiet', '--watch']), timeout=10)
+        eq_process.expect('127.0.0.20')
+        ec_process = pexpect.spawn(' '.join(['edge_conf', '-A', DNET_NAME, '--config',
+                                             config_path, '--no-syslog', '--mode', 'unavailable',
+                                             '--comment', 'testing', '127.0.0.5']), timeout=10)
+        ec_process.expect(pexpect.EOF)
+        ec_process.close()
+        self.assertEqual(ec_process.exitstatus, 0)
+
+        eq_process.expect(r'\{.*\}')
+        change = json.loads(eq_process.after.decode())
+        eq_process.terminate(force=True)
+        self.assertEqual(change['edge'], '127.0.0.5')
+        self.assertEqual((change['field'], change['from'], change['to']),
+                         ('mode', 'available', 'unavailable'))
+
+    def test20Edges20CanariesWatchStaleSnapshot(self):
+        """
+        Watch the edges with edge_query while the snapshot is too old to be
+        used. The edge stores should be watched instead, and the change of
+        mode made by edge_conf printed all the same.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(options={'snapshot_max_age': 0},
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        eq_process = pexpect.spawn(' '.join(['edge_query', '-A', DNET_NAME, '--config',
+                                             config_path, '--quiet', '--watch']), timeout=10)
+        eq_process.expect('127.0.0.20')
+        ec_process = pexpect.spawn(' '.join(['edge_conf', '-A', DNET_NAME, '--config',
+                                             config_path, '--no-syslog', '--mode', 'unavailable',
+                                             '--comment', 'testing', '127.0.0.5']), timeout=10)
+        ec_process.expect(pexpect.EOF)
+        ec_process.close()
+        self.assertEqual(ec_process.exitstatus, 0)
+
+        eq_process.expect(r'\{.*\}')
+        change = json.loads(eq_process.after.decode())
+        eq_process.terminate(force=True)
+        self.assertEqual(change['edge'], '127.0.0.5')
+        self.assertEqual((change['field'], change['from'], change['to']),
+                         ('mode', 'available', 'unavailable'))
+
+    def test20Edges20CanariesWatchSnapshotGoesStale(self):
+        """
+        Watch the edges with edge_query while the snapshot goes stale, as
+        it does when edge_manage stops. A change written to an edge store
+        alone should be printed once it has.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(options={'snapshot_max_age': 3},
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+
+        eq_process = pexpect.spawn(' '.join(['edge_query', '-A', DNET_NAME, '--config',
+                                             config_path, '--quiet', '--watch']), timeout=10)
+        eq_process.expect('127.0.0.20')
+        time.sleep(3 + edgemanage.const.WATCH_POLL_INTERVAL * 2)
+        edge_state = edgemanage.EdgeState('127.0.0.5', os.path.join(self.edge_data_dir, 'health'))
+        edge_state.set_mode('unavailable')
+
+        eq_process.expect(r'\{.*\}')
+        change = json.loads(eq_process.after.decode())
+        eq_process.terminate(force=True)
+        self.assertEqual(change['edge'], '127.0.0.5')
+        self.assertEqual((change['field'], change['from'], change['to']),
+                         ('mode', 'available', 'unavailable'))
+
+    def test20Edges20CanariesFastPath(self):
+        """
+        Run edge_manage twice against fast edges and canaries. The second run
+        should commit the still healthy edges from the first run before the
+        remaining edge tests complete.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        config_path = self.rewrite_default_config(options={'fast_path': True},
+                                                  num_edges=20, num_canaries=20)
+
+        self.run_edge_manage(config_path)
+        first_live = self.load_state_file()['last_live']
+
+        self.run_edge_manage(config_path, force=True)
+        state_data = self.load_state_file()
+        self.assertEqual(state_data['last_live'], first_live)
+        self.assertEqual(len(state_data['rotation_list']), 1)
+
+        with open('%s/edgemanage.log' % self.edge_data_dir) as log_file:
+            self.assertIn("committing before the remaining", log_file.read())
+
+        # Edges tested after the fast path commit still get a health stored
+        health_data = self.load_all_health_files()
+        self.assertEqual(len(health_data), 40)
+        self.assertTrue(all([edge['health'] == "pass_threshold"
+                             for edge in health_data.values()]))
+
+    def test20Edges20CanariesFastPathOverhead(self):
+        """
+        Run edge_manage twice with the fast path, loopback tests and an
+        overhead_limit so low that any overhead is over it. The fast path
+        commit should be judged overloaded from the loopback tests made
+        among the priority edges.
+        """
+        self.spawn_web_server('test_server_configs/20-edge-20-canaries-all-fast.yaml')
+        custom_options = {'fast_path': True, 'loopback_probes': 3,
+                          'overhead_limit': 0.000001,
+                          'prometheus_logs': self.edge_data_dir}
+        config_path = self.rewrite_default_config(options=custom_options,
+                                                  num_edges=20, num_canaries=20)
+        self.run_edge_manage(config_path)
+        self.run_edge_manage(config_path, force=True)
+
+        with open('%s/edgemanage.log' % self.edge_data_dir) as log_file:
+            log = log_file.read()
+        self.assertIn("committing before the remaining", log)
+        self.assertNotIn("Loopback test failed", log)
+        with open('%s/edgemanage_%s.prom' % (self.edge_data_dir, DNET_NAME)) as prom_file:
+            metrics = prom_file.read()
+        self.assertIn('edgemanage_overloaded{dnet="%s"} 1.0' % DNET_NAME, metrics)
+
     def tearDown(self):
         # Stop the Flask server
         try:
@@ -56,6 +56,30 @@ class EdgeStateTest(EdgeStateTemplate):
 
         self.assertEqual(len(a), TEST_FETCH_HISTORY)
 
+    def testRawSamplesRotation(self):
+        a = self._make_store()
+
+        for i in range(TEST_FETCH_HISTORY + 1):
+            a.add_value(2, timestamp=1645210801 + i, samples=[1, 2, 3])
+
+        self.assertEqual(sorted(a.raw_samples.keys()), sorted(a.fetch_times.keys()))
+        b = self._reopen_store(a.edgename)
+        self.assertEqual(b.raw_samples[str(1645210801 + TEST_FETCH_HISTORY)], [1, 2, 3])
+
+    def testEWMAAndFailureRate(self):
+        a = self._make_store()
+        a.add_value(1, timestamp=1645210801)
+        a.add_value(2, timestamp=1645210802)
+        a.add_value(edgemanage.const.FETCH_TIMEOUT, timestamp=1645210803)
+
+        # Failed fetches don't move the weighted fetch time
+        self.assertAlmostEqual(a.ewma_fetch_time,
+                               1 + edgemanage.edgestate.EWMA_ALPHA)
+        self.assertAlmostEqual(a.failure_rate(), 1.0 / 3)
+
+        b = self._reopen_store(a.edgename)
+        self.assertEqual(b.outcomes, [0, 0, 1])
+
     def testHistoricalAverageRotation(self):
         a = self._make_store()
 
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import socket
+import unittest
+
+from .context import edgemanage
+
+
+class AggregateSamplesTest(unittest.TestCase):
+
+    def test_median(self):
+        self.assertEqual(edgemanage.edgetest.aggregate_samples([0.1, 5.0, 0.3]), 0.3)
+        self.assertEqual(edgemanage.edgetest.aggregate_samples([0.1, 0.3, 0.2, 5.0]), 0.25)
+
+    def test_trimmed_mean(self):
+        samples = [0.2, 0.2, 0.2, 0.2, 4.0]
+        self.assertAlmostEqual(
+            edgemanage.edgetest.aggregate_samples(samples, "trimmed_mean"), 0.2)
+
+    def test_unknown_method(self):
+        self.assertRaises(ValueError, edgemanage.edgetest.aggregate_samples, [1], "mode")
+
+
+class TCPPrecheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_listening_edge_is_reachable(self):
+        reachable = edgemanage.edgetest.tcp_precheck(["127.0.0.1"], self.port, 1)
+        self.assertEqual(reachable, set(["127.0.0.1"]))
+
+    def test_refused_edge_is_unreachable(self):
+        self.listener.close()
+        reachable = edgemanage.edgetest.tcp_precheck(["127.0.0.1"], self.port, 1)
+        self.assertEqual(reachable, set())
+
+    def test_batches(self):
+        edgemanage.const.TCP_PRECHECK_BATCH = 1
+        try:
+            reachable = edgemanage.edgetest.tcp_precheck(["127.0.0.1", "127.0.0.2"],
+                                                         self.port, 1)
+        finally:
+            edgemanage.const.TCP_PRECHECK_BATCH = 512
+        self.assertEqual(reachable, set(["127.0.0.1"]))
+
+    def test_hostnames_are_resolved(self):
+        edgemanage.const.TCP_PRECHECK_BATCH = 1
+        try:
+            reachable = edgemanage.edgetest.tcp_precheck(["localhost", "127.0.0.2",
+                                                          "127.0.0.1"], self.port, 1)
+        finally:
+            edgemanage.const.TCP_PRECHECK_BATCH = 512
+        self.assertEqual(reachable, set(["localhost", "127.0.0.1"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+
+from .context import edgemanage
+
+
+class FileWatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.write("edge1.edgestore")
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def write(self, filename, atomic=False):
+        path = os.path.join(self.store_dir, filename)
+        if atomic:
+            with edgemanage.util.open_atomic(path, mode="w") as store_f:
+                store_f.write("{}")
+        else:
+            with open(path, "w") as store_f:
+                store_f.write("{}")
+            # Coarse modification times would hide a rewrite from polling
+            os.utime(path, (0, os.stat(path).st_mtime + 1))
+
+    def check_watcher(self, watcher):
+        try:
+            self.assertEqual(watcher.wait(0), set())
+            self.write("edge1.edgestore", atomic=True)
+            self.write("edge2.edgestore")
+            self.write("notes.txt")
+            self.assertEqual(watcher.wait(1), set(["edge1.edgestore", "edge2.edgestore"]))
+            self.assertEqual(watcher.wait(0), set())
+        finally:
+            watcher.close()
+
+    def test_inotify_watcher(self):
+        self.check_watcher(edgemanage.filewatch.InotifyWatcher(self.store_dir, ".edgestore"))
+
+    def test_polling_watcher(self):
+        self.check_watcher(edgemanage.filewatch.PollingWatcher(self.store_dir, ".edgestore",
+                                                               interval=0.01))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from six.moves.urllib.request import urlopen
+
+from prometheus_client import CollectorRegistry
+
+from .context import edgemanage
+from edgemanage.monitor import Monitor, SingletonMetaclass, check_listen
+
+
+class MonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        # Start from a fresh monitor instead of the one shared by other tests
+        self.previous = SingletonMetaclass._instances.pop(Monitor, None)
+        self.registry = CollectorRegistry()
+        self.monitor = Monitor(registry=self.registry)
+        self.monitor.set_edges("mynet", ["127.0.0.1", "edge2.example.com"], ["127.0.0.101"])
+
+    def tearDown(self):
+        SingletonMetaclass._instances.pop(Monitor, None)
+        if self.previous is not None:
+            SingletonMetaclass._instances[Monitor] = self.previous
+
+    def sample(self, name, **labels):
+        return self.registry.get_sample_value(name, labels)
+
+    def test_labelled_edge_metrics(self):
+        self.monitor.set("127.0.0.1", "response_time", 0.25)
+        self.monitor.set("127.0.0.101", "reachable_status", 1)
+        # Unknown edges are ignored
+        self.monitor.set("127.0.0.2", "response_time", 1)
+
+        self.assertEqual(self.sample("edgemanage_edge_response_time", edge="127.0.0.1",
+                                     dnet="mynet", role="edge"), 0.25)
+        self.assertEqual(self.sample("edgemanage_edge_reachable_status", edge="127.0.0.101",
+                                     dnet="mynet", role="canary"), 1)
+        self.assertIsNone(self.sample("edgemanage_edge_response_time", edge="127.0.0.2",
+                                      dnet="mynet", role="edge"))
+
+    def test_set_edges_removes_stale_edges(self):
+        self.monitor.set_edges("mynet", ["127.0.0.1"])
+        self.assertIsNone(self.monitor.edge_handles("edge2.example.com"))
+        self.assertIsNone(self.sample("edgemanage_edge_in_rotation", edge="edge2.example.com",
+                                      dnet="mynet", role="edge"))
+        self.assertEqual(self.sample("edgemanage_edge_in_rotation", edge="127.0.0.1",
+                                     dnet="mynet", role="edge"), 0)
+
+    def test_probe_latency_histogram(self):
+        self.monitor.observe_probe("127.0.0.1", 0.3)
+        self.monitor.observe_probe("127.0.0.1", edgemanage.const.FETCH_TIMEOUT)
+        self.assertEqual(self.sample("edgemanage_probe_latency_seconds_bucket",
+                                     dnet="mynet", role="edge", le="0.5"), 1)
+        self.assertEqual(self.sample("edgemanage_probe_latency_seconds_count",
+                                     dnet="mynet", role="edge"), 2)
+
+    def test_global(self):
+        self.monitor.set_global("live_capacity", 6)
+        self.assertEqual(self.sample("edgemanage_live_capacity", dnet="mynet"), 6)
+        documentation = dict((metric.name, metric.documentation)
+                             for metric in self.registry.collect())
+        self.assertEqual(documentation["edgemanage_live_capacity"],
+                         Monitor.global_gauges["live_capacity"])
+        self.assertRaises(KeyError, self.monitor.set_global, "unknown", 1)
+
+    def test_http_server(self):
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        self.monitor.set("127.0.0.1", "response_time", 0.25)
+        self.monitor.start_http_server("127.0.0.1:%d" % port)
+        body = urlopen("http://127.0.0.1:%d/metrics" % port).read().decode("utf-8")
+        self.assertIn('edgemanage_edge_response_time{dnet="mynet",edge="127.0.0.1",role="edge"} '
+                      '0.25', body)
+        self.assertIn("process_cpu_seconds_total", body)
+
+    def test_check_listen(self):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        try:
+            self.assertRaises(OSError, check_listen, "127.0.0.1:%d" % port)
+        finally:
+            listener.close()
+        check_listen("127.0.0.1:%d" % port)
+
+    def test_write_metrics(self):
+        metrics_dir = tempfile.mkdtemp()
+        try:
+            metric_path = os.path.join(metrics_dir, "edgemanage_mynet.prom")
+            self.monitor.write_metrics(metric_path)
+            self.assertEqual(os.listdir(metrics_dir), ["edgemanage_mynet.prom"])
+            with open(metric_path) as metric_file:
+                self.assertIn("edgemanage_edge_in_rotation", metric_file.read())
+        finally:
+            shutil.rmtree(metrics_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import hashlib
+import time
+import unittest
+
+from .context import edgemanage
+
+TEST_OBJECT = b"edgemanage test object\n"
+
+
+class LoopbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = edgemanage.overhead.LoopbackServer(TEST_OBJECT, "/test_object")
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_loopback_probe(self):
+        edge_test = edgemanage.EdgeTest("127.0.0.1", hashlib.md5(TEST_OBJECT).hexdigest())
+        result = edgemanage.edgemanage.future_fetch(
+            edge_test, "127.0.0.1", "/test_object", "http", self.server.port, False,
+            submitted=time.monotonic() - 1)
+
+        fetch_result = result["127.0.0.1"]
+        self.assertIsNone(fetch_result.status)
+        self.assertLess(fetch_result.value, 1)
+        self.assertGreaterEqual(fetch_result.queue_delay, 1)
+
+
+class ProbeOverheadTest(unittest.TestCase):
+
+    def test_self_overhead(self):
+        overhead = edgemanage.overhead.ProbeOverhead()
+        time.sleep(edgemanage.const.LAG_INTERVAL * 3)
+        overhead.stop()
+        self.assertFalse(overhead.lag_monitor.is_alive())
+
+        overhead.add_queue_delay(None)
+        overhead.add_queue_delay(0.5)
+        overhead.add_loopback(0.01)
+        self.assertEqual(overhead.queue_delays, [0.5])
+        self.assertEqual(overhead.self_overhead(),
+                         max(overhead.lag_monitor.max_lag, 0.01))
+
+        overhead.add_loopback(2)
+        self.assertEqual(overhead.self_overhead(), 2)
+        overhead.export()
+
+
+if __name__ == "__main__":
+    unittest.main()
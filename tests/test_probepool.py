@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import os
+import signal
+import time
+import unittest
+
+from .context import edgemanage
+from edgemanage.probepool import ShardedProbeExecutor, shared_executor
+
+
+def quick_fetch(edgename):
+    return {edgename: edgemanage.edgetest.FetchResult(0.1, None, None)}
+
+
+def slow_fetch(edgename):
+    time.sleep(30)
+    return quick_fetch(edgename)
+
+
+class ShardedProbeExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ShardedProbeExecutor(2, 2)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=False)
+
+    def test_results(self):
+        futures = [self.executor.submit(quick_fetch, "edge%d" % number) for number in range(4)]
+        results = [future.result(timeout=30) for future in futures]
+        self.assertEqual([list(result) for result in results],
+                         [["edge0"], ["edge1"], ["edge2"], ["edge3"]])
+        self.assertEqual(results[0]["edge0"].value, 0.1)
+        # Not forked from this process and its threads
+        self.assertNotEqual(self.executor.context.get_start_method(), "fork")
+
+    def test_dead_process(self):
+        future = self.executor.submit(slow_fetch, "edge0")
+        process = self.executor.processes[0]
+        # Let the process pick up the test before it dies
+        time.sleep(1)
+        os.kill(process.pid, signal.SIGKILL)
+        self.assertRaises(RuntimeError, future.result, timeout=10)
+
+        # The process is replaced and runs new tests
+        self.assertIsNot(self.executor.processes[0], process)
+        futures = [self.executor.submit(quick_fetch, "edge%d" % number) for number in [1, 2]]
+        self.assertEqual([list(future.result(timeout=30)) for future in futures],
+                         [["edge1"], ["edge2"]])
+
+
+class SharedExecutorTest(unittest.TestCase):
+
+    def test_kept_across_runs(self):
+        executor = shared_executor(2, 4)
+        try:
+            self.assertIs(shared_executor(2, 4), executor)
+            resized = shared_executor(2, 8)
+            self.assertIsNot(resized, executor)
+            self.assertTrue(executor.stopping)
+        finally:
+            shared_executor(2, 8).shutdown(wait=False)
+            edgemanage.probepool._shared_pool = None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from .context import edgemanage
+
+
+class CycleTimerTest(unittest.TestCase):
+
+    def test_phases(self):
+        timer = edgemanage.profiling.CycleTimer()
+        with timer.phase("outer"):
+            timer.start("first")
+            time.sleep(0.05)
+            timer.switch("second")
+            timer.stop()
+            time.sleep(0.01)
+        with timer.phase("first"):
+            pass
+
+        self.assertEqual(list(timer.durations), ["first", "second", "outer"])
+        self.assertGreaterEqual(timer.durations["first"], 0.05)
+        # The outer phase leaves out the phases inside it
+        self.assertGreaterEqual(timer.durations["outer"], 0.01)
+        self.assertLess(timer.durations["outer"], 0.05)
+        self.assertLessEqual(sum(timer.durations.values()), timer.total())
+        self.assertEqual(timer.running, [])
+        self.assertTrue(timer.summary().startswith("run took "))
+
+    def test_profile_call(self):
+        profile_dir = tempfile.mkdtemp()
+        try:
+            result = edgemanage.profiling.profile_call(
+                os.path.join(profile_dir, "new"), "run", True, sorted, [3, 1, 2])
+            self.assertEqual(result, [1, 2, 3])
+            self.assertEqual(sorted(os.listdir(os.path.join(profile_dir, "new"))),
+                             ["run-after.tracemalloc", "run-before.tracemalloc",
+                              "run.pstats"])
+        finally:
+            shutil.rmtree(profile_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from .context import edgemanage
+
+
+class QueryServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.store_dir, "mynet.sock")
+        # test_edgestate shortens the fetch history for its own tests
+        self.fetch_history = edgemanage.edgestate.FETCH_HISTORY
+        edgemanage.edgestate.FETCH_HISTORY = edgemanage.const.FETCH_HISTORY
+        self.server = edgemanage.QueryServer(self.socket_path)
+
+    def tearDown(self):
+        self.server.shutdown()
+        edgemanage.edgestate.FETCH_HISTORY = self.fetch_history
+        shutil.rmtree(self.store_dir)
+
+    def query(self, url):
+        return edgemanage.queryapi.query(self.socket_path, url)
+
+    def update(self):
+        now = time.time()
+        edge_states = {}
+        edges = {}
+        for edgename, role, health, in_rotation in [("edge1", "edge", "pass_threshold", True),
+                                                    ("edge2", "edge", "fail", False),
+                                                    ("edge3", "edge", "pass", False),
+                                                    ("canary1", "canary", "pass", False)]:
+            edge_state = edgemanage.EdgeState(edgename, self.store_dir)
+            for age in [300, 200, 100]:
+                edge_state.add_value(age / 1000.0, timestamp=now - age)
+            edge_state.set_health(health)
+            edge_state.set_state("in" if in_rotation else "out")
+            edge_states[edgename] = edge_state
+            edges[edgename] = edgemanage.snapshot.edge_summary(edge_state, role, in_rotation,
+                                                               now)
+        snapshot = {"dnet": "mynet", "generated": now, "good_enough": 0.7,
+                    "live_edges": ["edge1"], "live_capacity": 1.0, "last_rotation": now - 60,
+                    "edges": edges}
+        self.server.update(snapshot, edge_states)
+        return now
+
+    def test_before_first_run(self):
+        status, response = self.query("/edges")
+        self.assertEqual(status, 503)
+        self.assertIn("error", response)
+
+    def test_edges(self):
+        self.update()
+        status, response = self.query("/edges")
+        self.assertEqual(status, 200)
+        self.assertEqual([edge["edge"] for edge in response["edges"]],
+                         ["edge1", "edge2", "edge3", "canary1"])
+        self.assertNotIn("recent", response["edges"][0])
+
+        _, response = self.query("/edges?health=allpass&role=edge")
+        self.assertEqual([edge["edge"] for edge in response["edges"]], ["edge1", "edge3"])
+        _, response = self.query("/edges?state=in")
+        self.assertEqual([edge["edge"] for edge in response["edges"]], ["edge1"])
+
+        status, _ = self.query("/edges?health=great")
+        self.assertEqual(status, 400)
+        status, _ = self.query("/edges?colour=blue")
+        self.assertEqual(status, 400)
+
+    def test_edge_history(self):
+        now = self.update()
+        status, response = self.query("/edges/edge2?since=%f" % (now - 250))
+        self.assertEqual(status, 200)
+        self.assertEqual(response["health"], "fail")
+        self.assertEqual([fetch_time for _, fetch_time in response["history"]], [0.2, 0.1])
+
+        _, response = self.query("/edges/edge2?until=%f" % (now - 250))
+        self.assertEqual([fetch_time for _, fetch_time in response["history"]], [0.3])
+        status, _ = self.query("/edges/edge9")
+        self.assertEqual(status, 404)
+        status, _ = self.query("/edges/edge2?since=yesterday")
+        self.assertEqual(status, 400)
+
+    def test_live(self):
+        self.update()
+        status, response = self.query("/live")
+        self.assertEqual(status, 200)
+        self.assertEqual(response["live_edges"], ["edge1"])
+        self.assertEqual(response["good_enough"], 0.7)
+
+
+if __name__ == "__main__":
+    unittest.main()
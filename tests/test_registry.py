@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import shutil
+import tempfile
+import unittest
+
+from .context import edgemanage
+
+
+class EdgeRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.registry = edgemanage.EdgeRegistry()
+        self.edge_states = {}
+        for edgename in ["edge1", "edge2", "edge3"]:
+            self.edge_states[edgename] = edgemanage.EdgeState(edgename, self.store_dir)
+            self.registry.add_edge_state(self.edge_states[edgename])
+        self.edge_states["canary1"] = edgemanage.EdgeState("canary1", self.store_dir)
+        self.registry.add_edge_state(self.edge_states["canary1"], role="canary")
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_roles(self):
+        self.assertTrue(self.registry.is_canary("canary1"))
+        self.assertFalse(self.registry.is_canary("edge1"))
+        self.assertEqual(self.registry.canaries(), set(["canary1"]))
+        self.assertEqual(self.registry.find(role="edge"), set(["edge1", "edge2", "edge3"]))
+
+    def test_follows_edge_states(self):
+        self.edge_states["edge1"].set_mode("force")
+        self.edge_states["edge2"].set_health("fail")
+        self.edge_states["edge2"].set_state("in")
+        self.edge_states["edge3"].set_state("in")
+
+        self.assertEqual(self.registry.find(mode="force"), set(["edge1"]))
+        self.assertEqual(self.registry.count("mode", "available"), 3)
+        self.assertEqual(self.registry.find(state="in"), set(["edge2", "edge3"]))
+        self.assertEqual(self.registry.find(state="in", health="pass"), set(["edge3"]))
+        self.assertEqual(self.registry.get("edge2", "health"), "fail")
+
+    def test_remove(self):
+        self.registry.remove("edge1")
+        self.assertNotIn("edge1", self.registry)
+        self.assertEqual(len(self.registry), 3)
+        self.assertEqual(self.registry.count("role", "edge"), 2)
+
+    def test_shared(self):
+        # The edge list and decision maker index edges in the same registry
+        decision = edgemanage.DecisionMaker(self.registry)
+        edgelist = edgemanage.EdgeList(self.registry)
+        for edgename in ["edge1", "edge2", "edge3"]:
+            self.edge_states[edgename].add_value(0.1)
+            decision.add_edge_state(self.edge_states[edgename])
+        self.edge_states["edge2"].add_value(edgemanage.const.FETCH_TIMEOUT)
+        decision.check_threshold(1.0)
+        edgelist.add_edge("edge1", state="pass_threshold", live=True)
+        edgelist.add_edge("edge3", state="pass_threshold")
+
+        self.assertEqual(self.registry.find(judgement="fail"), set(["edge2"]))
+        self.assertEqual(self.registry.find(role="edge", judgement="pass_threshold", live=True),
+                         set(["edge1"]))
+        self.assertEqual(edgelist.get_live_count(), 1)
+        self.assertEqual(edgelist.get_state_stats(), {"pass_threshold": 2})
+        # The edge list's states don't clash with the edge states'
+        self.assertEqual(self.registry.count("state", "out"), 4)
+
+    def test_unknown_value(self):
+        self.assertEqual(self.registry.find(mode="blindforce"), set())
+        self.assertEqual(self.registry.count("health", "degrading"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import unittest
+
+from .context import edgemanage
+
+NOW = 1645210800
+PERIOD = 600
+
+
+class RotationLimiterTest(unittest.TestCase):
+
+    def test_no_history(self):
+        limiter = edgemanage.rotationlimit.RotationLimiter([], 3, PERIOD)
+        self.assertTrue(limiter.allow(NOW))
+        self.assertEqual(limiter.available(NOW), 3)
+
+    def test_budget_exhausted(self):
+        rotations = [NOW - 30, NOW - 20, NOW - 10]
+        limiter = edgemanage.rotationlimit.RotationLimiter(rotations, 3, PERIOD)
+        self.assertFalse(limiter.allow(NOW))
+
+    def test_budget_refills(self):
+        rotations = [NOW - 30, NOW - 20, NOW - 10]
+        limiter = edgemanage.rotationlimit.RotationLimiter(rotations, 3, PERIOD)
+        # One rotation's worth of tokens comes back every PERIOD / 3 seconds
+        self.assertTrue(limiter.allow(NOW + PERIOD / 3))
+
+    def test_old_rotations_forgotten(self):
+        rotations = [NOW - PERIOD * 3 - i for i in range(10)]
+        limiter = edgemanage.rotationlimit.RotationLimiter(rotations, 3, PERIOD)
+        self.assertEqual(limiter.available(NOW), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import shutil
+import tempfile
+import unittest
+
+from .context import edgemanage
+
+
+class ScoringTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        # test_edgestate shortens the fetch history for its own tests
+        self.fetch_history = edgemanage.edgestate.FETCH_HISTORY
+        edgemanage.edgestate.FETCH_HISTORY = edgemanage.const.FETCH_HISTORY
+
+    def tearDown(self):
+        edgemanage.edgestate.FETCH_HISTORY = self.fetch_history
+        shutil.rmtree(self.store_dir)
+
+    def make_edge(self, edgename, values):
+        edge_state = edgemanage.EdgeState(edgename, self.store_dir, nowrite=True)
+        for i, value in enumerate(values):
+            edge_state.add_value(value, timestamp=1645210801 + i)
+        return edge_state
+
+    def test_composite_follows_recent_fetches(self):
+        # Fast for a long time but slow now
+        degrading = self.make_edge("degrading", [0.1] * 20 + [1.5] * 10)
+        steady = self.make_edge("steady", [0.6] * 30)
+
+        average = edgemanage.AverageScorer()
+        self.assertLess(average.score(degrading), average.score(steady))
+
+        composite = edgemanage.CompositeScorer()
+        self.assertGreater(composite.score(degrading), composite.score(steady))
+
+    def test_composite_penalises_failures(self):
+        flaky = self.make_edge("flaky", [0.2, edgemanage.const.FETCH_TIMEOUT] * 5)
+        slow = self.make_edge("slow", [0.8] * 10)
+
+        composite = edgemanage.CompositeScorer()
+        self.assertAlmostEqual(composite.score(flaky),
+                               0.2 + edgemanage.const.SCORE_FAILURE_PENALTY * 0.5)
+        self.assertGreater(composite.score(flaky), composite.score(slow))
+
+    def test_headroom_prefers_large_edges_with_room(self):
+        small_fast = self.make_edge("small_fast", [0.1])
+        large = self.make_edge("large", [0.4])
+        large.set_capacity(4)
+        over = self.make_edge("over", [0.9])
+        over.set_capacity(10)
+
+        headroom = edgemanage.HeadroomScorer(edgemanage.AverageScorer(), 0.7)
+        ranked = sorted([small_fast, large, over], key=headroom.score)
+        self.assertEqual([edge.edgename for edge in ranked], ["large", "small_fast", "over"])
+
+    def test_unknown_scorer(self):
+        self.assertRaises(ValueError, edgemanage.scoring.make_scorer, "fastest")
+
+
+if __name__ == "__main__":
+    unittest.main()
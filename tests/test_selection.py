@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import random
+import shutil
+import tempfile
+import unittest
+
+from .context import edgemanage
+
+
+class EdgeSelectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.decision = edgemanage.DecisionMaker()
+        healths = edgemanage.const.VALID_HEALTHS
+        randomiser = random.Random(4)
+        for index in range(200):
+            edge_state = edgemanage.EdgeState("edge%d" % index, self.store_dir, nowrite=True)
+            # Few distinct values so that there are plenty of ties
+            edge_state.add_value(randomiser.choice([0.1, 0.2, 0.3, 0.4]))
+            self.decision.add_edge_state(edge_state)
+            self.decision.current_judgement[edge_state.edgename] = randomiser.choice(healths)
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def sorted_selection(self, candidates, count):
+        """ Select by sorting every health in turn, as make_edges_live used to """
+        chosen = []
+        for health in edgemanage.const.SELECTION_HEALTHS:
+            in_health = [edge for edge in candidates
+                         if self.decision.get_judgement(edge) == health]
+            in_health.sort(key=lambda edge: self.decision.edge_states[edge].current_average())
+            chosen.extend((edge, health) for edge in in_health[:count - len(chosen)])
+        return chosen
+
+    def test_matches_sorted_selection(self):
+        selector = edgemanage.EdgeSelector(self.decision, edgemanage.AverageScorer())
+        candidates = list(self.decision.edge_states)
+        for count in [0, 1, 4, 30, 150, 500]:
+            self.assertEqual(selector.select(candidates, count),
+                             self.sorted_selection(candidates, count))
+
+    def test_ranked_matches_sorted_selection(self):
+        selector = edgemanage.EdgeSelector(self.decision, edgemanage.AverageScorer())
+        candidates = list(self.decision.edge_states)
+        self.assertEqual(list(selector.ranked(candidates)),
+                         self.sorted_selection(candidates, len(candidates)))
+
+    def test_never_selects_failing_edges(self):
+        selector = edgemanage.EdgeSelector(self.decision, edgemanage.AverageScorer())
+        selected = selector.select(list(self.decision.edge_states), 500)
+        self.assertNotIn("fail", [health for _, health in selected])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from .context import edgemanage
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NAGIOS_DIR = os.path.join(TOP_DIR, "nagios")
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.store_dir, "mynet.snapshot")
+        # test_edgestate shortens the fetch history for its own tests
+        self.fetch_history = edgemanage.edgestate.FETCH_HISTORY
+        edgemanage.edgestate.FETCH_HISTORY = edgemanage.const.FETCH_HISTORY
+
+    def tearDown(self):
+        edgemanage.edgestate.FETCH_HISTORY = self.fetch_history
+        shutil.rmtree(self.store_dir)
+
+    def make_snapshot(self, **fields):
+        snapshot = {
+            "version": edgemanage.snapshot.SNAPSHOT_VERSION,
+            "generated": time.time(),
+            "edges": {"edge1": {"mode": "available", "comment": "", "capacity": 1.0}},
+        }
+        snapshot.update(fields)
+        edgemanage.snapshot.write_snapshot(self.path, snapshot)
+        return snapshot
+
+    def test_snapshot_path(self):
+        config = {"statefile": "/var/lib/edgemanage/{dnet}.state"}
+        self.assertEqual(edgemanage.snapshot.snapshot_path(config, "mynet"),
+                         "/var/lib/edgemanage/mynet.snapshot")
+        config["snapshot"] = "/run/edgemanage/{dnet}.json"
+        self.assertEqual(edgemanage.snapshot.snapshot_path(config, "mynet"),
+                         "/run/edgemanage/mynet.json")
+
+    def test_edge_summary(self):
+        edge_state = edgemanage.EdgeState("edge1", self.store_dir)
+        now = time.time()
+        # One fetch outside of the window, one in it but outside of the
+        # decision window and three inside both
+        for age, fetch_time in [(2000, 9.0), (600, 1.0), (200, 0.1), (100, 0.2), (10, 0.3)]:
+            edge_state.add_value(fetch_time, timestamp=now - age)
+        edge_state.set_state("in")
+
+        summary = edgemanage.snapshot.edge_summary(edge_state, "edge", True, now)
+        self.assertEqual(summary["last_value"], 0.3)
+        self.assertAlmostEqual(summary["last_fetch"], now - 10)
+        self.assertAlmostEqual(summary["window_average"], 0.2)
+        self.assertAlmostEqual(summary["average"], 10.6 / 5)
+        self.assertEqual([fetch_time for _, fetch_time in summary["recent"]],
+                         [1.0, 0.1, 0.2, 0.3])
+        self.assertAlmostEqual(summary["p50"], 0.25)
+        self.assertTrue(summary["in_rotation"])
+        self.assertEqual(summary["state"], "in")
+
+        empty = edgemanage.snapshot.edge_summary(edgemanage.EdgeState("edge2", self.store_dir),
+                                                 "canary", False, now)
+        self.assertIsNone(empty["last_value"])
+        self.assertEqual(empty["recent"], [])
+
+    def test_load_snapshot(self):
+        self.assertIsNone(edgemanage.snapshot.load_snapshot(self.path))
+        snapshot = self.make_snapshot()
+        self.assertEqual(edgemanage.snapshot.load_snapshot(self.path), snapshot)
+
+        self.make_snapshot(generated=time.time() - 600)
+        self.assertIsNone(edgemanage.snapshot.load_snapshot(self.path, max_age=300))
+        self.make_snapshot(version=edgemanage.snapshot.SNAPSHOT_VERSION + 1)
+        self.assertIsNone(edgemanage.snapshot.load_snapshot(self.path))
+
+    def test_update_edge(self):
+        self.assertFalse(edgemanage.snapshot.update_edge(self.path, "edge1", mode="force"))
+        self.make_snapshot()
+        self.assertTrue(edgemanage.snapshot.update_edge(self.path, "edge1", mode="force",
+                                                        comment="[me] testing"))
+        self.assertFalse(edgemanage.snapshot.update_edge(self.path, "edge2", mode="force"))
+        self.assertRaises(ValueError, edgemanage.snapshot.update_edge, self.path, "edge1",
+                          health="pass")
+
+        with open(self.path) as snapshot_f:
+            edge = json.load(snapshot_f)["edges"]["edge1"]
+        self.assertEqual(edge["mode"], "force")
+        self.assertEqual(edge["comment"], "[me] testing")
+
+    def test_nagios_imports(self):
+        # The checks read the snapshot without the dependencies of edge_manage
+        script = ("import sys\n"
+                  "import check_edgemanage\n"
+                  "print(','.join(name for name in ['requests', 'jinja2', 'prometheus_client']\n"
+                  "               if name in sys.modules))\n")
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=NAGIOS_DIR)
+        self.assertEqual(output.strip(), b"")
+
+    def test_edge_query_imports(self):
+        # Nor does edge_query, which reads the snapshot too
+        script = ("import runpy, sys\n"
+                  "runpy.run_path('edgemanage/edge_query')\n"
+                  "print(','.join(name for name in ['requests', 'jinja2', 'prometheus_client',\n"
+                  "                                 'numpy']\n"
+                  "               if name in sys.modules))\n")
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=TOP_DIR)
+        self.assertEqual(output.strip(), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
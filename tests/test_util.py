@@ -37,6 +37,15 @@ class UtilTest(unittest.TestCase):
             self.assertEqual(returncode, 0,
                              msg="Could lock already locked temporary file")
 
+    def test_percentile(self):
+        values = [4, 1, 3, 2, 5]
+        self.assertEqual(edgemanage.util.percentile(values, 0), 1)
+        self.assertEqual(edgemanage.util.percentile(values, 50), 3)
+        self.assertEqual(edgemanage.util.percentile(values, 100), 5)
+        self.assertEqual(edgemanage.util.percentile(values, 25), 2)
+        self.assertEqual(edgemanage.util.percentile(values, 10), 1.4)
+        self.assertRaises(ValueError, edgemanage.util.percentile, [], 50)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -70,6 +70,18 @@ def serve_test_object():
     logger.info("Serving %s %d after a %d second delay", name, edge_id, delay)
 
     time.sleep(delay)
+    slow_body = edge.get('slow_body')
+    if slow_body:
+        # Trickle the object a byte at a time, each byte well within any
+        # read timeout
+        with open(app.config['TEST_OBJECT'], 'rb') as test_object:
+            content = test_object.read()
+
+        def trickle():
+            for offset in range(len(content)):
+                yield content[offset:offset + 1]
+                time.sleep(slow_body)
+        return Response(trickle(), headers={'Content-Length': str(len(content))})
     return send_file(app.config['TEST_OBJECT'])
 
 